@@ -0,0 +1,160 @@
+"""
+Latency under load of the tsserver clients in typescript/libs
+
+Starts 1, 4 and 8 servers with the threaded client (WorkerClient, one post
+thread and one reader thread per process) and with AsyncioCommClient (one
+event loop thread for all of them). Each server is kept busy with requests
+whose responses are 1MB, as find references or navto answer in a large
+project, while small requests are sent to the servers in turn; the time from
+sending a small request to its callback is reported, without and with the load.
+
+The servers run benchmarks/fake_tsserver.js, which answers at once, so the
+numbers are the time spent in the client: writing, reading, decoding and
+waiting for the thread that does it. The clients need the sublime module, so
+the benchmark runs in the Sublime Text console, with the plugin loaded:
+
+    exec(open("<path to the plugin>/benchmarks/async_client_benchmark.py").read())
+
+It runs on a thread of its own and prints the results to the console.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+
+SERVER_COUNTS = [1, 4, 8]
+# requests with a large response kept in flight on every server
+LOAD_IN_FLIGHT = 2
+LOAD_RESPONSE_BYTES = 1024 * 1024
+# small requests measured per case, and the pause between two of them
+PROBE_COUNT = 200
+PROBE_INTERVAL = 0.005
+
+
+def find_plugin_module(name):
+    # the package name depends on where the plugin is installed
+    for module_name, module in list(sys.modules.items()):
+        if module_name.endswith(".typescript.libs." + name):
+            return module
+    return None
+
+
+class Benchmark(object):
+    def __init__(self, node_client, async_client, global_vars):
+        self.node_client = node_client
+        self.async_client = async_client
+        self.script_path = os.path.join(global_vars.PLUGIN_DIR, "benchmarks", "fake_tsserver.js")
+        self.seq = 0
+        self.seq_lock = threading.Lock()
+
+    def next_seq(self):
+        with self.seq_lock:
+            self.seq += 1
+            return self.seq
+
+    def make_request(self, command, response_bytes):
+        seq = self.next_seq()
+        request = {"seq": seq, "type": "request", "command": command, "arguments": {"responseBytes": response_bytes}}
+        return json.dumps(request), seq
+
+    def start_clients(self, kind, count):
+        clients = []
+        for _ in range(count):
+            if kind == "asyncio":
+                client = self.async_client.AsyncioCommClient(self.script_path)
+            else:
+                client = self.node_client.WorkerClient(self.script_path)
+            client.start()
+            clients.append(client)
+        for client in clients:
+            cmd, seq = self.make_request("status", 128)
+            client.sendCmdSync(cmd, seq)
+        return clients
+
+    def load(self, client, running):
+        """Keep a request with a large response in flight until <running> is cleared"""
+        def on_response(response_dict):
+            if running.is_set():
+                self.load(client, running)
+        cmd, seq = self.make_request("references", LOAD_RESPONSE_BYTES)
+        client.sendCmdAsync(cmd, on_response, seq)
+
+    def probe(self, client):
+        """Return the seconds from sending a small request to its callback, or None on a timeout"""
+        done = threading.Event()
+        times = []
+
+        def on_response(response_dict):
+            times.append(time.perf_counter())
+            done.set()
+        cmd, seq = self.make_request("quickinfo", 128)
+        start = time.perf_counter()
+        client.sendCmdAsync(cmd, on_response, seq)
+        if not done.wait(5):
+            return None
+        return times[0] - start
+
+    def run_case(self, kind, count, loaded):
+        clients = self.start_clients(kind, count)
+        running = threading.Event()
+        try:
+            if loaded:
+                running.set()
+                for client in clients:
+                    for _ in range(LOAD_IN_FLIGHT):
+                        self.load(client, running)
+            latencies = []
+            timeouts = 0
+            for i in range(PROBE_COUNT):
+                latency = self.probe(clients[i % count])
+                if latency is None:
+                    timeouts += 1
+                else:
+                    latencies.append(latency)
+                time.sleep(PROBE_INTERVAL)
+        finally:
+            running.clear()
+            # let the last large responses arrive before the servers are killed
+            time.sleep(0.5)
+            for client in clients:
+                client.stop()
+        return latencies, timeouts
+
+    def run(self):
+        print("{0:>8} {1:>8} {2:>6} {3:>9} {4:>9} {5:>9} {6:>9} {7:>9}".format(
+            "client", "servers", "load", "p50 ms", "p95 ms", "p99 ms", "max ms", "timeouts"))
+        for count in SERVER_COUNTS:
+            for loaded in (False, True):
+                for kind in ("threads", "asyncio"):
+                    latencies, timeouts = self.run_case(kind, count, loaded)
+                    print("{0:>8} {1:>8} {2:>6} {3:>9.2f} {4:>9.2f} {5:>9.2f} {6:>9.2f} {7:>9}".format(
+                        kind, count, "yes" if loaded else "no",
+                        percentile(latencies, 50), percentile(latencies, 95), percentile(latencies, 99),
+                        max(latencies or [0]) * 1000, timeouts))
+
+
+def percentile(values, percent):
+    if not values:
+        return 0
+    values = sorted(values)
+    return values[min(len(values) - 1, len(values) * percent // 100)] * 1000
+
+
+def main():
+    node_client = find_plugin_module("node_client")
+    async_client = find_plugin_module("async_client")
+    global_vars = find_plugin_module("global_vars")
+    if not node_client or not async_client or not global_vars:
+        print("The TypeScript plugin is not loaded; run the benchmark in the Sublime Text console")
+        return
+    if not async_client.is_available():
+        print("asyncio is not available in this plugin host")
+        return
+    benchmark_thread = threading.Thread(target=Benchmark(node_client, async_client, global_vars).run)
+    benchmark_thread.daemon = True
+    benchmark_thread.start()
+
+
+main()
@@ -0,0 +1,129 @@
+"""
+Recovery of typescript/libs/daemon_client.py from a killed tsserver daemon
+
+Connects a DaemonClient to a broker that runs benchmarks/fake_tsserver.js,
+then kills the broker a few times while a request is waiting for its
+response, and reports for each kill how long it took for
+ - the waiting request to fail
+ - the client to connect again, spawning a new broker, and call on_restarted
+ - a request to succeed again
+The delay before connecting again doubles with every loss in a row, as for a
+crashed ServerClient, so the recovery times grow by 1, 2 and 4 seconds.
+
+The client needs the sublime module, so the benchmark runs in the Sublime
+Text console, with the plugin loaded, on Linux or OS X:
+
+    exec(open("<path to the plugin>/benchmarks/daemon_reconnect_benchmark.py").read())
+
+It runs on a thread of its own and prints the results to the console.
+"""
+
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+KILL_COUNT = 3
+# seconds to wait for each step before reporting a failure
+STEP_TIMEOUT = 30
+
+
+def find_plugin_module(name):
+    # the package name depends on where the plugin is installed
+    for module_name, module in list(sys.modules.items()):
+        if module_name.endswith(".typescript.libs." + name):
+            return module
+    return None
+
+
+class Benchmark(object):
+    def __init__(self, daemon_client, global_vars):
+        self.daemon_client = daemon_client
+        self.script_path = os.path.join(global_vars.PLUGIN_DIR, "benchmarks", "fake_tsserver.js")
+        self.seq = 0
+        self.restarted = threading.Event()
+
+    def make_request(self, command):
+        self.seq += 1
+        return json.dumps({"seq": self.seq, "type": "request", "command": command}), self.seq
+
+    def on_restarted(self):
+        self.restarted.set()
+
+    def wait_for_answer(self, client):
+        """Return the seconds until a request succeeds, or None"""
+        start = time.perf_counter()
+        while time.perf_counter() - start < STEP_TIMEOUT:
+            cmd, seq = self.make_request("quickinfo")
+            if client.started() and client.sendCmdSync(cmd, seq)["success"]:
+                return time.perf_counter() - start
+            time.sleep(0.05)
+        return None
+
+    def kill_broker(self, client):
+        """Kill the broker while a request waits for its response; return the failed response"""
+        pid = client.get_pid()
+        failed = []
+        done = threading.Event()
+
+        def on_response(response_dict):
+            failed.append(response_dict)
+            done.set()
+        # the stopped broker can't answer the request before it is killed
+        os.kill(pid, signal.SIGSTOP)
+        cmd, seq = self.make_request("quickinfo")
+        client.sendCmdAsync(cmd, on_response, seq)
+        time.sleep(0.1)
+        start = time.perf_counter()
+        os.kill(pid, signal.SIGKILL)
+        done.wait(STEP_TIMEOUT)
+        failed_after = time.perf_counter() - start if failed else None
+        return start, failed_after, failed[0].get("message") if failed else "no response"
+
+    def run(self):
+        client = self.daemon_client.DaemonClient(self.script_path)
+        client.on_restarted = self.on_restarted
+        try:
+            if self.wait_for_answer(client) is None:
+                print("Failed to connect to the tsserver daemon")
+                return
+            print("{0:>5} {1:>14} {2:>30} {3:>16} {4:>16}".format(
+                "kill", "failed after", "failed with", "reconnected s", "answering s"))
+            for kill in range(1, KILL_COUNT + 1):
+                self.restarted.clear()
+                start, failed_after, message = self.kill_broker(client)
+                reconnected = self.restarted.wait(STEP_TIMEOUT)
+                reconnected_after = time.perf_counter() - start
+                answered = self.wait_for_answer(client)
+                answered_after = time.perf_counter() - start if answered is not None else None
+                print("{0:>5} {1:>14} {2:>30} {3:>16} {4:>16}".format(
+                    kill,
+                    "{0:.1f}ms".format(failed_after * 1000) if failed_after is not None else "never",
+                    message,
+                    "{0:.2f}".format(reconnected_after) if reconnected else "never",
+                    "{0:.2f}".format(answered_after) if answered_after is not None else "never"))
+        finally:
+            pid = client.get_pid()
+            client.mark_exiting()
+            client.stop()
+            if pid:
+                os.kill(pid, signal.SIGTERM)
+
+
+def main():
+    daemon_client = find_plugin_module("daemon_client")
+    global_vars = find_plugin_module("global_vars")
+    if not daemon_client or not global_vars:
+        print("The TypeScript plugin is not loaded; run the benchmark in the Sublime Text console")
+        return
+    if not daemon_client.is_supported():
+        print("The tsserver daemon is not supported on this platform")
+        return
+    benchmark_thread = threading.Thread(target=Benchmark(daemon_client, global_vars).run)
+    benchmark_thread.daemon = True
+    benchmark_thread.start()
+
+
+main()
@@ -0,0 +1,32 @@
+// Stand-in for tsserver in async_client_benchmark.py: it answers every request
+// at once, so the measured latency is the time spent in the plugin client.
+//
+// The response to a request carries a body of arguments.responseBytes bytes
+// (128 by default), to load the client with large responses such as those of
+// references or navto.
+"use strict";
+
+var readline = require("readline");
+
+var fillers = {};
+
+function filler(size) {
+    if (!fillers[size]) {
+        fillers[size] = new Array(size + 1).join("x");
+    }
+    return fillers[size];
+}
+
+readline.createInterface({ input: process.stdin }).on("line", function (line) {
+    var request = JSON.parse(line);
+    var args = request.arguments || {};
+    var response = JSON.stringify({
+        seq: 0,
+        type: "response",
+        command: request.command,
+        request_seq: request.seq,
+        success: true,
+        body: { text: filler(args.responseBytes || 128) }
+    }) + "\n";
+    process.stdout.write("Content-Length: " + Buffer.byteLength(response) + "\r\n\r\n" + response);
+});
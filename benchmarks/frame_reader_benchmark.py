@@ -0,0 +1,124 @@
+"""
+Micro-benchmark of typescript/libs/frame_reader.py
+
+Writes Content-Length framed messages of 1KB, 1MB and 20MB bodies into a pipe
+from a thread, as tsserver does on its stdout, and reads them back with
+FrameReader; the readline() + read(n) loop the reader threads used before is
+measured the same way for comparison. Reports the throughput and the peak of
+the memory allocated while reading, from tracemalloc, in a second pass.
+
+Runs outside Sublime Text with any Python 3.5+:
+
+    python benchmarks/frame_reader_benchmark.py
+"""
+
+import importlib.util
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+LIBS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "typescript", "libs")
+
+# body size, number of frames
+CASES = [
+    (1024, 20000),
+    (1024 * 1024, 100),
+    (20 * 1024 * 1024, 5),
+]
+
+
+def load_frame_reader():
+    # load the module by path: the typescript package imports the sublime API
+    spec = importlib.util.spec_from_file_location("frame_reader", os.path.join(LIBS_DIR, "frame_reader.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_frame(body_size):
+    header = {"seq": 0, "type": "response", "command": "quickinfo", "request_seq": 1, "success": True}
+    padding = body_size - len(json.dumps(dict(header, body={"text": ""})))
+    body = json.dumps(dict(header, body={"text": "x" * max(padding, 0)})).encode("utf-8")
+    return b"Content-Length: " + str(len(body) + 1).encode("ascii") + b"\r\n\r\n" + body + b"\n"
+
+
+def write_frames(fd, frame, count):
+    with os.fdopen(fd, "wb") as pipe:
+        for _ in range(count):
+            pipe.write(frame)
+
+
+def read_with_frame_reader(module, stream, count):
+    reader = module.FrameReader()
+    raw = getattr(stream, "raw", stream)
+    received = 0
+    while received < count:
+        body = reader.next_frame()
+        if body is None:
+            if not reader.fill(raw):
+                break
+            continue
+        module.peek_header(body)
+        body.release()
+        received += 1
+    return received
+
+
+def read_with_readline(module, stream, count):
+    received = 0
+    while received < count:
+        body_length = 0
+        while True:
+            header = stream.readline().strip()
+            if not header:
+                break
+            if header.startswith(b"Content-Length: "):
+                body_length = int(header[len(b"Content-Length: "):])
+        if body_length == 0:
+            break
+        body = stream.read(body_length)
+        module.peek_header(body)
+        received += 1
+    return received
+
+
+def run(module, read, frame, count, trace):
+    read_fd, write_fd = os.pipe()
+    writer = threading.Thread(target=write_frames, args=(write_fd, frame, count))
+    with os.fdopen(read_fd, "rb") as stream:
+        if trace:
+            tracemalloc.start()
+        start = time.perf_counter()
+        writer.start()
+        received = read(module, stream, count)
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace else 0
+        if trace:
+            tracemalloc.stop()
+    writer.join()
+    assert received == count, "read {0} of {1} frames".format(received, count)
+    return elapsed, peak
+
+
+def main():
+    module = load_frame_reader()
+    readers = [("FrameReader", read_with_frame_reader), ("readline", read_with_readline)]
+    print("{0:>8} {1:>7} {2:>12} {3:>11} {4:>14}".format("body", "frames", "reader", "MB/s", "peak memory"))
+    for body_size, count in CASES:
+        frame = make_frame(body_size)
+        for name, read in readers:
+            elapsed, _ = run(module, read, frame, count, trace=False)
+            _, peak = run(module, read, frame, count, trace=True)
+            throughput = len(frame) * count / elapsed / (1024 * 1024)
+            print("{0:>8} {1:>7} {2:>12} {3:>11.0f} {4:>12.1f}MB".format(
+                format_size(body_size), count, name, throughput, peak / (1024.0 * 1024.0)))
+
+
+def format_size(size):
+    return "{0}MB".format(size // (1024 * 1024)) if size >= 1024 * 1024 else "{0}KB".format(size // 1024)
+
+
+if __name__ == "__main__":
+    main()
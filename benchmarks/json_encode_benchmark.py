@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of the request encoding in typescript/libs/json_helpers.py
+
+Encodes the requests sent on most keystrokes (change, completions,
+signatureHelp, quickinfo) with encode_request, which formats them from a
+template, and with encode, which goes through json.dumps, and reports the time
+per request of each. Both are measured with the json module; when orjson is
+installed, encode with orjson is reported as well, since encode_request then
+leaves the encoding to it. The templates are checked to decode to the same
+requests first.
+
+Runs outside Sublime Text with any Python 3.5+:
+
+    python benchmarks/json_encode_benchmark.py
+"""
+
+import importlib.util
+import json
+import os
+import timeit
+
+LIBS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "typescript", "libs")
+
+FILE_NAME = "/home/user/projects/app/src/components/editor/toolbar.tsx"
+REQUESTS = [
+    ("change", {"file": FILE_NAME, "line": 120, "offset": 17, "endLine": 120, "endOffset": 17, "insertString": "a"}),
+    ("completions", {"file": FILE_NAME, "line": 120, "offset": 18, "prefix": "thi"}),
+    ("signatureHelp", {"file": FILE_NAME, "line": 120, "offset": 18, "prefix": ""}),
+    ("quickinfo", {"file": FILE_NAME, "line": 42, "offset": 9}),
+]
+ITERATIONS = 100000
+
+
+def load_json_helpers():
+    # load the module by path: the typescript package imports the sublime API
+    spec = importlib.util.spec_from_file_location("json_helpers", os.path.join(LIBS_DIR, "json_helpers.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_request(command, args):
+    return {"command": command, "seq": 12345, "type": "request", "arguments": args}
+
+
+def time_per_call(function, req_dict):
+    seconds = min(timeit.repeat(lambda: function(req_dict), number=ITERATIONS, repeat=3))
+    return seconds / ITERATIONS * 1000000
+
+
+def main():
+    module = load_json_helpers()
+    orjson = module.orjson
+    # measure the json module paths; orjson is put back for its own column
+    module.orjson = None
+    for command, args in REQUESTS:
+        req_dict = make_request(command, args)
+        assert json.loads(module.encode_request(req_dict)) == req_dict, command
+
+    header = "{0:>14} {1:>16} {2:>16} {3:>9}".format("request", "encode_request", "encode (json)", "speedup")
+    if orjson is not None:
+        header += " {0:>16}".format("encode (orjson)")
+    print(header)
+    for command, args in REQUESTS:
+        req_dict = make_request(command, args)
+        module.orjson = None
+        template_time = time_per_call(module.encode_request, req_dict)
+        json_time = time_per_call(module.encode, req_dict)
+        line = "{0:>14} {1:>14.2f}us {2:>14.2f}us {3:>8.1f}x".format(
+            command, template_time, json_time, json_time / template_time)
+        if orjson is not None:
+            module.orjson = orjson
+            line += " {0:>14.2f}us".format(time_per_call(module.encode, req_dict))
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Cost of syncing a buffer with tsserver during an undo storm
+
+Undo and redo aren't tracked as changes, so every undo ends in reload_buffer.
+This replays 100 undos of a 20000-line (about 1MB) file, and reports per undo
+the time the plugin spends, and the bytes it sends, to bring a server up to
+date
+ - with a reload: writing the buffer to a temp file and encoding a reload
+   request, which the server answers by reading and parsing the whole file
+ - with diff sync: computing the edits from the text synced last with
+   text_helpers.diff_text_edits and encoding them as change requests; the
+   same requests go to the worker and the syntax server when they run
+ - with diff sync while the worker or the syntax server runs, as it was before
+   the edits were mirrored: the change requests, then a reload of the mirrors
+   from a temp file
+The edits undone are those of typing: words typed at random lines, lines
+deleted, and blocks of 20 lines pasted.
+
+text_helpers needs the sublime module, so the benchmark runs in the Sublime
+Text console, with the plugin loaded:
+
+    exec(open("<path to the plugin>/benchmarks/undo_storm_benchmark.py").read())
+"""
+
+import codecs
+import os
+import random
+import sys
+import tempfile
+import time
+
+LINE_COUNT = 20000
+UNDO_COUNT = 100
+
+
+def find_plugin_module(name):
+    # the package name depends on where the plugin is installed
+    for module_name, module in list(sys.modules.items()):
+        if module_name.endswith(".typescript.libs." + name):
+            return module
+    return None
+
+
+def make_text(rng):
+    lines = []
+    for i in range(LINE_COUNT):
+        lines.append("    const value{0} = compute(items[{1}], {2}); // {3}".format(
+            i, rng.randrange(1000), rng.randrange(1000), "x" * rng.randrange(20)))
+    return "\n".join(lines) + "\n"
+
+
+def make_edits(rng, text):
+    """Return the texts after each of UNDO_COUNT edits of <text>, first to last"""
+    texts = []
+    lines = text.split("\n")
+    for _ in range(UNDO_COUNT):
+        index = rng.randrange(len(lines) - 20)
+        kind = rng.random()
+        if kind < 0.7:
+            column = rng.randrange(len(lines[index]) + 1)
+            lines[index] = lines[index][:column] + "word" + lines[index][column:]
+        elif kind < 0.85:
+            del lines[index]
+        else:
+            lines[index:index] = ["    pasted({0});".format(i) for i in range(20)]
+        texts.append("\n".join(lines))
+    return texts
+
+
+def make_change(json_helpers, seq, file_name, location, end_location, insert_string):
+    # the request ServiceProxy.change sends
+    return json_helpers.encode_request({"command": "change", "seq": seq, "type": "request", "arguments": {
+        "file": file_name, "line": location.line, "offset": location.offset,
+        "endLine": end_location.line, "endOffset": end_location.offset, "insertString": insert_string}})
+
+
+def main():
+    text_helpers = find_plugin_module("text_helpers")
+    json_helpers = find_plugin_module("json_helpers")
+    if not text_helpers or not json_helpers:
+        print("The TypeScript plugin is not loaded; run the benchmark in the Sublime Text console")
+        return
+    rng = random.Random(42)
+    original = make_text(rng)
+    # undo the edits last one first, back to the original text
+    undo_texts = list(reversed([original] + make_edits(rng, original)))
+    file_name = os.path.join(tempfile.gettempdir(), "undo_storm.ts")
+    tmpfile_name = os.path.join(tempfile.gettempdir(), "undo_storm.tmpbuf")
+
+    reload_time = 0
+    reload_bytes = 0
+    start = time.perf_counter()
+    for seq, text in enumerate(undo_texts[1:]):
+        tmpfile = codecs.open(tmpfile_name, "w", "utf-8")
+        tmpfile.write(text)
+        tmpfile.flush()
+        tmpfile.close()
+        request = json_helpers.encode_request({"command": "reload", "seq": seq, "type": "request", "arguments": {
+            "file": file_name, "tmpfile": tmpfile_name}})
+        reload_bytes += len(request) + len(text.encode("utf-8"))
+    reload_time = time.perf_counter() - start
+    os.remove(tmpfile_name)
+
+    diff_bytes = 0
+    edit_count = 0
+    start = time.perf_counter()
+    for seq, (old_text, text) in enumerate(zip(undo_texts, undo_texts[1:])):
+        edits = text_helpers.diff_text_edits(old_text, text)
+        edit_count += len(edits)
+        for location, end_location, insert_string in edits:
+            diff_bytes += len(make_change(json_helpers, seq, file_name, location, end_location, insert_string))
+    diff_time = time.perf_counter() - start
+
+    # check that the edits give back each text, as the server applies them
+    for old_text, text in zip(undo_texts, undo_texts[1:]):
+        edits = text_helpers.diff_text_edits(old_text, text)
+        assert text_helpers.apply_changes_to_text(old_text, edits) == text
+
+    print("{0} undos of a {1}-line file of {2:.1f}MB".format(
+        UNDO_COUNT, LINE_COUNT, len(original.encode("utf-8")) / (1024.0 * 1024.0)))
+    print("{0:>10} {1:>12} {2:>16}".format("sync", "ms per undo", "bytes per undo"))
+    print("{0:>10} {1:>12.2f} {2:>16.0f}".format("reload", reload_time * 1000 / UNDO_COUNT, reload_bytes / UNDO_COUNT))
+    print("{0:>10} {1:>12.2f} {2:>16.0f}   ({3} edits in total)".format(
+        "diff", diff_time * 1000 / UNDO_COUNT, diff_bytes / UNDO_COUNT, edit_count))
+    print("{0:>10} {1:>12.2f} {2:>16.0f}".format(
+        "diff+tmp", (diff_time + reload_time) * 1000 / UNDO_COUNT, (diff_bytes + reload_bytes) / UNDO_COUNT))
+
+
+main()
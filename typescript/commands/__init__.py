@@ -16,6 +16,7 @@ from .format import (
     TypescriptFormatDocument,
     TypescriptFormatLine,
     TypescriptFormatOnKey,
+    TypescriptApplyCodeEdits,
     TypescriptFormatSelection,
     TypescriptPasteAndFormat,
     TypescriptAutoIndentOnEnterBetweenCurlyBrackets
@@ -45,6 +46,7 @@ from .settings import (
 from .organize_imports import (
     TypescriptOrganizeImportsCommand
 )
+from .server_diagnostics import TypescriptShowServerDiagnostics
 
 __all__ = [
     "TypescriptAutoIndentOnEnterBetweenCurlyBrackets",
@@ -56,6 +58,7 @@ __all__ = [
     "TypescriptFormatDocument",
     "TypescriptFormatLine",
     "TypescriptFormatOnKey",
+    "TypescriptApplyCodeEdits",
     "TypescriptFormatSelection",
     "TypescriptPasteAndFormat",
     "TypescriptGoToDefinitionCommand",
@@ -82,5 +85,6 @@ __all__ = [
     "TypescriptBuildCommand",
     "TypescriptOpenPluginDefaultSettingFile",
     "TypescriptOpenTsDefaultSettingFile",
-    "TypescriptOpenTsreactDefaultSettingFile"
+    "TypescriptOpenTsreactDefaultSettingFile",
+    "TypescriptShowServerDiagnostics"
 ]
@@ -13,7 +13,9 @@ class TypescriptBuildCommand(sublime_plugin.WindowCommand):
             return
 
         file_name = self.window.active_view().file_name()
-        project_info = cli.service.project_info(file_name)
+        cli.service.project_info_async(file_name, lambda project_info: self.handle_project_info(file_name, project_info))
+
+    def handle_project_info(self, file_name, project_info):
         if project_info["success"]:
             body = project_info["body"]
             if ("configFileName" in body) and body["configFileName"].endswith(".json"):
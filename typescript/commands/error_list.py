@@ -2,9 +2,9 @@
 import sublime_plugin
 
 from ..libs import cli, log, global_vars
-from ..libs.view_helpers import active_view, get_info, is_typescript, active_view
+from ..libs.view_helpers import active_view, get_info, is_typescript, active_view, start_worker
 from ..libs.panel_manager import get_panel_manager
-from ..listeners.error_list import start_timer
+from ..listeners.error_list import start_timer, listener
 from .base_command import TypeScriptBaseWindowCommand
 
 class TypescriptProjectErrorList(sublime_plugin.WindowCommand):
@@ -15,11 +15,15 @@ class TypescriptProjectErrorList(sublime_plugin.WindowCommand):
     def run(self):
         panel_manager = get_panel_manager()
         panel_manager.add_panel("errorlist")
-        
+        listener.worker_hibernated = False
+
         if not cli.worker_client.started():
             panel_manager.show_panel("errorlist", ["Starting worker for project error list..."])
             # start worker process
-            cli.worker_client.start()
+            start_worker()
+        elif listener.is_warm_worker_loading():
+            # the warm standby worker is still loading the project
+            panel_manager.show_panel("errorlist", ["Loading project for the error list..."])
         else:
             # The server is up already, so just show the panel without overwriting the content
             panel_manager.show_panel("errorlist")
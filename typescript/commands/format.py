@@ -14,12 +14,29 @@ class TypescriptFormatOnKey(TypeScriptBaseTextCommand):
         if 0 == len(key):
             return
         check_update_view(self.view)
+        request_change_count = change_count(self.view)
 
-        format_response = cli.service.format_on_key(self.view.file_name(), get_location_from_view(self.view), key)
-        if format_response["success"]:
-            # logger.log.debug(str(formatResp))
-            code_edits = format_response["body"]
-            apply_formatting_changes(text, self.view, code_edits)
+        def on_completed(format_response):
+            code_edits = format_response["body"] if format_response["success"] else []
+            apply_code_edits_if_current(self.view, code_edits, request_change_count)
+
+        cli.service.format_on_key_async(self.view.file_name(), get_location_from_view(self.view), key, on_completed)
+
+
+class TypescriptApplyCodeEdits(TypeScriptBaseTextCommand):
+    """
+    Apply code edits received from tsserver. The edits are dropped if the
+    buffer changed since they were requested, because their locations refer
+    to the old content.
+    """
+    def run(self, text, code_edits, request_change_count):
+        if change_count(self.view) != request_change_count:
+            log.debug("Dropping code edits computed for an outdated buffer")
+            return
+        apply_formatting_changes(text, self.view, code_edits)
+        if not IS_ST2:
+            client_info = cli.get_or_add_file(self.view.file_name())
+            client_info.change_count = self.view.change_count()
 
 
 class TypescriptFormatSelection(TypeScriptBaseTextCommand):
@@ -27,14 +44,14 @@ class TypescriptFormatSelection(TypeScriptBaseTextCommand):
     def run(self, text):
         log.debug("running TypescriptFormatSelection")
         r = self.view.sel()[0]
-        format_range(text, self.view, r.begin(), r.end())
+        format_range(self.view, r.begin(), r.end())
 
 
 class TypescriptFormatDocument(TypeScriptBaseTextCommand):
     """Command to format the entire buffer"""
     def run(self, text):
         log.debug("running TypescriptFormatDocument")
-        format_range(text, self.view, 0, self.view.size())
+        format_range(self.view, 0, self.view.size())
 
 
 class TypescriptFormatLine(TypeScriptBaseTextCommand):
@@ -44,7 +61,7 @@ class TypescriptFormatLine(TypeScriptBaseTextCommand):
         line_region = self.view.line(self.view.sel()[0])
         line_text = self.view.substr(line_region)
         if NON_BLANK_LINE_PATTERN.search(line_text):
-            format_range(text, self.view, line_region.begin(), line_region.end())
+            format_range(self.view, line_region.begin(), line_region.end())
         else:
             position = self.view.sel()[0].begin()
             line, offset = self.view.rowcol(position)
@@ -94,10 +111,12 @@ class TypescriptPasteAndFormat(TypeScriptBaseTextCommand):
         regions_after_paste = view.get_regions("apresPaste")
         view.erase_regions("apresPaste")
 
+        ranges = []
         for rb, ra in zip(regions_before_paste, regions_after_paste):
             line_start = view.line(rb.begin()).begin()
             line_end = view.line(ra.begin()).end()
-            format_range(text, view, line_start, line_end)
+            ranges.append((line_start, line_end))
+        format_ranges(view, ranges)
 
 
 class TypescriptAutoIndentOnEnterBetweenCurlyBrackets(TypeScriptBaseTextCommand):
@@ -108,7 +127,26 @@ class TypescriptAutoIndentOnEnterBetweenCurlyBrackets(TypeScriptBaseTextCommand)
     def run(self, text):
         log.debug("running TypescriptAutoIndentOnEnterBetweenCurlyBrackets")
         view = self.view
-        view.run_command('typescript_format_on_key', {"key": "\n"})
+        # format the line of the opening bracket with the caret as it is before
+        # the indentation is inserted, as tsserver expects for "\n"
+        check_update_view(view)
+        format_row, format_offset = view.rowcol(view.sel()[0].begin())
+        # the change count once the indentation is inserted; on Sublime Text 2
+        # the response arrives before that, while the buffer is as requested
+        indent_change_count = []
+
+        def on_completed(format_response):
+            code_edits = format_response["body"] if format_response["success"] else []
+            if not indent_change_count:
+                apply_code_edits_if_current(view, code_edits, change_count(view))
+            elif any(extract_line_offset(code_edit["end"]) > (format_row, format_offset) for code_edit in code_edits):
+                # edits before the caret aren't moved by the indentation, others are
+                log.debug("Dropping format on enter edits that reach past the caret")
+            else:
+                apply_code_edits_if_current(view, code_edits, indent_change_count[0])
+
+        cli.service.format_on_key_async(view.file_name(), get_location_from_view(view), "\n", on_completed)
+
         loc = view.sel()[0].begin()
         row, offset = view.rowcol(loc)
         tab_size = view.settings().get('tab_size')
@@ -121,4 +159,5 @@ class TypescriptAutoIndentOnEnterBetweenCurlyBrackets(TypeScriptBaseTextCommand)
             ws += ' '
         # insert the whitespace
         insert_text(view, text, loc, ws)
-        set_caret_pos(view, loc + tab_size)
\ No newline at end of file
+        set_caret_pos(view, loc + tab_size)
+        indent_change_count.append(change_count(view))
@@ -71,15 +71,19 @@ class TypescriptRequestCodeFixesCommand(TypeScriptBaseTextCommand):
         check_update_view(self.view)
         path = self.view.file_name()
 
-        semantic_errors = cli.service.get_semantic_errors(path)
-        syntactic_errors = cli.service.get_syntactic_errors(path)
+        def on_semantic_errors(semantic_errors):
+            if semantic_errors['success']:
+                self.all_errors = self.all_errors + semantic_errors['body']
+            cli.service.get_syntactic_errors_async(path, on_syntactic_errors)
 
-        if semantic_errors['success']:
-            self.all_errors = self.all_errors + semantic_errors['body']
+        def on_syntactic_errors(syntactic_errors):
+            if syntactic_errors['success']:
+                self.all_errors = self.all_errors + syntactic_errors['body']
+            self.request_code_fixes(path)
 
-        if syntactic_errors['success']:
-            self.all_errors = self.all_errors + syntactic_errors['body']
+        cli.service.get_semantic_errors_async(path, on_semantic_errors)
 
+    def request_code_fixes(self, path):
         pos = self.view.sel()[0].begin()
         cursor = self.view.rowcol(pos)
         errors = self.get_errors_at_cursor(path, cursor)
@@ -90,14 +94,17 @@ class TypescriptRequestCodeFixesCommand(TypeScriptBaseTextCommand):
             end_line = errors[0]['end']['line']
             start_offset = errors[0]['start']['offset']
             end_offset = errors[0]['end']['offset']
-            self.all_code_fixes = cli.service.get_code_fixes(
-                path, start_line, start_offset, end_line, end_offset, error_codes)
-            if self.all_code_fixes['success']:
-                if len(self.all_code_fixes['body']):
-                    possibleFixesDescriptions = list(
-                        map(lambda fix: fix['description'], self.all_code_fixes['body']))
-                    if len(possibleFixesDescriptions) == 1:
-                        self.handle_selection(0)
-                    else:
-                        self.view.window().show_quick_panel(
-                            possibleFixesDescriptions, self.handle_selection, False, -1)
+            cli.service.get_code_fixes_async(
+                path, start_line, start_offset, end_line, end_offset, error_codes, self.handle_code_fixes)
+
+    def handle_code_fixes(self, code_fixes):
+        self.all_code_fixes = code_fixes
+        if self.all_code_fixes['success']:
+            if len(self.all_code_fixes['body']):
+                possibleFixesDescriptions = list(
+                    map(lambda fix: fix['description'], self.all_code_fixes['body']))
+                if len(possibleFixesDescriptions) == 1:
+                    self.handle_selection(0)
+                else:
+                    self.view.window().show_quick_panel(
+                        possibleFixesDescriptions, self.handle_selection, False, -1)
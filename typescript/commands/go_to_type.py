@@ -7,7 +7,9 @@ class TypescriptGoToTypeCommand(TypeScriptBaseTextCommand):
     """Go to type command"""
     def run(self, text):
         check_update_view(self.view)
-        type_resp = cli.service.type(self.view.file_name(), get_location_from_view(self.view))
+        cli.service.type_async(self.view.file_name(), get_location_from_view(self.view), self.handle_type)
+
+    def handle_type(self, type_resp):
         if type_resp["success"]:
             items = type_resp["body"]
             if len(items) > 0:
@@ -7,7 +7,9 @@ class TypescriptGoToTypeDefinitionCommand(TypeScriptBaseTextCommand):
     """Go to definition command"""
     def run(self, text):
         check_update_view(self.view)
-        definition_resp = cli.service.type_definition(self.view.file_name(), get_location_from_view(self.view))
+        cli.service.type_definition_async(self.view.file_name(), get_location_from_view(self.view), self.handle_type_definition)
+
+    def handle_type_definition(self, definition_resp):
         if definition_resp["success"]:
             code_span = definition_resp["body"][0] if len(definition_resp["body"]) > 0 else None
             if code_span:
@@ -29,7 +29,13 @@ class TypescriptNavToCommand(TypeScriptBaseWindowCommand):
         # when some input text that will result in empty results is given (for example, empty
         # string), we use alternative text to ensure the panel stay active
         query_text = "a" if input_text == "" else input_text
-        response_dict = cli.service.nav_to(query_text, self.window.active_view().file_name())
+        cli.service.nav_to_async(query_text, self.window.active_view().file_name(),
+                                 lambda response_dict: self.handle_nav_to(response_dict, input_text))
+
+    def handle_nav_to(self, response_dict, input_text):
+        if input_text != TypescriptNavToCommand.input_text:
+            # the query changed while this response was on its way
+            return
         if response_dict["success"]:
             items = response_dict["body"]
             self.items = items if len(items) != 0 else self.items
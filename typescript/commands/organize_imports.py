@@ -13,8 +13,12 @@ class TypescriptOrganizeImportsCommand(TypeScriptBaseTextCommand):
             print("To run this command, please first assign a file name to the view")
             return
         check_update_view(self.view)
-        format_response = cli.service.organize_imports(self.view.file_name())
-        if format_response["success"]:
-            log.debug(str(format_response["body"]))
-            code_edits = format_response["body"][0]["textChanges"]
-            apply_formatting_changes(text, self.view, code_edits)
+        request_change_count = change_count(self.view)
+
+        def on_completed(format_response):
+            if format_response["success"]:
+                log.debug(str(format_response["body"]))
+                code_edits = format_response["body"][0]["textChanges"]
+                apply_code_edits_if_current(self.view, code_edits, request_change_count)
+
+        cli.service.organize_imports_async(self.view.file_name(), on_completed)
@@ -6,16 +6,26 @@ from ..libs.reference import *
 from .base_command import TypeScriptBaseTextCommand
 
 
+# Response bodies handed from TypescriptFindReferencesCommand to TypescriptPopulateRefs.
+# They can be huge (and lazily decoded), so they are passed by id rather than
+# being serialized into the command arguments.
+_references_bodies = {}
+
+
 class TypescriptFindReferencesCommand(TypeScriptBaseTextCommand):
     """Find references command"""
     def run(self, text):
         check_update_view(self.view)
-        references_resp = cli.service.references(self.view.file_name(), get_location_from_view(self.view))
+        cli.service.references_async(self.view.file_name(), get_location_from_view(self.view), self.handle_references)
+
+    def handle_references(self, references_resp):
         if references_resp["success"]:
             pos = self.view.sel()[0].begin()
             cursor = self.view.rowcol(pos)
             line = str(cursor[0] + 1)
-            args = {"line": line, "filename": self.view.file_name(), "referencesRespBody": references_resp["body"]}
+            body_id = references_resp["request_seq"]
+            _references_bodies[body_id] = references_resp["body"]
+            args = {"line": line, "filename": self.view.file_name(), "referencesRespBodyId": body_id}
             args_json_str = json_helpers.encode(args)
             ref_view = get_ref_view()
             ref_view.run_command('typescript_populate_refs', {"argsJson": args_json_str})
@@ -84,59 +94,64 @@ class TypescriptPopulateRefs(sublime_plugin.TextCommand):
 
     def run(self, text, argsJson):
         args = json_helpers.decode(argsJson)
-        file_name = args["filename"]
-        line = args["line"]
-        ref_display_string = args["referencesRespBody"]["symbolDisplayString"]
-        ref_id = args["referencesRespBody"]["symbolName"]
-        refs = args["referencesRespBody"]["refs"]
-
+        if "referencesRespBodyId" in args:
+            body = _references_bodies.pop(args["referencesRespBodyId"], None)
+            if body is None:
+                return
+        else:
+            body = args["referencesRespBody"]
+
+        # Build the whole listing first and insert it with a single edit; the
+        # refs are consumed one at a time so a huge response is never fully decoded
+        lines = []
+        ref_lines = []
         file_count = 0
         match_count = 0
+        prev_file_name = ""
+        for ref in json_helpers.iter_items(body, "refs"):
+            file_name = ref["file"]
+            if prev_file_name != file_name:
+                file_count += 1
+                if prev_file_name != "":
+                    lines.append("")
+                lines.append(file_name + ":")
+                prev_file_name = file_name
+            (l, c) = extract_line_offset(ref["start"])
+            ref_lines.append((len(lines), file_name, l, c))
+            lines.append("    {0}:  {1}".format(l + 1, ref["lineText"]))
+            match_count += 1
+
+        ref_display_string = body["symbolDisplayString"]
+        ref_id = body["symbolName"]
+        header = "References to {0} \n\n".format(ref_display_string)
+        footer = "\n{0} matches in {1} file{2}\n".format(match_count, file_count, "" if (file_count == 1) else "s")
+        header_line_count = header.count("\n")
+
+        ref_info = None
+        prev_line = None
+        for (index, file_name, l, c) in ref_lines:
+            line = str(header_line_count + index)
+            if not ref_info:
+                ref_info = cli.init_ref_info(line, ref_id)
+            ref_info.add_mapping(line, Ref(file_name, l, c, prev_line))
+            if prev_line:
+                ref_info.get_mapping(prev_line).set_next_line(line)
+            prev_line = line
+
         self.view.set_read_only(False)
         # erase the caret showing the last reference followed
         self.view.erase_regions("curref")
         # clear the references buffer
         self.view.erase(text, sublime.Region(0, self.view.size()))
-        header = "References to {0} \n\n".format(ref_display_string)
-        self.view.insert(text, self.view.sel()[0].begin(), header)
         self.view.set_syntax_file("Packages/" + PLUGIN_NAME + "/FindRefs.hidden-tmLanguage")
+        self.view.insert(text, 0, header + "".join(line + "\n" for line in lines) + footer)
         window = sublime.active_window()
-        ref_info = None
-        if len(refs) > 0:
-            prev_file_name = ""
-            prev_line = None
-            for ref in refs:
-                file_name = ref["file"]
-                if prev_file_name != file_name:
-                    file_count += 1
-                    if prev_file_name != "":
-                        self.view.insert(text, self.view.sel()[0].begin(), "\n")
-                    self.view.insert(text, self.view.sel()[0].begin(), file_name + ":\n")
-                    prev_file_name = file_name
-                start_location = ref["start"]
-                (l, c) = extract_line_offset(start_location)
-                pos = self.view.sel()[0].begin()
-                cursor = self.view.rowcol(pos)
-                line = str(cursor[0])
-                if not ref_info:
-                    ref_info = cli.init_ref_info(line, ref_id)
-                ref_info.add_mapping(line, Ref(file_name, l, c, prev_line))
-                if prev_line:
-                    mapping = ref_info.get_mapping(prev_line)
-                    mapping.set_next_line(line)
-                prev_line = line
-                content = ref["lineText"]
-                display_ref = "    {0}:  {1}\n".format(l + 1, content)
-                match_count += 1
-                self.view.insert(text, self.view.sel()[0].begin(), display_ref)
-        ref_info.set_last_line(line)
-        self.view.insert(text, self.view.sel()[0].begin(),
-                         "\n{0} matches in {1} file{2}\n".format(match_count,
-                                                                 file_count, "" if (file_count == 1) else "s"))
         if match_count > 0:
             highlight_ids(self.view, ref_id)
         window.focus_view(self.view)
         set_caret_pos(self.view, self.view.text_point(2, 0))
-        # serialize the reference info into the settings
-        self.view.settings().set('refinfo', ref_info.as_value())
+        if ref_info:
+            ref_info.set_last_line(prev_line)
+            # serialize the reference info into the settings
+            self.view.settings().set('refinfo', ref_info.as_value())
         self.view.set_read_only(True)
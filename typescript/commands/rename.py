@@ -10,8 +10,16 @@ class TypescriptRenameCommand(TypeScriptBaseTextCommand):
     """
     def run(self, text):
         check_update_view(self.view)
+        request_change_count = change_count(self.view)
 
-        rename_response = cli.service.rename(self.view.file_name(), get_location_from_view(self.view))
+        def on_completed(rename_response):
+            # the locations are useless if the buffer changed in the meantime
+            if change_count(self.view) == request_change_count:
+                self.handle_rename(rename_response)
+
+        cli.service.rename_async(self.view.file_name(), get_location_from_view(self.view), on_completed)
+
+    def handle_rename(self, rename_response):
         if not rename_response['success']:
             return
 
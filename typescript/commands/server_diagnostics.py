@@ -0,0 +1,46 @@
+import sublime_plugin
+
+from ..libs import cli, json_helpers
+from ..libs.event_dispatcher import event_dispatcher
+from ..libs.panel_manager import get_panel_manager
+from ..libs.startup_profile import startup_profile
+
+
+class TypescriptShowServerDiagnostics(sublime_plugin.WindowCommand):
+    """Show the state of the tsserver processes and the tail of their stderr in a panel"""
+
+    def is_enabled(self):
+        return cli.initialized
+
+    def run(self):
+        lines = []
+        clients = [("server", cli.node_client), ("worker", cli.worker_client)]
+        if cli.syntax_client.started():
+            clients.append(("syntax server", cli.syntax_client))
+        for name, client in clients:
+            lines.append("TypeScript {0} ({1})".format(name, type(client).__name__))
+            lines.extend("    " + line for line in client.get_diagnostics())
+            lines.append("")
+
+        dispatcher = event_dispatcher()
+        lines.append("TypeScript events")
+        lines.append("    dispatched: {0}, superseded while queued: {1}, queued: {2}".format(
+            dispatcher.dispatched_count, dispatcher.superseded_count, dispatcher.queue_length()))
+
+        lines.append("")
+        lines.append("TypeScript requests")
+        lines.append("    json backend: {0}".format(json_helpers.backend_name()))
+        lines.append("    duplicates joined to an identical request in flight: {0}".format(
+            cli.service.duplicate_requests_avoided))
+
+        lines.append("")
+        lines.append("TypeScript startup")
+        lines.extend("    " + line for line in startup_profile().get_lines())
+
+        lines.append("")
+        lines.append("TypeScript memory")
+        lines.extend("    " + line for line in cli.memory_watchdog.get_diagnostics())
+
+        panel_manager = get_panel_manager()
+        panel_manager.add_panel("tsserver")
+        panel_manager.show_panel("tsserver", lines)
@@ -1,4 +1,7 @@
-﻿from .node_client import NodeCommClient, ServerClient, WorkerClient
+﻿from .node_client import NodeCommClient, ServerClient, SyntaxServerClient, WorkerClient
+from .async_client import AsyncioCommClient
+from .daemon_client import DaemonClient
+from .sharded_client import ShardedClient
 from .popup_manager import PopupManager
 from .service_proxy import ServiceProxy
 from .editor_client import cli, EditorClient
@@ -15,7 +18,11 @@ __all__ = [
     'get_popup_manager',
     'NodeCommClient',
     'ServerClient',
+    'SyntaxServerClient',
     'WorkerClient',
+    'AsyncioCommClient',
+    'DaemonClient',
+    'ShardedClient',
     'json_helpers',
     'PopupManager',
     'ServiceProxy',
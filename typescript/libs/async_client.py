@@ -0,0 +1,274 @@
+import queue
+import threading
+import time
+
+import sublime
+
+# asyncio is not available in the Python 2.6/3.3 plugin hosts
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+from .logger import log
+from .frame_reader import FrameReader
+from .node_client import NodeCommClient, ServerClient, StderrBuffer
+from . import global_vars
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def is_available():
+    return asyncio is not None
+
+
+def get_event_loop():
+    """
+    Return the event loop that serves the pipes of every AsyncioCommClient,
+    starting its thread on first use
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            loop_thread = threading.Thread(target=_loop.run_forever)
+            loop_thread.daemon = True
+            loop_thread.start()
+    return _loop
+
+
+class _ServerProtocol(asyncio.SubprocessProtocol if asyncio else object):
+    """Feeds the stdout of one tsserver process to its client as it arrives"""
+
+    def __init__(self, client, generation):
+        self.client = client
+        self.generation = generation
+        self.transport = None
+        self.reader = FrameReader()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.client.on_connected(transport, self.generation)
+
+    def pipe_data_received(self, fd, data):
+        if fd == 1:
+            self.reader.feed(data)
+            while True:
+                body = self.reader.next_frame()
+                if body is None:
+                    break
+                self.client.on_frame(body)
+        elif fd == 2:
+            self.client.on_stderr(data)
+
+    def process_exited(self):
+        self.client.on_exit(self.transport)
+
+
+class AsyncioCommClient(NodeCommClient):
+    """
+    tsserver client driven by one event loop shared with all other instances
+
+    ServerClient and WorkerClient each need a post thread and a reader thread;
+    here all reads and writes happen on the shared event loop thread, so adding
+    tsserver processes doesn't add threads. Commands go through the same
+    RequestQueue, which the loop drains whenever something is posted or
+    answered, or a held background request may be sent. The blocking and callback based
+    requests of NodeCommClient keep working, and so does 'request'; coroutines
+    running on the loop await its future with asyncio.wrap_future.
+
+    Like ServerClient, the process is spawned in the background; commands
+    posted meanwhile are written once it is running. With <restart_on_exit>
+    a crashed server is started again after the delays of ServerClient.
+    """
+    uses_post_thread = False
+
+    def __init__(self, script_path, restart_on_exit=False):
+        super(AsyncioCommClient, self).__init__(script_path)
+        self.loop = get_event_loop()
+        self.transport = None
+        self.stdin = None
+        # a drain of the post queue is scheduled on the loop, and the timer
+        # that drains it once held background requests may be sent
+        self.drain_scheduled = False
+        self.drain_timer = None
+        # bumped by every start and stop, so a process spawned for an earlier
+        # start that was stopped meanwhile is killed as soon as it is connected
+        self.generation = 0
+
+        self.restart_on_exit = restart_on_exit
+        # called on the UI thread after a crashed server has been started again
+        self.on_restarted = None
+        self.restart_count = 0
+        self.restart_delay = ServerClient.MIN_RESTART_DELAY
+        self.start_time = None
+
+    def start(self, on_spawned=None):
+        """
+        Spawn tsserver on a thread of its own, since finding node and spawning
+        it take a while; <on_spawned> is then called on the UI thread
+        """
+        self.generation += 1
+        self.starting = True
+        self.started_event.clear()
+        start_thread = threading.Thread(target=self.__start, args=(self.generation, on_spawned))
+        start_thread.daemon = True
+        start_thread.start()
+
+    def __start(self, generation, on_spawned):
+        try:
+            self.spawn(generation)
+        finally:
+            if generation == self.generation:
+                self.starting = False
+                self.started_event.set()
+            # write what was posted while starting, or fail it if the spawn failed
+            self.loop.call_soon_threadsafe(self.__schedule_drain)
+        if on_spawned:
+            sublime.set_timeout(on_spawned, 0)
+
+    def spawn(self, generation):
+        node_path = global_vars.get_node_path() or NodeCommClient.find_node_path()
+        if not node_path:
+            return
+        global_vars._node_path = node_path
+        node_process_cmd, tsserver_env = self.get_server_cmd(node_path)
+        self.stderr_buffer = StderrBuffer(NodeCommClient.get_stderr_buffer_size())
+        spawn = asyncio.run_coroutine_threadsafe(
+            self.loop.subprocess_exec(lambda: _ServerProtocol(self, generation), *node_process_cmd, env=tsserver_env),
+            self.loop
+        )
+        try:
+            transport, _ = spawn.result()
+        except Exception as e:
+            log.error("Failed to start tsserver: {0}".format(e))
+            return
+        log.debug("server proc pid {0}".format(transport.get_pid()))
+
+    def on_connected(self, transport, generation):
+        # on the loop thread, before any output or exit of the process is seen
+        if generation != self.generation:
+            transport.kill()
+            return
+        self.start_time = time.time()
+        self.stdin = transport.get_pipe_transport(0)
+        self.transport = transport
+        self.server_proc = transport
+
+    def get_pid(self):
+        transport = self.transport
+        return transport.get_pid() if transport else None
+
+    def stop(self):
+        self.generation += 1
+        self.starting = False
+        self.started_event.set()
+        transport = self.transport
+        self.transport = None
+        self.stdin = None
+        self.server_proc = None
+        if transport:
+            self.loop.call_soon_threadsafe(transport.kill)
+        self.fail_pending_requests("server stopped")
+
+    def postCmd(self, cmd, seq=None, background_key=None):
+        accepted = super(AsyncioCommClient, self).postCmd(cmd, seq, background_key)
+        if accepted:
+            self.loop.call_soon_threadsafe(self.__schedule_drain)
+        return accepted
+
+    def __schedule_drain(self):
+        # commands posted within one loop iteration are written together
+        if not self.drain_scheduled:
+            self.drain_scheduled = True
+            self.loop.call_soon(self.__drain)
+
+    def __drain(self):
+        """Write everything the post queue lets through now, like the post thread of NodeCommClient"""
+        self.drain_scheduled = False
+        if self.drain_timer:
+            self.drain_timer.cancel()
+            self.drain_timer = None
+        if not self.stdin and self.starting:
+            # drained once the process is spawned, see __start
+            return
+        cmds = []
+        try:
+            while True:
+                cmds.append(self.postq.get_nowait())
+        except queue.Empty:
+            pass
+        if cmds and (not self.stdin or self.stdin.is_closing()):
+            log.error("can not send {0} command(s); node process not running".format(len(cmds)))
+            self.fail_pending_requests("not running")
+            return
+        if cmds:
+            self.stdin.write(("\n".join(cmds) + "\n").encode("utf-8"))
+            self.post_flush_count += 1
+            self.posted_cmd_count += len(cmds)
+            self.last_flush_size = len(cmds)
+        hold_time = self.postq.hold_time_left()
+        if hold_time is not None:
+            self.drain_timer = self.loop.call_later(hold_time, self.__schedule_drain)
+
+    def on_frame(self, body):
+        try:
+            if len(body) == 0:
+                log.info('Empty content in the message')
+            else:
+                NodeCommClient.dispatch_msg(body, self.pending_responses, self.asyncReq, self.event_handlers, self.postq)
+        finally:
+            body.release()
+        if self.postq.qsize():
+            # an answer may release held background requests
+            self.__schedule_drain()
+
+    def on_stderr(self, data):
+        if self.stderr_buffer:
+            self.stderr_buffer.append(data)
+
+    def on_exit(self, transport):
+        """Fail the requests the server will never answer, and start it again if asked to"""
+        if transport is None or transport is not self.transport:
+            # stopped, or the process of an earlier start
+            return
+        NodeCommClient.report_exit("server", self.stderr_buffer)
+        self.transport = None
+        self.stdin = None
+        self.server_proc = None
+        self.fail_pending_requests("server exited")
+        if not self.restart_on_exit or self.exiting:
+            return
+        if time.time() - self.start_time >= ServerClient.STABLE_RUN_TIME:
+            self.restart_delay = ServerClient.MIN_RESTART_DELAY
+        log.error("tsserver exited unexpectedly; restarting it in {0}s".format(self.restart_delay))
+        self.schedule_restart()
+
+    def schedule_restart(self):
+        delay = self.restart_delay
+        self.restart_delay = min(delay * 2, ServerClient.MAX_RESTART_DELAY)
+        sublime.set_timeout(self.restart, int(delay * 1000))
+
+    def restart(self):
+        if self.exiting or self.started():
+            return
+        self.start(self.on_restart_spawned)
+
+    def on_restart_spawned(self):
+        if self.exiting:
+            return
+        if not self.server_proc:
+            log.error("Failed to restart tsserver; trying again in {0}s".format(self.restart_delay))
+            self.schedule_restart()
+            return
+        self.restart_count += 1
+        log.info("tsserver restarted")
+        if self.on_restarted:
+            self.on_restarted()
+
+    def get_diagnostics(self):
+        lines = super(AsyncioCommClient, self).get_diagnostics()
+        if self.restart_on_exit:
+            lines.append("restarted after a crash: {0} times".format(self.restart_count))
+        return lines
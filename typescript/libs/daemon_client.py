@@ -0,0 +1,258 @@
+import errno
+import hashlib
+import os
+import socket
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+
+import sublime
+
+from .logger import log
+from .frame_reader import FrameReader
+from .node_client import NodeCommClient, ServerClient
+from .global_vars import IS_ST2, PLUGIN_DIR
+from . import global_vars
+
+
+def is_supported():
+    # the broker listens on a Unix domain socket and is detached with setsid
+    return not IS_ST2 and os.name != "nt"
+
+
+class _BrokerConnection(object):
+    """Stands in for the Popen object of a spawned server, so NodeCommClient can write to the socket"""
+
+    def __init__(self, sock, pid):
+        self.sock = sock
+        self.pid = pid
+        self.stdin = sock.makefile("wb")
+        self.stdout = sock.makefile("rb", buffering=0)
+
+    def poll(self):
+        return None
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class DaemonClient(NodeCommClient):
+    """
+    tsserver client connected to a per-user tsserver daemon
+
+    The daemon is tsserver_broker.js, a detached node process that runs tsserver
+    and serves any number of clients over a Unix domain socket; it keeps running
+    across plugin reloads and is shared by all Sublime Text instances that run
+    the same server command. A client only has to connect to find the program
+    built already. The broker is started on first use and exits once it has had
+    no client for 'tsserver_daemon_idle_minutes'.
+
+    Request seqs are rewritten by the broker, so requests can't be canceled.
+    The daemon outlives the plugin, so it doesn't report its heap either.
+
+    When the connection closes, e.g. because the broker exited with tsserver,
+    the requests it will never answer fail, and the client connects again,
+    spawning a new broker if needed, after the delays of ServerClient; then
+    'on_restarted' is called, as for ServerClient.
+    """
+    supports_cancellation = False
+    reports_heap = False
+
+    # seconds to wait for a newly spawned broker to accept connections
+    CONNECT_TIMEOUT = 10
+
+    def __init__(self, script_path):
+        super(DaemonClient, self).__init__(script_path)
+        self.socket_path = None
+
+        # called on the UI thread after the client connected again
+        self.on_restarted = None
+        self.restart_count = 0
+        self.restart_delay = ServerClient.MIN_RESTART_DELAY
+        self.connect_time = None
+        self.start()
+
+    def start(self, on_connected=None):
+        """
+        Connect on a thread of its own, since spawning the broker and waiting
+        for it to listen take a while; commands wait in the post queue
+        meanwhile. <on_connected> is then called on the UI thread.
+        """
+        self.starting = True
+        self.started_event.clear()
+        start_thread = threading.Thread(target=self.__start, args=(on_connected,))
+        start_thread.daemon = True
+        start_thread.start()
+
+    def __start(self, on_connected):
+        try:
+            self.connect_to_daemon()
+        finally:
+            self.starting = False
+            self.started_event.set()
+        if on_connected:
+            sublime.set_timeout(on_connected, 0)
+
+    def connect_to_daemon(self):
+        node_path = global_vars.get_node_path() or NodeCommClient.find_node_path()
+        if not node_path:
+            return
+        global_vars._node_path = node_path
+        node_process_cmd, tsserver_env = self.get_server_cmd(node_path)
+        self.socket_path = DaemonClient.get_socket_path(node_process_cmd)
+        if not self.socket_path:
+            return
+
+        sock = self.connect()
+        if sock is None:
+            self.spawn_broker(node_process_cmd, tsserver_env)
+            deadline = time.time() + DaemonClient.CONNECT_TIMEOUT
+            while sock is None and time.time() < deadline:
+                time.sleep(0.05)
+                sock = self.connect()
+        if sock is None:
+            log.error("Failed to connect to the tsserver daemon at {0}".format(self.socket_path))
+            return
+
+        connection = _BrokerConnection(sock, self.read_broker_pid())
+        self.server_proc = connection
+        self.connect_time = time.time()
+        log.debug("connected to the tsserver daemon at {0}".format(self.socket_path))
+        readerThread = threading.Thread(target=DaemonClient.__reader, args=(
+            connection.stdout, self.pending_responses, self.asyncReq, self.event_handlers, self.postq,
+            lambda: self.on_disconnected(connection)))
+        readerThread.daemon = True
+        readerThread.start()
+
+    def on_disconnected(self, connection):
+        """Fail the requests the daemon will never answer, and connect again after a delay"""
+        if self.exiting or connection is not self.server_proc:
+            # closed by stop(), or an earlier connection
+            return
+        self.server_proc = None
+        connection.close()
+        self.fail_pending_requests("tsserver daemon disconnected")
+        if time.time() - self.connect_time >= ServerClient.STABLE_RUN_TIME:
+            self.restart_delay = ServerClient.MIN_RESTART_DELAY
+        log.error("lost the connection to the tsserver daemon; connecting again in {0}s".format(self.restart_delay))
+        self.schedule_restart()
+
+    def schedule_restart(self):
+        delay = self.restart_delay
+        self.restart_delay = min(delay * 2, ServerClient.MAX_RESTART_DELAY)
+        sublime.set_timeout(self.restart, int(delay * 1000))
+
+    def restart(self):
+        if self.exiting or self.started():
+            return
+        self.start(self.on_restart_connected)
+
+    def on_restart_connected(self):
+        if self.exiting:
+            return
+        if not self.server_proc:
+            log.error("Failed to connect to the tsserver daemon; trying again in {0}s".format(self.restart_delay))
+            self.schedule_restart()
+            return
+        self.restart_count += 1
+        log.info("connected to the tsserver daemon again")
+        if self.on_restarted:
+            self.on_restarted()
+
+    def stop(self):
+        """Disconnect; the daemon keeps running for other clients until it is idle"""
+        connection = self.server_proc
+        self.server_proc = None
+        if connection:
+            connection.close()
+        self.fail_pending_requests("disconnected")
+
+    @staticmethod
+    def get_socket_path(node_process_cmd):
+        """One daemon per user and server command line, so different TypeScript versions don't share one"""
+        socket_dir = DaemonClient.get_socket_dir()
+        if not socket_dir:
+            return None
+        digest = hashlib.sha1("\0".join(node_process_cmd).encode("utf-8")).hexdigest()[:16]
+        return os.path.join(socket_dir, digest + ".sock")
+
+    @staticmethod
+    def get_socket_dir():
+        """
+        Return the directory of the daemon sockets, in XDG_RUNTIME_DIR if there
+        is one, else in the temp directory; None if it is not a directory that
+        only the current user can use, since whoever can write to it can put a
+        socket of their own in place of the daemon
+        """
+        runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+        if runtime_dir and os.path.isdir(runtime_dir):
+            socket_dir = os.path.join(runtime_dir, "sublime-tsserver")
+        else:
+            socket_dir = os.path.join(tempfile.gettempdir(), "sublime-tsserver-{0}".format(os.getuid()))
+        try:
+            os.mkdir(socket_dir, 0o700)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                log.error("Can not create the tsserver daemon directory {0}: {1}".format(socket_dir, e))
+                return None
+        dir_stat = os.lstat(socket_dir)
+        if not stat.S_ISDIR(dir_stat.st_mode) or dir_stat.st_uid != os.getuid() or stat.S_IMODE(dir_stat.st_mode) != 0o700:
+            log.error("Not using the tsserver daemon: {0} must be a directory owned by the current user with mode 0700".format(socket_dir))
+            return None
+        return socket_dir
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except (IOError, OSError):
+            sock.close()
+            return None
+        return sock
+
+    def spawn_broker(self, node_process_cmd, tsserver_env):
+        settings = sublime.load_settings('Preferences.sublime-settings')
+        idle_seconds = settings.get('tsserver_daemon_idle_minutes', 30) * 60
+        broker_path = os.path.join(PLUGIN_DIR, "typescript", "libs", "tsserver_broker.js")
+        broker_cmd = [node_process_cmd[0], broker_path, self.socket_path, str(idle_seconds), "--"] + node_process_cmd
+        log.debug("Spawning tsserver daemon: {0}".format(broker_cmd))
+        # detach from the plugin host so the daemon survives it; its stderr,
+        # and that of tsserver, goes to a log file next to the socket
+        with open(self.socket_path + ".log", "ab") as log_file:
+            subprocess.Popen(broker_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=log_file,
+                             env=tsserver_env, close_fds=True, start_new_session=True)
+
+    def read_broker_pid(self):
+        try:
+            with open(self.socket_path + ".pid") as pid_file:
+                return int(pid_file.read())
+        except (IOError, OSError, ValueError):
+            return None
+
+    def get_diagnostics(self):
+        lines = super(DaemonClient, self).get_diagnostics()
+        if self.socket_path:
+            lines.append("daemon socket: {0}".format(self.socket_path))
+            lines.append("daemon log: {0}.log".format(self.socket_path))
+        lines.append("connected again after losing the connection: {0} times".format(self.restart_count))
+        return lines
+
+    @staticmethod
+    def __reader(stream, pending_responses, asyncReq, eventHandlers, request_queue, on_disconnected):
+        """ Main function for reader thread """
+        reader = FrameReader()
+        while True:
+            try:
+                if NodeCommClient.read_msg(reader, stream, pending_responses, asyncReq, eventHandlers, request_queue):
+                    log.debug("tsserver daemon closed the connection")
+                    break
+            except (IOError, OSError):
+                log.debug("connection to the tsserver daemon closed")
+                break
+        on_disconnected()
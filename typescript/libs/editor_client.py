@@ -2,8 +2,16 @@
 import logging
 
 from .reference import RefInfo
-from .node_client import ServerClient, WorkerClient
+from .node_client import CommClient, NodeCommClient, ServerClient, SyntaxServerClient, WorkerClient
+from .async_client import AsyncioCommClient
+from . import async_client
+from .daemon_client import DaemonClient
+from . import daemon_client
+from .sharded_client import ShardedClient
+from .memory_watchdog import MemoryWatchdog
 from .service_proxy import ServiceProxy
+from .startup_profile import startup_profile
+from .event_dispatcher import event_dispatcher
 from .logger import log
 from .global_vars import *
 from . import global_vars
@@ -34,7 +42,9 @@ class EditorClient:
         self.tmpseq = 0
         self.node_client = None
         self.worker_client = None
+        self.syntax_client = None
         self.service = None
+        self.memory_watchdog = None
         self.initialized = False
 
         self.tab_size = 4
@@ -54,6 +64,7 @@ class EditorClient:
 
         # retrieve the path to tsserver.js
         # first see if user set the path to the file
+        startup_profile().start()
         settings = sublime.load_settings("Preferences.sublime-settings")
         tsdk_location = settings.get("typescript_tsdk")
         if tsdk_location:
@@ -66,13 +77,52 @@ class EditorClient:
         log.debug("Path of tsserver.js: " + proc_file)
         log.debug("Path of tsc.js: " + get_tsc_path())
 
-        self.node_client = ServerClient(proc_file)
-        self.worker_client = WorkerClient(proc_file)
-        self.service = ServiceProxy(self.worker_client, self.node_client)
+        if settings.get("tsserver_daemon", False) and not daemon_client.is_supported():
+            log.warning("the tsserver daemon needs Sublime Text 3 on Linux or OS X; starting tsserver for this instance only")
+        if settings.get("tsserver_daemon", False) and daemon_client.is_supported():
+            self.node_client = DaemonClient(proc_file)
+            self.node_client.on_restarted = self.on_server_restarted
+            self.worker_client = WorkerClient(proc_file)
+        elif settings.get("tsserver_sharding", False):
+            self.node_client = ShardedClient(proc_file, settings.get("tsserver_max_servers", 4), self.mark_for_reload)
+            self.worker_client = WorkerClient(proc_file)
+        elif settings.get("tsserver_client") == "asyncio" and async_client.is_available():
+            self.node_client = AsyncioCommClient(proc_file, restart_on_exit=True)
+            self.node_client.on_restarted = self.on_server_restarted
+            self.node_client.start()
+            self.worker_client = AsyncioCommClient(proc_file)
+        else:
+            if settings.get("tsserver_client") == "asyncio":
+                log.warning("asyncio is not available in this plugin host; using the threaded tsserver client")
+            self.node_client = ServerClient(proc_file, startup_profile())
+            self.node_client.on_restarted = self.on_server_restarted
+            self.worker_client = WorkerClient(proc_file)
+        if settings.get("tsserver_syntax_server", False):
+            self.syntax_client = SyntaxServerClient(proc_file)
+            self.syntax_client.on_restarted = self.on_syntax_server_restarted
+        else:
+            self.syntax_client = CommClient()
+        self.service = ServiceProxy(self.worker_client, self.node_client, self.syntax_client)
+
+        self.memory_watchdog = MemoryWatchdog(
+            {"server": self.node_client, "worker": self.worker_client},
+            settings.get("tsserver_memory_sample_seconds", 30),
+            self.on_memory_over_budget
+        )
+        self.memory_watchdog.start()
 
         settings.add_on_change("enable_language_service_for_javascript", self.load_language_service_setting_for_js)
         self.load_language_service_setting_for_js()
 
+        settings.add_on_change("tsserver_lazy_decode_threshold", self.load_lazy_decode_setting)
+        self.load_lazy_decode_setting()
+
+        settings.add_on_change("tsserver_event_budget_ms", self.load_event_budget_setting)
+        self.load_event_budget_setting()
+
+        settings.add_on_change("tsserver_max_queued_requests", self.load_request_queue_setting)
+        self.load_request_queue_setting()
+
         # load formatting settings and set callbacks for setting changes
         for setting_name in [
             'tab_size',
@@ -91,6 +141,21 @@ class EditorClient:
         settings = sublime.load_settings('Preferences.sublime-settings')
         self.enable_language_service_for_js = settings.get("enable_language_service_for_javascript", True)
 
+    def load_lazy_decode_setting(self):
+        settings = sublime.load_settings('Preferences.sublime-settings')
+        NodeCommClient.lazy_decode_threshold = settings.get("tsserver_lazy_decode_threshold", 4 * 1024 * 1024)
+
+    def load_event_budget_setting(self):
+        settings = sublime.load_settings('Preferences.sublime-settings')
+        event_dispatcher().budget_ms = settings.get("tsserver_event_budget_ms", 10)
+
+    def load_request_queue_setting(self):
+        settings = sublime.load_settings('Preferences.sublime-settings')
+        max_depth = settings.get("tsserver_max_queued_requests", 16)
+        self.node_client.set_max_queued_requests(max_depth)
+        self.worker_client.set_max_queued_requests(max_depth)
+        self.syntax_client.set_max_queued_requests(max_depth)
+
     def load_format_settings(self):
         settings = sublime.load_settings('Preferences.sublime-settings')
         self.tab_size = settings.get('tab_size', 4)
@@ -101,15 +166,21 @@ class EditorClient:
         self.auto_match_enabled = settings.get("auto_match_enabled")
         self.set_features()
 
-    def set_features(self):
-        host_info = "Sublime Text version " + str(sublime.version())
+    def get_format_options(self):
         # Preferences Settings
-        format_options = {
+        return {
             "tabSize": self.tab_size,
             "indentSize": self.indent_size,
             "convertTabsToSpaces": self.translate_tab_to_spaces
         }
-        self.service.configure(host_info, None, format_options)
+
+    def set_features(self):
+        host_info = "Sublime Text version " + str(sublime.version())
+        format_options = self.get_format_options()
+        on_configured = None
+        if isinstance(self.node_client, ServerClient):
+            on_configured = lambda response_dict: startup_profile().mark("response")
+        self.service.configure(host_info, None, format_options, on_configured)
 
     # ref info is for Find References view
     # TODO: generalize this so that there can be multiple
@@ -138,6 +209,43 @@ class EditorClient:
             client_info = self.file_map[filename]
         return client_info
 
+    def on_server_restarted(self):
+        """Replay the configuration and the open buffers on a server that was restarted after a crash"""
+        from .view_helpers import reopen_files
+        self.set_features()
+        reopen_files()
+
+    def on_syntax_server_restarted(self):
+        """
+        Replay the configuration and the open buffers on the syntax server only:
+        the main server and the worker lost nothing when it crashed
+        """
+        from .view_helpers import reopen_files_on_syntax_server
+        host_info = "Sublime Text version " + str(sublime.version())
+        self.service.configure_on_syntax_server(host_info, None, self.get_format_options())
+        reopen_files_on_syntax_server()
+
+    def on_memory_over_budget(self, name):
+        """Give memory back from a tsserver process that grew past its budget"""
+        from .view_helpers import close_background_files, restart_worker
+        if name == "worker":
+            log.warning("restarting the tsserver worker to release its memory")
+            restart_worker()
+            return
+        closed = close_background_files()
+        if closed:
+            log.warning("closed {0} files not shown in any window to release tsserver memory".format(len(closed)))
+        else:
+            log.warning("tsserver is over its memory budget, but every open file is shown")
+
+    def mark_for_reload(self, file_names):
+        """Send the buffers of <file_names> to the server again before their next request"""
+        from .view_helpers import forget_synced_text
+        for file_name in file_names:
+            self.get_or_add_file(file_name).pending_changes = True
+            # the server opened them again from disk
+            forget_synced_text(file_name)
+
     def has_errors(self, filename):
         client_info = self.get_or_add_file(filename)
         return len(client_info.errors['syntacticDiag']) > 0 or len(client_info.errors['semanticDiag']) > 0
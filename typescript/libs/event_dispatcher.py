@@ -0,0 +1,101 @@
+import collections
+import sublime
+import threading
+import time
+
+from .logger import log
+
+
+class EventDispatcher():
+
+    """ Delivers tsserver events to their handlers on the UI thread in batches
+
+    Events arrive on the reader threads. Scheduling one UI callback per event
+    lets a project wide 'geterr' flood the UI thread with thousands of
+    callbacks that all run back to back, freezing the editor while they do.
+
+    Instead, events are queued here and the UI thread drains the queue in
+    ticks: each tick runs handlers until 'budget_ms' milliseconds have passed,
+    then yields so that input and drawing can happen before the next tick.
+
+    Diagnostic events describe the complete state of one file, so a newer
+    one for the same file replaces an older one that is still queued, and
+    only the latest diagnostics are ever rendered. The main server, the
+    worker and the syntax server share the dispatcher but each has its own
+    handler lists, so only events from the same server supersede each other.
+    """
+
+    # events for which only the latest one per file matters
+    SUPERSEDING_EVENTS = ("syntaxDiag", "semanticDiag", "suggestionDiag")
+
+    # delay between two ticks, in milliseconds
+    TICK_INTERVAL = 1
+
+    def __init__(self, budget_ms=10):
+        self.budget_ms = budget_ms
+        self.lock = threading.Lock()
+        # keys of the queued events in arrival order, and the events by key
+        self.order = collections.deque()
+        self.pending = {}
+        self.next_key = 0
+        self.scheduled = False
+
+        self.dispatched_count = 0
+        self.superseded_count = 0
+
+    def post(self, event_name, handlers, data_dict):
+        """Queue <data_dict> for <handlers>; may be called from any thread"""
+        key = self.get_key(event_name, handlers, data_dict)
+        with self.lock:
+            if key is None:
+                key = self.next_key
+                self.next_key += 1
+            if key in self.pending:
+                # keep the place of the older event in the queue
+                self.superseded_count += 1
+            else:
+                self.order.append(key)
+            self.pending[key] = (list(handlers), data_dict)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        sublime.set_timeout(self.drain, 0)
+
+    def get_key(self, event_name, handlers, data_dict):
+        if event_name not in EventDispatcher.SUPERSEDING_EVENTS:
+            return None
+        body = data_dict.get("body")
+        file = body.get("file") if body else None
+        # the handler list of a client lives as long as the client
+        return (id(handlers), event_name, file) if file else None
+
+    def drain(self):
+        """Run queued handlers on the UI thread until the budget is used up"""
+        deadline = time.time() + self.budget_ms / 1000.0
+        while True:
+            with self.lock:
+                if not self.order:
+                    self.scheduled = False
+                    return
+                key = self.order.popleft()
+                handlers, data_dict = self.pending.pop(key)
+            for cb in handlers:
+                try:
+                    cb(data_dict)
+                except Exception:
+                    log.exception("Error in handler of tsserver event")
+            self.dispatched_count += 1
+            if time.time() >= deadline:
+                break
+        sublime.set_timeout(self.drain, EventDispatcher.TICK_INTERVAL)
+
+    def queue_length(self):
+        with self.lock:
+            return len(self.order)
+
+
+_default_dispatcher = EventDispatcher()
+
+
+def event_dispatcher():
+    return _default_dispatcher
@@ -0,0 +1,181 @@
+import io
+import logging
+import os
+import re
+
+# the logger of logger.py; this module doesn't import the plugin, so that it
+# can be benchmarked outside Sublime Text (see benchmarks/)
+log = logging.getLogger('TS')
+
+# bodies are handed out as views of the buffer where views can be released;
+# the Python 2.6 of Sublime Text 2 has no memoryview, so they are copied there
+try:
+    _USE_VIEWS = hasattr(memoryview, "release")
+except NameError:
+    _USE_VIEWS = False
+
+
+class FrameReader(object):
+    """
+    Incremental parser for the Content-Length framed messages written by tsserver
+
+    Data is read from the pipe in large chunks into one reusable bytearray, and
+    complete message bodies are handed out as memoryview slices of that buffer,
+    so a body is never copied before it is decoded. A returned body must be
+    released with release_body (or simply dropped) before the reader is filled
+    again, because a bytearray can't be resized while views of it are alive.
+    Without memoryview (Sublime Text 2), bodies are bytes copies instead.
+
+    Data can either be pulled from a stream with 'fill' or pushed with 'feed'.
+    """
+
+    CONTENT_LENGTH_HEADER = b"Content-Length: "
+    HEADER_END = b"\r\n\r\n"
+    LINE_BREAK_BYTES = (10, 13)
+
+    def __init__(self, chunk_size=65536, max_idle_size=1048576):
+        self.chunk_size = chunk_size
+        # the buffer is given back when it is empty and has grown past this
+        # size, unless the last body needed that much: then the next one may too
+        self.max_idle_size = max_idle_size
+        self.buffer = bytearray(chunk_size)
+        # buffer[start:end] holds the bytes that have been read but not consumed
+        self.start = 0
+        self.end = 0
+        # length of the body whose header has already been consumed, if any
+        self.body_length = None
+        self.last_body_length = 0
+
+    def fill(self, stream):
+        """
+        Read the bytes currently available on <stream> into the buffer.
+        Return the number of bytes read; 0 means the stream is closed.
+        """
+        needed = self.chunk_size
+        if self.body_length is not None:
+            # the rest of the body, or a chunk if there is room for one: at the
+            # end of a big body, the buffer isn't grown just to read the next header
+            remaining = self.body_length - (self.end - self.start)
+            needed = max(remaining, min(needed, len(self.buffer) - self.end))
+        self._reserve(needed)
+
+        if _USE_VIEWS and isinstance(stream, io.RawIOBase):
+            view = memoryview(self.buffer)
+            try:
+                count = stream.readinto(view[self.end:]) or 0
+            finally:
+                view.release()
+            self.end += count
+            return count
+
+        data = os.read(stream.fileno(), needed)
+        self.feed(data)
+        return len(data)
+
+    def feed(self, data):
+        """Append <data> to the buffer"""
+        self._reserve(len(data))
+        self.buffer[self.end:self.end + len(data)] = data
+        self.end += len(data)
+
+    def next_frame(self):
+        """
+        Return a memoryview over the body of the next complete message (bytes
+        without memoryview), or None if more data has to be read first
+        """
+        if self.body_length is None:
+            # skip the line breaks tsserver writes after each body
+            buf = self.buffer
+            while self.start < self.end and buf[self.start] in FrameReader.LINE_BREAK_BYTES:
+                self.start += 1
+            header_end = buf.find(FrameReader.HEADER_END, self.start, self.end)
+            if header_end < 0:
+                self._reset_if_empty()
+                return None
+            self.body_length = self._parse_content_length(bytes(buf[self.start:header_end]))
+            self.start = header_end + len(FrameReader.HEADER_END)
+
+        if self.end - self.start < self.body_length:
+            return None
+
+        body_start = self.start
+        self.start += self.body_length
+        self.last_body_length = self.body_length
+        self.body_length = None
+        if not _USE_VIEWS:
+            return bytes(self.buffer[body_start:self.start])
+        return memoryview(self.buffer)[body_start:self.start]
+
+    def _parse_content_length(self, header):
+        for line in header.split(b"\r\n"):
+            if line.startswith(FrameReader.CONTENT_LENGTH_HEADER):
+                return int(line[len(FrameReader.CONTENT_LENGTH_HEADER):])
+        log.info('No Content-Length in header: {0}'.format(header))
+        return 0
+
+    def _reserve(self, size):
+        """Make sure there is room for <size> more bytes after the unconsumed data"""
+        self._reset_if_empty()
+        if len(self.buffer) - self.end >= size:
+            return
+        unconsumed = self.end - self.start
+        if len(self.buffer) >= unconsumed + size:
+            # move the unconsumed bytes to the front of the buffer
+            self.buffer[:unconsumed] = self.buffer[self.start:self.end]
+        else:
+            # grow geometrically so a big body doesn't cause many reallocations;
+            # a new buffer only copies the unconsumed bytes, where extending
+            # the old one would copy all of it and a zeroed extension as well
+            buffer = bytearray(max(unconsumed + size, 2 * len(self.buffer)))
+            buffer[:unconsumed] = self.buffer[self.start:self.end]
+            self.buffer = buffer
+        self.start = 0
+        self.end = unconsumed
+
+    def _reset_if_empty(self):
+        if self.start == self.end:
+            self.start = 0
+            self.end = 0
+            if len(self.buffer) > self.max_idle_size and self.last_body_length <= self.max_idle_size:
+                self.buffer = bytearray(self.chunk_size)
+
+
+def release_body(body):
+    """Release a body returned by FrameReader.next_frame"""
+    if _USE_VIEWS:
+        body.release()
+
+
+# tsserver serializes the message header fields before the body
+_PEEK_SIZE = 256
+_TYPE_PATTERN = re.compile(b'"type":"(response|event)"')
+_REQUEST_SEQ_PATTERN = re.compile(b'"request_seq":(\\d+)')
+_EVENT_PATTERN = re.compile(b'"event":"([^"]+)"')
+_BODY_KEY = b'"body":'
+
+
+def peek_header(body):
+    """
+    Extract (type, request_seq, event) from the leading bytes of a message
+    body without decoding it. request_seq is None for events and event is
+    None for responses. Return None if the fields can't be found cheaply,
+    in which case the caller has to decode the whole message.
+    """
+    head = bytes(body[:_PEEK_SIZE])
+    body_key_pos = head.find(_BODY_KEY)
+    limit = body_key_pos if body_key_pos >= 0 else len(head)
+
+    def search(pattern):
+        match = pattern.search(head, 0, limit)
+        return match.group(1) if match else None
+
+    msg_type = search(_TYPE_PATTERN)
+    if msg_type == b"response":
+        request_seq = search(_REQUEST_SEQ_PATTERN)
+        if request_seq is not None:
+            return "response", int(request_seq), None
+    elif msg_type == b"event":
+        event_name = search(_EVENT_PATTERN)
+        if event_name is not None:
+            return "event", None, event_name.decode("utf-8")
+    return None
@@ -0,0 +1,37 @@
+// Preloaded into tsserver with --require to report its V8 heap to the plugin.
+//
+// Every TSSERVER_HEAP_REPORT_SECONDS seconds the heap used, the heap allocated
+// and the heap limit, in bytes, are written as JSON to the file named by
+// TSSERVER_HEAP_REPORT. The resident set size seen from outside the process
+// also counts code, buffers and other memory V8 doesn't manage, so only the
+// process itself can tell how close it is to running out of heap.
+"use strict";
+
+var fs = require("fs");
+var v8 = require("v8");
+
+var reportPath = process.env.TSSERVER_HEAP_REPORT;
+var intervalSeconds = Number(process.env.TSSERVER_HEAP_REPORT_SECONDS) || 30;
+// processes started by tsserver don't report to the same file
+delete process.env.TSSERVER_HEAP_REPORT;
+delete process.env.TSSERVER_HEAP_REPORT_SECONDS;
+
+function report() {
+    var stats = v8.getHeapStatistics();
+    var tmpPath = reportPath + ".tmp";
+    try {
+        fs.writeFileSync(tmpPath, JSON.stringify({
+            used: stats.used_heap_size,
+            total: stats.total_heap_size,
+            limit: stats.heap_size_limit
+        }));
+        fs.renameSync(tmpPath, reportPath);
+    } catch (e) {
+        // the plugin only misses a sample
+    }
+}
+
+if (reportPath) {
+    report();
+    setInterval(report, intervalSeconds * 1000).unref();
+}
@@ -1,8 +1,50 @@
 import json
+import re
+
+# orjson is much faster than the json module but is not part of the plugin
+# host; use it when it has been installed and the json module otherwise
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_encode_string = json.encoder.encode_basestring_ascii
+
+# requests sent on most keystrokes, as format strings with their string and
+# integer arguments; see encode_request
+_REQUEST_TEMPLATES = {
+    "change": (
+        '{{"command": "change", "seq": {seq}, "type": "request", "arguments": '
+        '{{"file": {file}, "line": {line}, "offset": {offset}, "endLine": {endLine}, '
+        '"endOffset": {endOffset}, "insertString": {insertString}}}}}',
+        ("file", "insertString"),
+        ("line", "offset", "endLine", "endOffset")
+    ),
+    "completions": (
+        '{{"command": "completions", "seq": {seq}, "type": "request", "arguments": '
+        '{{"file": {file}, "line": {line}, "offset": {offset}, "prefix": {prefix}}}}}',
+        ("file", "prefix"),
+        ("line", "offset")
+    ),
+    "signatureHelp": (
+        '{{"command": "signatureHelp", "seq": {seq}, "type": "request", "arguments": '
+        '{{"file": {file}, "line": {line}, "offset": {offset}, "prefix": {prefix}}}}}',
+        ("file", "prefix"),
+        ("line", "offset")
+    ),
+    "quickinfo": (
+        '{{"command": "quickinfo", "seq": {seq}, "type": "request", "arguments": '
+        '{{"file": {file}, "line": {line}, "offset": {offset}}}}}',
+        ("file",),
+        ("line", "offset")
+    )
+}
 
 
 class ObjectJSONEncoder(json.JSONEncoder):
     def default(self, obj):
+        if isinstance(obj, LazyJSONObject):
+            return obj.to_dict()
         if isinstance(obj, object):
             # filter out properties with None value
             return dict((key, value) for (key, value) in obj.__dict__.items() if not value is None)
@@ -10,9 +52,228 @@ class ObjectJSONEncoder(json.JSONEncoder):
 
 
 def encode(obj):
+    # plain dicts and lists, which is what requests are made of, don't need the
+    # custom encoder; only fall back to it for payloads holding other objects
+    try:
+        if orjson is not None:
+            return orjson.dumps(obj).decode("utf-8")
+        return json.dumps(obj)
+    except TypeError:
+        pass
     json_str = json.dumps(obj, cls=ObjectJSONEncoder)
     return json_str
 
 
+def encode_request(req_dict):
+    """
+    Encode a request created by ServiceProxy.create_req_dict. Without orjson,
+    requests with a template are formatted directly when their arguments have
+    the expected types; all others go through encode.
+    """
+    template = _REQUEST_TEMPLATES.get(req_dict["command"])
+    args = req_dict.get("arguments")
+    if template is None or args is None or orjson is not None:
+        return encode(req_dict)
+    format_str, string_names, int_names = template
+    if len(args) != len(string_names) + len(int_names):
+        return encode(req_dict)
+    values = {}
+    try:
+        for name in string_names:
+            values[name] = _encode_string(args[name])
+        for name in int_names:
+            value = args[name]
+            if type(value) is not int:
+                return encode(req_dict)
+            values[name] = value
+    except (KeyError, TypeError):
+        return encode(req_dict)
+    return format_str.format(seq=req_dict["seq"], **values)
+
+
 def decode(json_str):
-    return json.loads(json_str)
\ No newline at end of file
+    if orjson is not None:
+        return orjson.loads(json_str)
+    return json.loads(json_str)
+
+
+def backend_name():
+    return "orjson" if orjson is not None else "json"
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+# text up to the next bracket outside of a string
+_TO_BRACKET = re.compile(r'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*')
+
+
+def _skip_whitespace(json_str, pos):
+    return _WHITESPACE.match(json_str, pos).end()
+
+
+def _skip_container(json_str, pos):
+    """Return the position after the object or array starting at <pos>, without decoding it"""
+    depth = 0
+    while True:
+        pos = _TO_BRACKET.match(json_str, pos).end()
+        if pos >= len(json_str) or json_str[pos] == '"':
+            raise ValueError("Unterminated object or array at {0}".format(pos))
+        depth += 1 if json_str[pos] in "{[" else -1
+        pos += 1
+        if depth == 0:
+            return pos
+
+
+class LazyJSONObject(object):
+    """
+    A JSON object that is decoded from <json_str> on demand, starting at <start>
+
+    Members are decoded in document order only as far as needed to answer a
+    lookup. An array member can instead be consumed one element at a time with
+    'iter_items', so its decoded elements are never all held at once; such a
+    member is streamed only once and can't be looked up afterwards, and no
+    other member can be looked up while the iteration is in progress.
+    """
+
+    def __init__(self, json_str, start=0):
+        pos = _skip_whitespace(json_str, start)
+        if json_str[pos] != '{':
+            raise ValueError("Expecting '{{' at {0}".format(pos))
+        self._json_str = json_str
+        self._pos = pos + 1
+        self._members = {}
+        self._streamed = set()
+        self._streaming = False
+
+    def __getitem__(self, key):
+        self._decode_until(key)
+        return self._members[key]
+
+    def __contains__(self, key):
+        self._decode_until(key)
+        return key in self._members
+
+    def get(self, key, default=None):
+        self._decode_until(key)
+        return self._members.get(key, default)
+
+    def __len__(self):
+        return len(self.to_dict()) + len(self._streamed)
+
+    def __bool__(self):
+        # only look as far as the first member
+        if self._members or self._streamed:
+            return True
+        if self._json_str is None:
+            return False
+        return self._json_str[_skip_whitespace(self._json_str, self._pos)] != '}'
+
+    __nonzero__ = __bool__
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def to_dict(self):
+        """Decode all remaining members and return them as a dict"""
+        self._decode_until(None)
+        return self._members
+
+    def iter_items(self, key):
+        """Yield the elements of the array member <key> one at a time"""
+        self._decode_until(key, stop_before=True)
+        if key in self._members or self._json_str is None:
+            for item in self._members.get(key) or []:
+                yield item
+            return
+
+        json_str = self._json_str
+        pos = self._pos
+        if json_str[pos] != '[':
+            # not an array (e.g. null); nothing to stream
+            self._members[key] = self._read_value()
+            for item in self._members[key] or []:
+                yield item
+            return
+
+        self._streamed.add(key)
+        self._streaming = True
+        try:
+            pos = _skip_whitespace(json_str, pos + 1)
+            if json_str[pos] != ']':
+                while True:
+                    item, pos = _decoder.raw_decode(json_str, pos)
+                    yield item
+                    pos = _skip_whitespace(json_str, pos)
+                    if json_str[pos] == ',':
+                        pos = _skip_whitespace(json_str, pos + 1)
+                    elif json_str[pos] == ']':
+                        break
+                    else:
+                        raise ValueError("Expecting ',' or ']' at {0}".format(pos))
+            self._pos = pos + 1
+        finally:
+            self._streaming = False
+
+    def _decode_until(self, key, stop_before=False):
+        """
+        Decode members until <key> has been decoded, or until the object ends.
+        With <stop_before>, stop right before the value of <key> instead.
+        """
+        if self._streaming:
+            raise ValueError("Can't look up members while a member is being streamed")
+        if key in self._streamed:
+            raise KeyError("{0} has already been streamed".format(key))
+        while self._json_str is not None and (key is None or key not in self._members):
+            name = self._read_name()
+            if name is None:
+                break
+            if stop_before and name == key:
+                return
+            self._members[name] = self._read_value()
+
+    def _read_name(self):
+        """Advance to the next member and return its name; None at the end of the object"""
+        json_str = self._json_str
+        pos = _skip_whitespace(json_str, self._pos)
+        if json_str[pos] == ',':
+            pos = _skip_whitespace(json_str, pos + 1)
+        if json_str[pos] == '}':
+            # everything has been decoded; let go of the text
+            self._json_str = None
+            return None
+        name, pos = _decoder.raw_decode(json_str, pos)
+        pos = _skip_whitespace(json_str, pos)
+        if json_str[pos] != ':':
+            raise ValueError("Expecting ':' at {0}".format(pos))
+        self._pos = _skip_whitespace(json_str, pos + 1)
+        return name
+
+    def _read_value(self):
+        value, self._pos = _decoder.raw_decode(self._json_str, self._pos)
+        return value
+
+
+def decode_lazy(json_str):
+    """
+    Decode a tsserver message but keep an object body as a LazyJSONObject.
+    The other members are decoded as usual; the body is only skipped over, by
+    its brackets, to reach the members after it (e.g. metadata).
+    """
+    message = LazyJSONObject(json_str)
+    result = {}
+    while True:
+        name = message._read_name()
+        if name is None:
+            return result
+        if name == "body" and json_str[message._pos] == '{':
+            result[name] = LazyJSONObject(json_str, message._pos)
+            message._pos = _skip_container(json_str, message._pos)
+            continue
+        result[name] = message._read_value()
+
+
+def iter_items(obj, key):
+    """Iterate the array member <key> of either a dict or a LazyJSONObject"""
+    if isinstance(obj, LazyJSONObject):
+        return obj.iter_items(key)
+    return iter(obj.get(key) or [])
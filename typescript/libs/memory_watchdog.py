@@ -0,0 +1,197 @@
+import collections
+import json
+import os
+import re
+import time
+import sublime
+
+from .logger import log
+
+# number of samples kept per process to compute the memory trend
+TREND_SAMPLES = 20
+# samples taken after acting on a process before it is acted on again
+COOLDOWN_SAMPLES = 3
+# bounds of the heap size derived for tsserver, in megabytes
+MIN_HEAP_MB = 1024
+MAX_HEAP_MB = 8192
+# files visited at most when estimating the size of the project sources
+MAX_SCANNED_FILES = 20000
+SOURCE_EXTENSIONS = (".ts", ".tsx", ".js", ".jsx")
+
+_project_size_cache = {}
+
+
+def get_total_memory_mb():
+    """Return the physical memory of the machine in megabytes, or None if unknown"""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def get_project_source_mb(folders):
+    """
+    Return the size in megabytes of the sources under <folders>, skipping
+    node_modules and hidden directories; the walk stops after MAX_SCANNED_FILES
+    """
+    key = tuple(sorted(folders))
+    if key in _project_size_cache:
+        return _project_size_cache[key]
+    total = 0
+    scanned = 0
+    for folder in folders:
+        if scanned >= MAX_SCANNED_FILES:
+            break
+        for root, dirs, files in os.walk(folder):
+            dirs[:] = [d for d in dirs if d != "node_modules" and not d.startswith(".")]
+            for name in files:
+                if name.endswith(SOURCE_EXTENSIONS):
+                    try:
+                        total += os.path.getsize(os.path.join(root, name))
+                    except OSError:
+                        pass
+                scanned += 1
+            if scanned >= MAX_SCANNED_FILES:
+                break
+    _project_size_cache[key] = total / (1024.0 * 1024.0)
+    return _project_size_cache[key]
+
+
+def get_default_heap_mb(node_default_mb):
+    """
+    Derive a --max-old-space-size for tsserver from the size of the open
+    projects, about 64MB of heap per MB of source on top of MIN_HEAP_MB, capped
+    at half of the machine memory. Return None when that is no more than
+    <node_default_mb>, the heap limit node picks by itself, or when that limit
+    is unknown: a smaller heap would only make the server run out sooner.
+    """
+    if not node_default_mb:
+        return None
+    folders = [folder for window in sublime.windows() for folder in window.folders()]
+    heap_mb = MIN_HEAP_MB + int(64 * get_project_source_mb(folders))
+    total_mb = get_total_memory_mb()
+    if total_mb:
+        heap_mb = min(heap_mb, total_mb // 2)
+    # round to a multiple of 256MB, so small changes of the project don't change the command line
+    heap_mb = min(heap_mb, MAX_HEAP_MB) // 256 * 256
+    return heap_mb if heap_mb > node_default_mb else None
+
+
+def read_heap_report(report_file):
+    """
+    Return the heap used and the heap limit, in megabytes, from the report
+    heap_reporter.js writes for a tsserver process, or None if there is none
+    """
+    try:
+        with open(report_file) as f:
+            report = json.load(f)
+        return report["used"] / (1024.0 * 1024.0), report["limit"] / (1024.0 * 1024.0)
+    except (IOError, OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def get_heap_arg(node_args):
+    """Return the --max-old-space-size in <node_args> in megabytes, or None"""
+    for arg in node_args:
+        match = re.match(r"--max[-_]old[-_]space[-_]size=(\d+)$", arg)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+class MemoryWatchdog(object):
+    """
+    Samples the V8 heap of the tsserver processes every <interval> seconds and
+    keeps the recent samples to show their trend. When the heap used by a
+    process grows past its budget, <on_over_budget> is called with its name so
+    that memory can be given back before the server runs out of heap; it isn't
+    called again for that process until COOLDOWN_SAMPLES more samples have been
+    taken.
+
+    <clients> maps a process name to its client; a client that is not running,
+    or doesn't report its heap (see heap_reporter.js), is skipped.
+    """
+
+    def __init__(self, clients, interval, on_over_budget):
+        self.clients = clients
+        self.interval = interval
+        self.on_over_budget = on_over_budget
+        self.samples = dict((name, collections.deque(maxlen=TREND_SAMPLES)) for name in clients)
+        self.limits = dict((name, None) for name in clients)
+        self.cooldown = dict((name, 0) for name in clients)
+        self.over_budget_count = dict((name, 0) for name in clients)
+        self.running = False
+
+    def start(self):
+        if self.running or not self.interval:
+            return
+        self.running = True
+        sublime.set_timeout(self.tick, int(self.interval * 1000))
+
+    def stop(self):
+        self.running = False
+
+    def tick(self):
+        if not self.running:
+            return
+        self.sample()
+        sublime.set_timeout(self.tick, int(self.interval * 1000))
+
+    def sample(self):
+        now = time.time()
+        for name, client in self.clients.items():
+            heap = client.get_heap_usage() if client.started() else None
+            if heap is None:
+                self.samples[name].clear()
+                continue
+            used_mb, limit_mb = heap
+            self.samples[name].append((now, used_mb))
+            self.limits[name] = limit_mb
+            if self.cooldown[name] > 0:
+                self.cooldown[name] -= 1
+                continue
+            budget_mb = self.get_budget_mb(limit_mb)
+            if budget_mb and used_mb > budget_mb:
+                log.warning("tsserver {0} uses {1:.0f}MB of heap, over its budget of {2:.0f}MB".format(name, used_mb, budget_mb))
+                self.over_budget_count[name] += 1
+                self.cooldown[name] = COOLDOWN_SAMPLES
+                self.on_over_budget(name)
+
+    @staticmethod
+    def get_budget_mb(limit_mb):
+        """
+        The budget is the 'tsserver_memory_budget_mb' setting; by default it is
+        90% of the heap limit reported by the server
+        """
+        settings = sublime.load_settings('Preferences.sublime-settings')
+        budget_mb = settings.get("tsserver_memory_budget_mb")
+        if budget_mb is None and limit_mb:
+            budget_mb = limit_mb * 0.9
+        return budget_mb
+
+    def get_trend(self, name):
+        """Return the growth of the heap used by <name> over the kept samples, in MB per minute"""
+        samples = self.samples[name]
+        if len(samples) < 2:
+            return None
+        (first_time, first_mb), (last_time, last_mb) = samples[0], samples[-1]
+        return (last_mb - first_mb) * 60 / (last_time - first_time)
+
+    def get_diagnostics(self):
+        if not self.running:
+            return ["not running"]
+        lines = []
+        for name in self.clients:
+            samples = self.samples[name]
+            if not samples:
+                lines.append("{0}: no sample".format(name))
+                continue
+            trend = self.get_trend(name)
+            budget_mb = self.get_budget_mb(self.limits[name])
+            lines.append("{0}: {1:.0f}MB of heap used of {2:.0f}MB, peak {3:.0f}MB, {4} over the last {5} samples, budget {6}, exceeded {7} times".format(
+                name, samples[-1][1], self.limits[name], max(used_mb for (_, used_mb) in samples),
+                "{0:+.1f}MB/min".format(trend) if trend is not None else "no trend",
+                len(samples),
+                "{0:.0f}MB".format(budget_mb) if budget_mb else "none",
+                self.over_budget_count[name]))
+        return lines
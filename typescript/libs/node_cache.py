@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import sublime
+
+from .logger import log
+from .global_vars import IS_ST2, PLUGIN_NAME
+
+# Finding node means scanning every directory of PATH, and its version and
+# default heap limit mean running it; they are remembered across sessions in
+# the cache directory of Sublime Text, by the PATH they were found with and by
+# the modification time of the executable.
+#
+# The same directory holds the V8 compile cache of tsserver.js (NODE_COMPILE_CACHE,
+# node 22.1 and later), one subdirectory per node version and tsserver.js.
+
+_cache = None
+# servers are started on threads of their own
+_lock = threading.RLock()
+# whether the compile cache has been trimmed in this session
+_compile_cache_trimmed = False
+
+
+def get_cache_file():
+    # Sublime Text 2 has no cache directory
+    if IS_ST2:
+        return None
+    return os.path.join(sublime.cache_path(), PLUGIN_NAME, "node.json")
+
+
+def load():
+    global _cache
+    if _cache is None:
+        _cache = {"node_paths": {}, "node_versions": {}}
+        cache_file = get_cache_file()
+        if cache_file and os.path.isfile(cache_file):
+            try:
+                with open(cache_file) as f:
+                    _cache.update(json.load(f))
+            except (IOError, OSError, ValueError) as e:
+                log.debug("ignoring the node cache: {0}".format(e))
+    return _cache
+
+
+def save():
+    cache_file = get_cache_file()
+    if not cache_file:
+        return
+    try:
+        if not os.path.isdir(os.path.dirname(cache_file)):
+            os.makedirs(os.path.dirname(cache_file))
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(_cache, f)
+        os.replace(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        log.debug("can not write the node cache: {0}".format(e))
+
+
+def get_path_key():
+    return os.environ.get("PATH", "") + os.pathsep + os.environ.get("NVM_BIN", "")
+
+
+def get_mtime(node_path):
+    try:
+        return os.path.getmtime(node_path)
+    except OSError:
+        return None
+
+
+def get_node_path(is_executable):
+    """Return the node executable found before with the current PATH, if it is still there"""
+    with _lock:
+        node_path = load()["node_paths"].get(get_path_key())
+    if node_path and is_executable(node_path):
+        return node_path
+    return None
+
+
+def set_node_path(node_path):
+    with _lock:
+        load()["node_paths"][get_path_key()] = node_path
+        save()
+
+
+def get_node_output(node_path, section, args):
+    """
+    Return the output of running <node_path> with <args>, or None if it can't
+    be run; the output is kept in <section> of the cache
+    """
+    if IS_ST2:
+        return None
+    mtime = get_mtime(node_path)
+    with _lock:
+        cached = load().setdefault(section, {}).get(node_path)
+    if cached and mtime is not None and cached[0] == mtime:
+        return cached[1]
+    startupinfo = None
+    if os.name == "nt":
+        startupinfo = subprocess.STARTUPINFO()
+        startupinfo.dwFlags |= subprocess.SW_HIDE | subprocess.STARTF_USESHOWWINDOW
+    try:
+        output = subprocess.check_output([node_path] + args, startupinfo=startupinfo).decode().strip()
+    except (OSError, subprocess.CalledProcessError) as e:
+        log.debug("can not run {0} {1}: {2}".format(node_path, " ".join(args), e))
+        return None
+    if mtime is not None:
+        with _lock:
+            _cache[section][node_path] = [mtime, output]
+            save()
+    return output
+
+
+def get_node_version(node_path):
+    """Return the output of 'node --version', or None if it can't be run"""
+    return get_node_output(node_path, "node_versions", ["--version"])
+
+
+def get_node_heap_limit_mb(node_path):
+    """Return the default heap limit of <node_path> in megabytes, or None if unknown"""
+    output = get_node_output(node_path, "node_heap_limits", ["-p", "require('v8').getHeapStatistics().heap_size_limit"])
+    try:
+        return int(output) // (1024 * 1024) if output else None
+    except ValueError:
+        return None
+
+
+def get_compile_cache_dir(node_path, script_path):
+    """
+    Return the compile cache directory for running <script_path> with
+    <node_path>, or None without a cache directory or a node version
+    """
+    cache_file = get_cache_file()
+    version = get_node_version(node_path)
+    if not cache_file or not version:
+        return None
+    key = hashlib.sha1("{0}\n{1}".format(version, os.path.realpath(script_path)).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.dirname(cache_file), "compile-cache", key)
+
+
+def trim_compile_cache(max_mb, keep_dir):
+    """
+    Delete the least recently used compile caches, other than <keep_dir>, until
+    all of them take at most <max_mb>; done once per session
+    """
+    global _compile_cache_trimmed
+    with _lock:
+        if _compile_cache_trimmed:
+            return
+        _compile_cache_trimmed = True
+    root = os.path.dirname(keep_dir)
+    if not os.path.isdir(root):
+        return
+    caches = []
+    for name in os.listdir(root):
+        cache_dir = os.path.join(root, name)
+        size = 0
+        for dir_path, _, file_names in os.walk(cache_dir):
+            for file_name in file_names:
+                try:
+                    size += os.path.getsize(os.path.join(dir_path, file_name))
+                except OSError:
+                    pass
+        caches.append((get_mtime(cache_dir) or 0, cache_dir, size))
+    total = sum(size for (_, _, size) in caches)
+    for _, cache_dir, size in sorted(caches):
+        if total <= max_mb * 1024 * 1024:
+            break
+        if os.path.normcase(cache_dir) == os.path.normcase(keep_dir):
+            continue
+        log.debug("removing the compile cache {0}".format(cache_dir))
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        total -= size
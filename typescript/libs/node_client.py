@@ -1,5 +1,7 @@
+import atexit
 import os
 import subprocess
+import tempfile
 import threading
 import time
 import json
@@ -10,6 +12,11 @@ import time
 from .logger import log
 from . import json_helpers
 from . import global_vars
+from . import memory_watchdog
+from . import node_cache
+from .frame_reader import FrameReader, peek_header, release_body
+from .event_dispatcher import event_dispatcher
+from .request_queue import RequestQueue, INTERACTIVE_LANE, BACKGROUND_LANE
 
 # queue module name changed from Python 2 to 3
 if int(sublime.version()) < 3000:
@@ -17,22 +24,130 @@ if int(sublime.version()) < 3000:
 else:
     import queue
 
+# concurrent.futures is not available in the Python 2.6 plugin host
+try:
+    from concurrent.futures import Future
+except ImportError:
+    Future = None
+
 
 class CommClient(object):
 
     def started(self): pass
 
+    def get_heap_usage(self): pass
+
     def postCmd(self, cmd): pass
 
     def sendCmd(self, cmd, cb): pass
 
     def sendCmdSync(self, cmd): pass
 
-    def sendCmdAsync(self, cmd, cb): pass
+    def sendCmdAsync(self, cmd, cb, seq, background_key=None): pass
+
+    def sendCmdWithDeadline(self, cmd, cb, seq, deadline): pass
+
+    def request(self, cmd, seq): pass
+
+    def is_idle(self): pass
+
+    def set_max_queued_requests(self, max_depth): pass
+
+    def mark_exiting(self): pass
+
+    def is_pending(self, seq): pass
+
+    def cancel(self, seq): pass
+
+
+class PendingResponse(object):
+    """
+    Slot for the response of one synchronous request; the caller blocks on it
+    and the reader thread fills it when the matching response arrives
+    """
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.response = None
+
+    def resolve(self, response):
+        self.response = response
+        self.event.set()
+
+    def wait(self, timeout):
+        """Return the response, or None if it did not arrive within <timeout> seconds"""
+        self.event.wait(timeout)
+        return self.response if self.event.is_set() else None
+
+
+class StderrBuffer(object):
+    """Keeps the last <size> bytes written to the stderr of a tsserver process"""
+
+    def __init__(self, size):
+        self.size = size
+        self.data = bytearray()
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def append(self, data):
+        with self.lock:
+            self.total += len(data)
+            self.data += data
+            if len(self.data) > self.size:
+                del self.data[:len(self.data) - self.size]
+
+    def tail(self):
+        with self.lock:
+            return self.data.decode("utf-8", "replace")
+
+    def wait_closed(self, timeout):
+        pass
+
+
+class StderrDrainer(StderrBuffer):
+    """
+    Reads the stderr pipe of a tsserver process on a thread of its own, so a
+    server that logs a lot can never block on a full pipe
+    """
+
+    def __init__(self, stream, size):
+        super(StderrDrainer, self).__init__(size)
+        self.closed = threading.Event()
+        drainer_thread = threading.Thread(target=self.drain, args=(stream,))
+        drainer_thread.daemon = True
+        drainer_thread.start()
+
+    def drain(self, stream):
+        try:
+            while True:
+                data = os.read(stream.fileno(), 65536)
+                if not data:
+                    break
+                self.append(data)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.closed.set()
+
+    def wait_closed(self, timeout):
+        """Give the drainer a chance to pick up the last output of an exiting server"""
+        self.closed.wait(timeout)
 
 
 class NodeCommClient(CommClient):
-    __CONTENT_LENGTH_HEADER = b"Content-Length: "
+    # subclasses that do their own I/O scheduling don't need the post thread
+    uses_post_thread = True
+    # whether the server is started with heap_reporter.js, see MemoryWatchdog
+    reports_heap = True
+
+    # clients whose request seqs don't reach tsserver unchanged can't use cancellation files
+    supports_cancellation = True
+
+    # tsserver arguments of the kind of server, after the 'tsserver_args' setting
+    server_args = []
+
+    # bodies larger than this (in bytes) are decoded lazily, see json_helpers.LazyJSONObject
+    lazy_decode_threshold = 4 * 1024 * 1024
 
     def __init__(self, script_path):
         self.server_proc = None
@@ -41,27 +156,56 @@ class NodeCommClient(CommClient):
         # create event handler maps
         self.event_handlers = dict()
 
-        # create response and event queues
-        self.msgq = queue.Queue()
-        self.postq = queue.Queue()
+        # create the post queue and the maps used to route responses by request seq
+        self.postq = RequestQueue()
         self.asyncReq = {}
+        self.pending_responses = {}
+
+        # write coalescing statistics of the post thread
+        self.post_flush_count = 0
+        self.posted_cmd_count = 0
+        self.last_flush_size = 0
+
+        # tail of the server stderr, see StderrBuffer
+        self.stderr_buffer = None
+
+        # tsserver cancels request <seq> once the file <cancellation_prefix><seq> exists
+        self.cancellation_prefix = None
+        self.cancelled_seqs = set()
+        self.cancelled_count = 0
+        atexit.register(self.clear_cancellations)
+
+        # set once the server is told to exit, so its exit isn't taken for a crash
+        self.exiting = False
+
+        # the file the server reports its heap to, see heap_reporter.js
+        self.heap_report_file = None
+        atexit.register(self.remove_heap_report)
+
+        # set while the server is started in the background; commands posted
+        # meanwhile are sent once 'started_event' is set
+        self.starting = False
+        self.started_event = threading.Event()
+        # the StartupProfile to record the startup of the server in, if any
+        self.startup_profile = None
 
         self.debug_proc = None
         self.breakpoints = []
 
-        post_thread = threading.Thread(target=NodeCommClient.monitorPostQueue, args=(self,))
-        post_thread.daemon = True
-        post_thread.start()
+        if self.uses_post_thread:
+            post_thread = threading.Thread(target=NodeCommClient.monitorPostQueue, args=(self,))
+            post_thread.daemon = True
+            post_thread.start()
 
-    def makeTimeoutMsg(self, cmd, seq):
-        jsonDict = json_helpers.decode(cmd)
+    def makeTimeoutMsg(self, cmd, seq, message="timeout"):
+        # <cmd> is None when the request is no longer known, e.g. after a crash
         timeoutMsg = {
             "seq": 0,
             "type": "response",
             "success": False,
             "request_seq": seq,
-            "command": jsonDict["command"],
-            "message": "timeout"
+            "command": json_helpers.decode(cmd)["command"] if cmd else None,
+            "message": message
         }
         return timeoutMsg
 
@@ -73,7 +217,69 @@ class NodeCommClient(CommClient):
             event_handlers[event_name].append(cb)
 
     def started(self):
-        return self.server_proc is not None
+        return self.server_proc is not None or self.starting
+
+    @staticmethod
+    def get_stderr_buffer_size():
+        pref_settings = sublime.load_settings('Preferences.sublime-settings')
+        return pref_settings.get('tsserver_stderr_buffer_kb', 64) * 1024
+
+    def get_stderr_tail(self):
+        return self.stderr_buffer.tail() if self.stderr_buffer else ""
+
+    def get_pid(self):
+        return self.server_proc.pid if self.server_proc else None
+
+    def get_heap_usage(self):
+        """Return the heap used and the heap limit of the server in megabytes, or None if unknown"""
+        if not self.heap_report_file:
+            return None
+        return memory_watchdog.read_heap_report(self.heap_report_file)
+
+    def remove_heap_report(self):
+        if self.heap_report_file:
+            try:
+                os.remove(self.heap_report_file)
+            except OSError:
+                pass
+
+    def get_diagnostics(self):
+        """Return lines describing the state of the client, for the server diagnostics panel"""
+        lines = []
+        if self.starting:
+            lines.append("starting")
+        elif self.started():
+            lines.append("process id: {0}".format(self.get_pid()))
+        else:
+            lines.append("not running")
+        lines.append("commands posted: {0} in {1} writes".format(self.posted_cmd_count, self.post_flush_count))
+        lines.append("requests waiting: {0} sync, {1} async".format(len(self.pending_responses), len(self.asyncReq)))
+        lines.append("requests canceled: {0}".format(self.cancelled_count))
+        lines.append("post queue: {0} queued, {1} at most, {2} superseded, {3} shed".format(
+            self.postq.qsize(), self.postq.max_seen_depth, self.postq.superseded_count, self.postq.shed_count))
+        for lane in (INTERACTIVE_LANE, BACKGROUND_LANE):
+            sent_count, average_wait, max_wait = self.postq.lane_wait_summary(lane)
+            lines.append("{0} lane: {1} sent, queued {2:.1f}ms on average, {3:.1f}ms at most".format(
+                lane, sent_count, average_wait * 1000, max_wait * 1000))
+        if self.stderr_buffer:
+            lines.append("stderr: {0} bytes in total".format(self.stderr_buffer.total))
+            stderr = self.stderr_buffer.tail()
+            if stderr:
+                lines.append("last {0} bytes of stderr:".format(self.stderr_buffer.size))
+                lines.extend(stderr.splitlines())
+        return lines
+
+    @staticmethod
+    def report_exit(name, stderr_buffer):
+        """Log the exit of a server together with the last output on its stderr"""
+        stderr = ""
+        if stderr_buffer:
+            stderr_buffer.wait_closed(1)
+            stderr = stderr_buffer.tail()
+        if stderr:
+            log.error("{0} exited; last output on stderr:\n{1}".format(name, stderr))
+        else:
+            log.debug("{0} exited".format(name))
 
     # work in progress
     def addBreakpoint(self, file, line):
@@ -87,137 +293,303 @@ class NodeCommClient(CommClient):
 
     def sendCmd(self, cmd, cb, seq):
         """
-        send single-line command string; no sequence number; wait for response
-        this assumes stdin/stdout; for TCP, need to add correlation with sequence numbers
+        send single-line command string; wait for the response matching <seq>
+        and pass it to <cb>
         """
-        if self.postCmd(cmd):
-            reqSeq = -1
-            try:
-                while reqSeq < seq:
-                    data = self.msgq.get(True, 1)
-                    dict = json_helpers.decode(data)
-                    reqSeq = dict['request_seq']
-                if cb:
-                    cb(dict)
-            except queue.Empty:
-                print("queue timeout")
-                if (cb):
-                    cb(self.makeTimeoutMsg(cmd, seq))
-        else:
-            if (cb):
+        response_dict = self.wait_for_response(cmd, seq, 1)
+        if cb:
+            cb(response_dict)
+
+    def sendCmdAsync(self, cmd, cb, seq, background_key=None):
+        """
+        Sends the command and registers a callback; if the command can't be
+        sent, the callback is called right away with a failed response
+        """
+        # register first so that a fast response can't arrive before the callback
+        self.asyncReq[seq] = cb
+        if not self.postCmd(cmd, seq, background_key):
+            if self.asyncReq.pop(seq, None) is not None and cb:
+                cb(self.makeTimeoutMsg(cmd, seq, "shed" if self.started() else "not running"))
+
+    def sendCmdWithDeadline(self, cmd, cb, seq, deadline):
+        """
+        Sends the command without blocking; <cb> is called on the UI thread with the
+        response, or with a timeout response if none arrives within <deadline> seconds
+        """
+        def on_response(response_dict):
+            sublime.set_timeout(lambda: cb(response_dict), 0)
+
+        def on_deadline():
+            # the reader thread pops the callback when the response arrives,
+            # so whoever removes it first decides how the request ends
+            if self.asyncReq.pop(seq, None) is not None:
+                log.debug('Request {0} passed its deadline of {1}s'.format(seq, deadline))
                 cb(self.makeTimeoutMsg(cmd, seq))
 
-    def sendCmdAsync(self, cmd, cb, seq):
+        self.asyncReq[seq] = on_response
+        if not self.postCmd(cmd, seq):
+            self.asyncReq.pop(seq, None)
+            sublime.set_timeout(lambda: cb(self.makeTimeoutMsg(cmd, seq)), 0)
+            return
+        sublime.set_timeout(on_deadline, int(deadline * 1000))
+
+    def request(self, cmd, seq):
         """
-        Sends the command and registers a callback
+        Sends the command and returns a concurrent.futures.Future resolved with
+        its response, or with a failed response if it can't be sent; coroutines
+        await it with asyncio.wrap_future
         """
-        if self.postCmd(cmd):
-            self.asyncReq[seq] = cb
+        future = Future()
+
+        def on_response(response_dict):
+            if not future.done():
+                future.set_result(response_dict)
+        self.sendCmdAsync(cmd, on_response, seq)
+        return future
 
     def sendCmdSync(self, cmd, seq):
         """
         Sends the command and wait for the result and returns it
         """
-        if self.postCmd(cmd):
-            reqSeq = -1
-            try:
-                while reqSeq < seq:
-                    data = self.msgq.get(True, 2)
-                    dict = json_helpers.decode(data)
-                    reqSeq = dict['request_seq']
-                return dict
-            except queue.Empty:
-                print("queue timeout")
-                return self.makeTimeoutMsg(cmd, seq)
-        else:
+        return self.wait_for_response(cmd, seq, 2)
+
+    def wait_for_response(self, cmd, seq, timeout):
+        """
+        Post the command and block until the reader thread routes the response
+        with the same request seq to us, or until <timeout> seconds elapse.
+        The slot is registered before posting so a fast response can't be missed.
+        """
+        waiter = PendingResponse()
+        self.pending_responses[seq] = waiter
+        if not self.postCmd(cmd, seq):
+            self.pending_responses.pop(seq, None)
+            return self.makeTimeoutMsg(cmd, seq)
+
+        response_dict = waiter.wait(timeout)
+        if response_dict is None:
+            # unregister so the late response is dropped by the reader thread
+            self.pending_responses.pop(seq, None)
+            log.debug("request {0} timed out".format(seq))
             return self.makeTimeoutMsg(cmd, seq)
+        return response_dict
 
     def monitorPostQueue(self):
         """
-        Monitor queue and post commands asynchronously
+        Monitor queue and post commands asynchronously.
+        Everything queued by the time the thread wakes up is sent in one write,
+        so a burst of requests reaches the server in a single pipe wakeup.
         """
         while True:
-            cmd = self.postq.get(True) + "\n"
-            if not self.server_proc:
+            cmd = self.postq.get()
+            if cmd is None:
+                # the queue was closed, see ServerClient.stop
+                return
+            cmds = [cmd]
+            try:
+                while True:
+                    cmds.append(self.postq.get_nowait())
+            except queue.Empty:
+                pass
+
+            server_proc = self.server_proc
+            if not server_proc and self.starting:
+                self.started_event.wait()
+                server_proc = self.server_proc
+            if not server_proc:
                 log.error("can not send request; node process not running")
             else:
                 st = time.time()
-                self.server_proc.stdin.write(cmd.encode())
-                self.server_proc.stdin.flush()
-                log.debug("command posted, elapsed %.3f sec" % (time.time() - st))
+                try:
+                    server_proc.stdin.write(("\n".join(cmds) + "\n").encode())
+                    server_proc.stdin.flush()
+                except (IOError, OSError) as e:
+                    # the server died; its reader thread takes care of the rest
+                    log.error("can not send {0} command(s): {1}".format(len(cmds), e))
+                    continue
+                self.post_flush_count += 1
+                self.posted_cmd_count += len(cmds)
+                self.last_flush_size = len(cmds)
+                if self.startup_profile:
+                    self.startup_profile.mark("configure")
+                log.debug("%d command(s) posted in one flush, elapsed %.3f sec" % (len(cmds), time.time() - st))
+
+    def set_max_queued_requests(self, max_depth):
+        self.postq.max_depth = max_depth
+
+    def mark_exiting(self):
+        self.exiting = True
+
+    def is_idle(self):
+        """Return whether no request is queued for the server or waiting for its response"""
+        return self.postq.qsize() == 0 and not self.asyncReq and not self.pending_responses
+
+    def is_pending(self, seq):
+        """Return whether somebody still waits for the response to request <seq>"""
+        return seq in self.asyncReq or seq in self.pending_responses
+
+    def cancel(self, seq):
+        """
+        Ask tsserver to stop working on request <seq>. Its callback is still
+        called, with a failed 'canceled' response, once the server answers.
+        """
+        callback = self.asyncReq.get(seq)
+        if not self.cancellation_prefix or callback is None or seq in self.cancelled_seqs:
+            return False
+        cancellation_file = self.cancellation_prefix + str(seq)
+        try:
+            open(cancellation_file, "w").close()
+        except (IOError, OSError) as e:
+            log.debug("Failed to cancel request {0}: {1}".format(seq, e))
+            return False
+        self.cancelled_seqs.add(seq)
+        self.cancelled_count += 1
+
+        def on_canceled(response_dict):
+            self.remove_cancellation(seq)
+            canceled_dict = dict(response_dict, success=False, message="canceled")
+            canceled_dict.pop("body", None)
+            callback(canceled_dict)
+        self.asyncReq[seq] = on_canceled
+        return True
 
-    def postCmd(self, cmd):
+    def remove_cancellation(self, seq):
+        self.cancelled_seqs.discard(seq)
+        try:
+            os.remove(self.cancellation_prefix + str(seq))
+        except OSError:
+            pass
+
+    def clear_cancellations(self):
+        for seq in list(self.cancelled_seqs):
+            self.remove_cancellation(seq)
+
+    def postCmd(self, cmd, seq=None, background_key=None):
         """
-        Post command to server; no response needed
+        Post command to server; no response needed.
+        Requests that only serve idle time features pass a <background_key>,
+        see RequestQueue; they may be replaced or refused when the server is busy.
         """
         log.debug('Posting command: {0}'.format(cmd))
-        if not self.server_proc:
+        if not self.started():
             log.error("can not send request; node process not running")
             return False
-        self.postq.put_nowait(cmd)
-        return True
+        accepted, dropped = self.postq.put(cmd, seq, background_key)
+        if dropped is not None:
+            self.drop_request(dropped.cmd, dropped.seq, "superseded")
+        if not accepted:
+            log.debug('Shedding background request: {0}'.format(background_key))
+        return accepted
+
+    def fail_pending_requests(self, reason):
+        """Answer every request that is queued or waiting for a response, e.g. after the server died"""
+        for entry in self.postq.clear():
+            self.drop_request(entry.cmd, entry.seq, reason)
+        for seq in list(self.asyncReq.keys()):
+            callback = self.asyncReq.pop(seq, None)
+            if callback:
+                callback(self.makeTimeoutMsg(None, seq, reason))
+        for seq in list(self.pending_responses.keys()):
+            waiter = self.pending_responses.pop(seq, None)
+            if waiter:
+                waiter.resolve(self.makeTimeoutMsg(None, seq, reason))
+        self.clear_cancellations()
+
+    def drop_request(self, cmd, seq, reason):
+        """Answer whoever waits for a request that is never going to be sent"""
+        if seq is None:
+            return
+        callback = self.asyncReq.pop(seq, None)
+        waiter = None if callback else self.pending_responses.pop(seq, None)
+        if callback:
+            callback(self.makeTimeoutMsg(cmd, seq, reason))
+        elif waiter:
+            waiter.resolve(self.makeTimeoutMsg(cmd, seq, reason))
 
     @staticmethod
-    def read_msg(stream, msgq, asyncReq, proc, asyncEventHandlers):
+    def read_msg(reader, stream, pending_responses, asyncReq, asyncEventHandlers, request_queue=None):
         """
         Reader thread helper.
         Return True to indicate the wish to stop reading the next message.
         """
-        state = "init"
-        body_length = 0
-        while state != "body":
-            header = stream.readline().strip()
-            if len(header) == 0:
-                if state == 'init':
-                    # log.info('0 byte line in stream when expecting header')
-                    stderr = proc.stderr.read()
-                    if stderr:
-                        print('typescript error', stderr)
-                    return proc.poll() is not None
-                else:
-                    # Done reading header
-                    state = "body"
-            else:
-                state = 'header'
-                if header.startswith(NodeCommClient.__CONTENT_LENGTH_HEADER):
-                    body_length = int(header[len(NodeCommClient.__CONTENT_LENGTH_HEADER):])
-
-        if body_length > 0:
-            data = stream.read(body_length)
-            log.debug('Read body of length: {0}'.format(body_length))
-
-            # TypeScript adds a newline at the end of the response message and counts
-            # it as one character (LF) towards the content length. However, newlines
-            # are two characters on Windows (CR LF), so we need to take care of that.
-            # See issue: https://github.com/Microsoft/TypeScript/issues/3403
-            # The fix is based on: https://github.com/ycm-core/ycmd/pull/503
-            if global_vars.IS_WINDOWS and data.endswith(b'\r'):
-                data += stream.read(1)
-
-            data_json = data.decode("utf-8")
-
-            data_dict = json_helpers.decode(data_json)
-            if data_dict['type'] == "response":
-                request_seq = data_dict['request_seq']
-                log.debug('Body sequence#: {0}'.format(request_seq))
-                if request_seq in asyncReq:
-                    callback = asyncReq.pop(request_seq, None)
-                    if callback:
-                        callback(data_dict)
-                else:
-                    # Only put in the queue if wasn't an async request
-                    msgq.put(data_json)
-            elif data_dict["type"] == "event":
-                event_name = data_dict["event"]
-                if event_name in asyncEventHandlers:
-                    for cb in asyncEventHandlers[event_name]:
-                        # Run <cb> asynchronously to keep read_msg as small as possible
-                        sublime.set_timeout(lambda: cb(data_dict), 0)
+        body = reader.next_frame()
+        while body is None:
+            if reader.fill(stream) == 0:
+                # the server closed its end of the pipe
+                return True
+            body = reader.next_frame()
+
+        if len(body) > 0:
+            log.debug('Read body of length: {0}'.format(len(body)))
+            try:
+                NodeCommClient.dispatch_msg(body, pending_responses, asyncReq, asyncEventHandlers, request_queue)
+            finally:
+                release_body(body)
         else:
+            release_body(body)
             log.info('Body length of 0 in server stream')
 
         return False
 
+    @staticmethod
+    def decode_body(body):
+        # decode straight from the read buffer; on Windows the body ends with
+        # the CR of a CR LF pair (see FrameReader), which the JSON decoder ignores
+        if global_vars.IS_ST2:
+            # the body is a bytes copy there, see FrameReader.next_frame
+            data_json = body.decode("utf-8")
+        else:
+            data_json = str(body, "utf-8")
+        if len(body) > NodeCommClient.lazy_decode_threshold:
+            log.debug('Decoding body of length {0} lazily'.format(len(body)))
+            return json_helpers.decode_lazy(data_json)
+        return json_helpers.decode(data_json)
+
+    @staticmethod
+    def dispatch_msg(body, pending_responses, asyncReq, asyncEventHandlers, request_queue=None):
+        """
+        Route one message body to the callback, waiter or event handlers that want it.
+        The routing fields are peeked from the leading bytes, and the body is only
+        decoded if somebody is actually going to consume it.
+        <request_queue> is told about finished requests, see RequestQueue.
+        """
+        data_dict = None
+        header = peek_header(body)
+        if header is None:
+            data_dict = NodeCommClient.decode_body(body)
+            header = (data_dict.get("type"), data_dict.get("request_seq"), data_dict.get("event"))
+        msg_type, request_seq, event_name = header
+
+        if msg_type == "response":
+            log.debug('Body sequence#: {0}'.format(request_seq))
+            if request_queue:
+                request_queue.request_done(request_seq)
+            callback = asyncReq.pop(request_seq, None)
+            waiter = None if callback else pending_responses.pop(request_seq, None)
+            if not callback and not waiter:
+                # nobody is waiting anymore (e.g. the request timed out)
+                log.debug('Dropping unwanted response for sequence#: {0}'.format(request_seq))
+                return
+            if data_dict is None:
+                data_dict = NodeCommClient.decode_body(body)
+            if callback:
+                callback(data_dict)
+            else:
+                waiter.resolve(data_dict)
+        elif msg_type == "event":
+            if event_name == "requestCompleted" and request_queue:
+                # sent when a request without response, such as geterr, is done
+                if data_dict is None:
+                    data_dict = NodeCommClient.decode_body(body)
+                request_queue.request_done(data_dict.get("body", {}).get("request_seq"))
+            handlers = asyncEventHandlers.get(event_name)
+            if not handlers:
+                log.debug('Dropping unhandled event: {0}'.format(event_name))
+                return
+            if data_dict is None:
+                data_dict = NodeCommClient.decode_body(body)
+            # handlers run on the UI thread in batches, see EventDispatcher
+            event_dispatcher().post(event_name, handlers, data_dict)
+
     @staticmethod
     def is_executable(fpath):
         return os.path.isfile(fpath) and os.access(fpath, os.X_OK)
@@ -239,22 +611,11 @@ class NodeCommClient(CommClient):
                     return programPath
         return None
 
-
-class ServerClient(NodeCommClient):
-
-    def __init__(self, script_path):
-        """
-        Starts a node client (if not already started) and communicate with it.
-        The script file to run is passed to the constructor.
-        """
-        super(ServerClient, self).__init__(script_path)
-
-        # start node process
+    @staticmethod
+    def find_node_path():
+        """Return the node executable to run tsserver with, or None if none can be found"""
         pref_settings = sublime.load_settings('Preferences.sublime-settings')
         node_path = pref_settings.get('node_path')
-        node_args = pref_settings.get('node_args', [])
-        tsserver_args = pref_settings.get('tsserver_args', [])
-        tsserver_env = dict(os.environ, **pref_settings.get('tsserver_env', {}))
         if node_path:
             print("Path of node executable is configured as: " + node_path)
             configured_node_path = os.path.expandvars(node_path)
@@ -267,92 +628,253 @@ class ServerClient(NodeCommClient):
             if os.name == "nt":
                 node_path = "node"
             else:
-                node_path = NodeCommClient.which("node")
+                node_path = node_cache.get_node_path(NodeCommClient.is_executable)
+                if not node_path:
+                    node_path = NodeCommClient.which("node")
+                    if node_path:
+                        node_cache.set_node_path(node_path)
         if not node_path:
             path_list = os.environ["PATH"] + os.pathsep + "/usr/local/bin" + os.pathsep + "$NVM_BIN"
             print("Unable to find executable file for node on path list: " + path_list)
             print("To specify the node executable file name, use the 'node_path' setting")
+        return node_path
+
+    def get_server_cmd(self, node_path):
+        """Return the command line and the environment to spawn tsserver with"""
+        pref_settings = sublime.load_settings('Preferences.sublime-settings')
+        node_args = pref_settings.get('node_args', [])
+        tsserver_args = pref_settings.get('tsserver_args', [])
+        tsserver_env = dict(os.environ, **pref_settings.get('tsserver_env', {}))
+        if "NODE_COMPILE_CACHE" not in tsserver_env and pref_settings.get('tsserver_compile_cache', True):
+            compile_cache_dir = node_cache.get_compile_cache_dir(node_path, self.script_path)
+            if compile_cache_dir:
+                node_cache.trim_compile_cache(pref_settings.get('tsserver_compile_cache_mb', 128), compile_cache_dir)
+                # node ignores the variable before version 22.1
+                tsserver_env["NODE_COMPILE_CACHE"] = compile_cache_dir
+                # the modification time of the directory tells which caches were used last
+                if os.path.isdir(compile_cache_dir):
+                    os.utime(compile_cache_dir, None)
+        heap_setting = pref_settings.get('tsserver_max_old_space_size')
+        if heap_setting and memory_watchdog.get_heap_arg(node_args + tsserver_env.get("NODE_OPTIONS", "").split()) is None:
+            if heap_setting == "auto":
+                heap_setting = memory_watchdog.get_default_heap_mb(node_cache.get_node_heap_limit_mb(node_path))
+            if heap_setting:
+                node_args = node_args + ["--max-old-space-size={0}".format(heap_setting)]
+        sample_seconds = pref_settings.get('tsserver_memory_sample_seconds', 30)
+        if self.reports_heap and sample_seconds:
+            self.remove_heap_report()
+            self.heap_report_file = os.path.join(
+                tempfile.gettempdir(), "tsheap-{0}-{1}.json".format(os.getpid(), id(self)))
+            tsserver_env["TSSERVER_HEAP_REPORT"] = self.heap_report_file
+            tsserver_env["TSSERVER_HEAP_REPORT_SECONDS"] = str(sample_seconds)
+            node_args = node_args + ["--require", os.path.join(global_vars.PLUGIN_DIR, "typescript", "libs", "heap_reporter.js")]
+        node_process_cmd = [node_path] + node_args + [self.script_path, "--disableAutomaticTypingAcquisition"] + tsserver_args + self.server_args
+        if self.supports_cancellation and pref_settings.get('tsserver_request_cancellation', True):
+            self.cancellation_prefix = os.path.join(
+                tempfile.gettempdir(), "tscancellation-{0}-{1}-".format(os.getpid(), id(self)))
+            node_process_cmd += ["--cancellationPipeName", self.cancellation_prefix + "*"]
+        return node_process_cmd, tsserver_env
+
+    @staticmethod
+    def spawn_server(node_process_cmd, tsserver_env):
+        if os.name == "nt":
+            # linux subprocess module does not have STARTUPINFO
+            # so only use it if on Windows
+            si = subprocess.STARTUPINFO()
+            si.dwFlags |= subprocess.SW_HIDE | subprocess.STARTF_USESHOWWINDOW
+            return subprocess.Popen(node_process_cmd,
+                                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=tsserver_env, startupinfo=si, bufsize=-1)
+        else:
+            return subprocess.Popen(node_process_cmd,
+                                    stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=tsserver_env, bufsize=-1)
+
+
+class ServerClient(NodeCommClient):
+    # seconds before a crashed server is started again; the delay doubles with
+    # every crash in a row, up to MAX_RESTART_DELAY
+    MIN_RESTART_DELAY = 1
+    MAX_RESTART_DELAY = 30
+    # a crash after the server has run this many seconds is not counted as in a row
+    STABLE_RUN_TIME = 60
+
+    def __init__(self, script_path, startup_profile=None):
+        """
+        Starts a node client (if not already started) and communicate with it.
+        The script file to run is passed to the constructor.
+        """
+        super(ServerClient, self).__init__(script_path)
+        self.startup_profile = startup_profile
+
+        # called on the UI thread after a crashed server has been started again,
+        # to bring it back to the state of the editor
+        self.on_restarted = None
+        self.restart_count = 0
+        self.restart_delay = ServerClient.MIN_RESTART_DELAY
+        self.start_time = None
+        if global_vars.IS_ST2:
+            self.start()
+        else:
+            # finding node and spawning tsserver take a while, so they don't
+            # happen on the UI thread; commands wait in the post queue meanwhile
+            self.starting = True
+            start_thread = threading.Thread(target=self.start)
+            start_thread.daemon = True
+            start_thread.start()
+
+    def start(self):
+        try:
+            self.spawn()
+        finally:
+            self.starting = False
+            self.started_event.set()
+
+    def spawn(self):
+        # start node process
+        node_path = NodeCommClient.find_node_path()
+        if not node_path:
             self.server_proc = None
         else:
             global_vars._node_path = node_path
+            if self.startup_profile:
+                self.startup_profile.mark("discovery", "{0} {1}".format(node_path, node_cache.get_node_version(node_path)))
             log.debug("Trying to spawn node executable from: " + node_path)
             try:
-                node_process_cmd = [node_path] + node_args + [script_path, "--disableAutomaticTypingAcquisition"] + tsserver_args
-                if os.name == "nt":
-                    # linux subprocess module does not have STARTUPINFO
-                    # so only use it if on Windows
-                    si = subprocess.STARTUPINFO()
-                    si.dwFlags |= subprocess.SW_HIDE | subprocess.STARTF_USESHOWWINDOW
-                    self.server_proc = subprocess.Popen(node_process_cmd,
-                                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=tsserver_env, startupinfo=si, bufsize=-1)
-                else:
-                    log.debug("opening " + node_path + " " + script_path)
-                    self.server_proc = subprocess.Popen(node_process_cmd,
-                                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=tsserver_env, bufsize=-1)
+                self.server_proc = NodeCommClient.spawn_server(*self.get_server_cmd(node_path))
             except:
                 self.server_proc = None
+            if self.server_proc and self.exiting:
+                # stopped while it was being spawned
+                self.server_proc.kill()
+                self.server_proc = None
+            if self.server_proc and self.startup_profile:
+                self.startup_profile.mark("spawn")
         # start reader thread
         if self.server_proc and (not self.server_proc.poll()):
             log.debug("server proc " + str(self.server_proc))
             log.debug("starting reader thread")
+            self.start_time = time.time()
+            self.stderr_buffer = StderrDrainer(self.server_proc.stderr, NodeCommClient.get_stderr_buffer_size())
             readerThread = threading.Thread(target=ServerClient.__reader, args=(
-                self.server_proc.stdout, self.msgq, self.asyncReq, self.server_proc, self.event_handlers))
+                self.server_proc.stdout, self.pending_responses, self.asyncReq, self.stderr_buffer, self.event_handlers, self.postq,
+                lambda server_proc=self.server_proc: self.on_server_exit(server_proc)))
             readerThread.daemon = True
             readerThread.start()
 
+    def on_server_exit(self, server_proc):
+        """Fail the requests the server will never answer, and start it again after a delay"""
+        if self.exiting or server_proc is not self.server_proc:
+            return
+        self.server_proc = None
+        self.fail_pending_requests("server exited")
+        if time.time() - self.start_time >= ServerClient.STABLE_RUN_TIME:
+            self.restart_delay = ServerClient.MIN_RESTART_DELAY
+        log.error("tsserver exited unexpectedly; restarting it in {0}s".format(self.restart_delay))
+        self.schedule_restart()
+
+    def schedule_restart(self):
+        delay = self.restart_delay
+        self.restart_delay = min(delay * 2, ServerClient.MAX_RESTART_DELAY)
+        sublime.set_timeout(self.restart, int(delay * 1000))
+
+    def restart(self):
+        if self.exiting or self.server_proc:
+            return
+        self.start()
+        if not self.server_proc:
+            log.error("Failed to restart tsserver; trying again in {0}s".format(self.restart_delay))
+            self.schedule_restart()
+            return
+        self.restart_count += 1
+        log.info("tsserver restarted")
+        if self.on_restarted:
+            self.on_restarted()
+
+    def stop(self):
+        """
+        Stop the server for good: kill it without restarting it, answer the
+        requests it will never answer, end the post thread and forget the
+        files the client would remove at exit
+        """
+        self.mark_exiting()
+        server_proc = self.server_proc
+        self.server_proc = None
+        if server_proc:
+            server_proc.kill()
+        self.postq.close()
+        self.fail_pending_requests("server stopped")
+        self.remove_heap_report()
+        # Python 2 can't unregister; the hooks then find nothing left to remove
+        if hasattr(atexit, "unregister"):
+            atexit.unregister(self.clear_cancellations)
+            atexit.unregister(self.remove_heap_report)
+
+    def get_diagnostics(self):
+        lines = super(ServerClient, self).get_diagnostics()
+        lines.append("restarted after a crash: {0} times".format(self.restart_count))
+        return lines
+
     @staticmethod
-    def __reader(stream, msgq, asyncReq, proc, eventHandlers):
+    def __reader(stream, pending_responses, asyncReq, stderr_buffer, eventHandlers, request_queue, on_exit):
         """ Main function for reader thread """
+        reader = FrameReader()
+        stream = getattr(stream, "raw", stream)
         while True:
-            if NodeCommClient.read_msg(stream, msgq, asyncReq, proc, eventHandlers):
-                log.debug("server exited")
+            if NodeCommClient.read_msg(reader, stream, pending_responses, asyncReq, eventHandlers, request_queue):
+                NodeCommClient.report_exit("server", stderr_buffer)
+                on_exit()
                 return
 
 
-class WorkerClient(NodeCommClient):
-    stop_worker = False
+class SyntaxServerClient(ServerClient):
+    """
+    tsserver in syntactic mode: it never builds a program, so it answers
+    formatting and syntax diagnostics requests as soon as a file is opened,
+    however long the main server takes to load the project
+    """
+    server_args = ["--serverMode", "syntactic"]
+
 
+class WorkerClient(NodeCommClient):
     def __init__(self, script_path):
         super(WorkerClient, self).__init__(script_path)
+        # set by stop() for the process it kills; every start has its own, so
+        # the reader thread of a stopped process can't mistake a new one's
+        self.stopped_event = None
 
     def start(self):
-        WorkerClient.stop_worker = False
+        self.stopped_event = threading.Event()
 
-        node_path = global_vars.get_node_path()
-        pref_settings = sublime.load_settings('Preferences.sublime-settings')
-        node_args = pref_settings.get('node_args', [])
-        tsserver_args = pref_settings.get('tsserver_args', [])
-        tsserver_env = dict(os.environ, **pref_settings.get('tsserver_env', {}))
-        node_process_cmd = [node_path] + node_args + [self.script_path, "--disableAutomaticTypingAcquisition"] + tsserver_args
-
-        if os.name == "nt":
-            si = subprocess.STARTUPINFO()
-            si.dwFlags |= subprocess.SW_HIDE | subprocess.STARTF_USESHOWWINDOW
-            self.server_proc = subprocess.Popen(
-                node_process_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=tsserver_env, startupinfo=si, bufsize=-1
-            )
-        else:
-            self.server_proc = subprocess.Popen(
-                node_process_cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=tsserver_env, bufsize=-1)
+        node_path = global_vars.get_node_path() or NodeCommClient.find_node_path()
+        self.server_proc = NodeCommClient.spawn_server(*self.get_server_cmd(node_path))
 
         # start reader thread
         if self.server_proc and (not self.server_proc.poll()):
             log.debug("worker proc " + str(self.server_proc))
             log.debug("starting worker thread")
+            self.stderr_buffer = StderrDrainer(self.server_proc.stderr, NodeCommClient.get_stderr_buffer_size())
             workerThread = threading.Thread(target=WorkerClient.__reader, args=(
-                self.server_proc.stdout, self.msgq, self.asyncReq, self.server_proc, self.event_handlers))
+                self.server_proc.stdout, self.pending_responses, self.asyncReq, self.stderr_buffer, self.event_handlers, self.postq,
+                self.stopped_event))
             workerThread.daemon = True
             workerThread.start()
 
     def stop(self):
-        WorkerClient.stop_worker = True
-        self.server_proc.kill()
+        if self.stopped_event:
+            self.stopped_event.set()
+        if self.server_proc:
+            self.server_proc.kill()
         self.server_proc = None
+        self.fail_pending_requests("worker stopped")
 
     @staticmethod
-    def __reader(stream, msgq, asyncReq, proc, eventHandlers):
+    def __reader(stream, pending_responses, asyncReq, stderr_buffer, eventHandlers, request_queue, stopped_event):
         """ Main function for worker thread """
+        reader = FrameReader()
+        stream = getattr(stream, "raw", stream)
         while True:
-            if NodeCommClient.read_msg(stream, msgq, asyncReq, proc, eventHandlers) or WorkerClient.stop_worker:
-                log.debug("worker exited")
+            if NodeCommClient.read_msg(reader, stream, pending_responses, asyncReq, eventHandlers, request_queue) or stopped_event.is_set():
+                if not stopped_event.is_set():
+                    NodeCommClient.report_exit("worker", stderr_buffer)
+                else:
+                    log.debug("worker exited")
                 return
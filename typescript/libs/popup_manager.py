@@ -69,11 +69,18 @@ class PopupManager():
             # Send a signagure_help request to server
             self.proxy.async_signature_help(filename, point, '', on_done)
 
+        # A request still running for an earlier position is superseded by this one
+        self.proxy.cancel_superseded("signatureHelp")
+
         # Schedule the request
         self.scheduler.queue_request(get_signature_data,
                                      lambda resp: self.on_response(resp, view))
 
     def on_response(self, responseJson, view):
+        if not responseJson["success"] and responseJson.get("message") == "canceled":
+            # superseded by a newer request, which will update the popup
+            return
+
         # Needs to be set even if failed for on_close_popup to clear regions
         self.current_view = view
         if not responseJson["success"] or not responseJson["body"]:
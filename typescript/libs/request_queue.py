@@ -0,0 +1,210 @@
+import collections
+import threading
+import time
+
+# queue module name changed from Python 2 to 3
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+INTERACTIVE_LANE = "interactive"
+BACKGROUND_LANE = "background"
+
+
+class QueuedRequest(object):
+    def __init__(self, cmd, seq, background_key):
+        self.cmd = cmd
+        self.seq = seq
+        self.background_key = background_key
+        self.lane = INTERACTIVE_LANE if background_key is None else BACKGROUND_LANE
+        self.queued_time = time.time()
+
+
+class LaneStats(object):
+    """Queue wait statistics of one lane"""
+
+    def __init__(self):
+        self.sent_count = 0
+        self.total_wait = 0
+        self.max_wait = 0
+
+    def add(self, wait):
+        self.sent_count += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def average_wait(self):
+        return self.total_wait / self.sent_count if self.sent_count else 0
+
+
+class RequestQueue(object):
+    """
+    Post queue of a tsserver client with an interactive and a background lane
+
+    Requests sent on behalf of idle timers (geterr, documentHighlights,
+    quickinfo) are posted with a background key, usually (command, file),
+    and go to the background lane; everything else, including all requests
+    that change the server state, goes to the interactive lane.
+
+    Interactive requests are always sent first, in the order they were
+    posted. A background request is only sent when no interactive request
+    is queued or waiting for its response, and no other background request
+    is waiting for its response; a request waiting for its response stops
+    blocking after 'max_hold' seconds, and a background request that has
+    been queued for 'max_hold' seconds is sent anyway, so background work
+    can't starve.
+
+    Background answers are only useful for the latest editor state, so
+     - a queued background request is replaced by a newer one with the same
+       key; the newer request takes over the place of the older one
+     - a background request is refused while the queue holds 'max_depth'
+       or more requests
+    When the server is slow, background work then piles up here rather than
+    in the server, and the server only has the latest of it left to do when
+    it catches up.
+
+    'get' and 'get_nowait' behave like the queue.Queue methods, and return
+    the commands that may be sent now; once the queue is closed, 'get'
+    returns None.
+    """
+
+    def __init__(self, max_depth=16, max_hold=2):
+        self.max_depth = max_depth
+        self.max_hold = max_hold
+        self.entries = collections.deque()
+        self.background_entries = {}
+        self.changed = threading.Condition(threading.Lock())
+        # lane and send time of the sent requests whose response is awaited, by seq
+        self.in_flight = {}
+        self.closed = False
+
+        self.lane_stats = {INTERACTIVE_LANE: LaneStats(), BACKGROUND_LANE: LaneStats()}
+        self.superseded_count = 0
+        self.shed_count = 0
+        self.max_seen_depth = 0
+
+    def put(self, cmd, seq=None, background_key=None):
+        """
+        Queue <cmd>. Return (accepted, dropped): whether <cmd> was queued,
+        and the QueuedRequest it replaced, if any
+        """
+        with self.changed:
+            if background_key is not None:
+                entry = self.background_entries.get(background_key)
+                if entry is not None:
+                    dropped = QueuedRequest(entry.cmd, entry.seq, background_key)
+                    entry.cmd = cmd
+                    entry.seq = seq
+                    self.superseded_count += 1
+                    return True, dropped
+                if len(self.entries) >= self.max_depth:
+                    self.shed_count += 1
+                    return False, None
+            entry = QueuedRequest(cmd, seq, background_key)
+            self.entries.append(entry)
+            if background_key is not None:
+                self.background_entries[background_key] = entry
+            self.max_seen_depth = max(self.max_seen_depth, len(self.entries))
+            self.changed.notify()
+            return True, None
+
+    def request_done(self, seq):
+        """Tell the queue that the server finished the request with <seq>"""
+        with self.changed:
+            if self.in_flight.pop(seq, None) is not None:
+                self.changed.notify()
+
+    def get(self):
+        with self.changed:
+            while True:
+                if self.closed:
+                    return None
+                entry = self.__next_entry()
+                if entry is not None:
+                    return entry.cmd
+                if self.entries:
+                    # only held background work is queued; wait for an
+                    # answer from the server or for the hold to expire
+                    self.changed.wait(self.__hold_time_left())
+                else:
+                    self.changed.wait()
+
+    def get_nowait(self):
+        with self.changed:
+            entry = self.__next_entry()
+            if entry is None:
+                raise queue.Empty
+            return entry.cmd
+
+    def hold_time_left(self):
+        """
+        Seconds until a queued background request may be sent, or None if
+        nothing is queued; for callers that poll with 'get_nowait'
+        """
+        with self.changed:
+            return self.__hold_time_left() if self.entries else None
+
+    def __next_entry(self):
+        """Remove and return the first entry that may be sent now, or None"""
+        now = time.time()
+        entry = None
+        for queued in self.entries:
+            if queued.lane == INTERACTIVE_LANE:
+                entry = queued
+                break
+        if entry is None and self.entries:
+            oldest = self.entries[0]
+            if not self.__background_held(now) or now - oldest.queued_time >= self.max_hold:
+                entry = oldest
+        if entry is None:
+            return None
+
+        self.entries.remove(entry)
+        if entry.background_key is not None:
+            del self.background_entries[entry.background_key]
+        if entry.seq is not None:
+            self.in_flight[entry.seq] = (entry.lane, now)
+        self.lane_stats[entry.lane].add(now - entry.queued_time)
+        return entry
+
+    def __background_held(self, now):
+        # forget requests whose response is overdue; they don't hold anything back
+        for seq in [seq for (seq, (lane, sent_time)) in self.in_flight.items() if now - sent_time >= self.max_hold]:
+            del self.in_flight[seq]
+        return len(self.in_flight) > 0
+
+    def __hold_time_left(self):
+        """Seconds until the first queued background request may be sent"""
+        oldest_release = self.entries[0].queued_time + self.max_hold
+        in_flight_release = max([sent_time + self.max_hold for (lane, sent_time) in self.in_flight.values()] or [0])
+        return max(0.01, min(oldest_release, in_flight_release) - time.time())
+
+    def clear(self):
+        """Forget every queued and sent request; return the queued QueuedRequests"""
+        with self.changed:
+            entries = list(self.entries)
+            self.entries.clear()
+            self.background_entries.clear()
+            self.in_flight.clear()
+            return entries
+
+    def close(self):
+        """Forget every request, and make 'get' return None from now on"""
+        with self.changed:
+            self.entries.clear()
+            self.background_entries.clear()
+            self.in_flight.clear()
+            self.closed = True
+            self.changed.notify_all()
+
+    def qsize(self):
+        with self.changed:
+            return len(self.entries)
+
+    def lane_wait_summary(self, lane):
+        """Return (requests sent, average wait, longest wait) of <lane>, in seconds"""
+        with self.changed:
+            stats = self.lane_stats[lane]
+            return stats.sent_count, stats.average_wait(), stats.max_wait
@@ -1,4 +1,7 @@
-﻿import sublime
+﻿import json
+import sublime
+import threading
+import time
 
 from . import json_helpers
 from .global_vars import IS_ST2
@@ -7,10 +10,47 @@ from .text_helpers import Location
 
 
 class ServiceProxy:
-    def __init__(self, worker_client=CommClient(), server_client=CommClient()):
+    # seconds to wait for the response of a non-blocking request before giving
+    # up on it; can be overridden per command with 'tsserver_request_deadlines'
+    DEFAULT_DEADLINES = {
+        "definition": 5,
+        "typeDefinition": 5,
+        "type": 5,
+        "references": 10,
+        "rename": 10,
+        "format": 2,
+        "formatonkey": 1,
+        "organizeImports": 5,
+        "navto": 5,
+        "projectInfo": 5,
+        "semanticDiagnosticsSync": 5,
+        "syntacticDiagnosticsSync": 5,
+        "getCodeFixes": 5
+    }
+
+    def __init__(self, worker_client=CommClient(), server_client=CommClient(), syntax_client=CommClient()):
         self.__comm = server_client
         self.__worker_comm = worker_client
+        # optional tsserver in syntactic mode that answers the purely syntactic
+        # requests while the main server may still be loading the project
+        self.__syntax_comm = syntax_client
         self.seq = 1
+        # seq of the latest request per command whose result only matters until
+        # the next request of that command; see cancel_superseded
+        self.__latest_seqs = {}
+        # version of each file's content, bumped whenever the servers see a new one
+        self.__file_versions = {}
+        # callbacks waiting for the response of an in-flight read-only request and
+        # the time to stop waiting, by (command, arguments, file version);
+        # see __attach_to_in_flight
+        self.__in_flight_reads = {}
+        self.__in_flight_lock = threading.Lock()
+        self.duplicate_requests_avoided = 0
+        # the file version whose content the worker was last sent, by file
+        self.__worker_file_versions = {}
+        # the file version up to which the worker and the syntax server have the
+        # same content as the main server, by file; see mirrors_share_content
+        self.__shared_versions = {"worker": {}, "syntax": {}}
 
     def increase_seq(self):
         temp = self.seq
@@ -19,27 +59,40 @@ class ServiceProxy:
 
     def exit(self):
         req_dict = self.create_req_dict("exit")
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
+        self.__comm.mark_exiting()
         self.__comm.postCmd(json_str)
         if self.__worker_comm.started():
             self.__worker_comm.postCmd(json_str)
+        if self.__syntax_comm.started():
+            self.__syntax_comm.mark_exiting()
+            self.__syntax_comm.postCmd(json_str)
 
     def stop_worker(self):
         req_dict = self.create_req_dict("exit")
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         if self.__worker_comm.started():
             self.__worker_comm.postCmd(json_str)
 
-    def configure(self, host_info="Sublime Text", file=None, format_options=None):
+    def configure(self, host_info="Sublime Text", file=None, format_options=None, on_completed=None):
         args = {"hostInfo": host_info, "formatOptions": format_options, "file": file}
         req_dict = self.create_req_dict("configure", args)
-        json_str = json_helpers.encode(req_dict)
-        response_dict = self.__comm.postCmd(json_str)
-        if self.__worker_comm.started():
-            self.__worker_comm.postCmd(json_str)
+        json_str = json_helpers.encode_request(req_dict)
+        if on_completed:
+            self.__comm.sendCmdAsync(json_str, on_completed, req_dict["seq"])
+        else:
+            self.__comm.postCmd(json_str)
+        self.__mirror_to_worker(json_str)
+        self.__mirror_to_syntax_server(json_str)
 
         self.set_inferred_project_compiler_options()
 
+    def configure_on_syntax_server(self, host_info="Sublime Text", file=None, format_options=None):
+        args = {"hostInfo": host_info, "formatOptions": format_options, "file": file}
+        req_dict = self.create_req_dict("configure", args)
+        json_str = json_helpers.encode_request(req_dict)
+        self.__mirror_to_syntax_server(json_str)
+
     def set_inferred_project_compiler_options(self):
         """ Add full type support for compilers running in file scope mode """
         compiler_options = {
@@ -50,12 +103,16 @@ class ServiceProxy:
         }
         args = { "options": compiler_options }
         req_dict = self.create_req_dict("compilerOptionsForInferredProjects", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         self.__comm.postCmd(json_str)
-        if self.__worker_comm.started():
-            self.__worker_comm.postCmd(json_str)
-
-    def change(self, path, begin_location=Location(1, 1), end_location=Location(1, 1), insertString=""):
+        self.__mirror_to_worker(json_str)
+
+    def change(self, path, begin_location=Location(1, 1), end_location=Location(1, 1), insertString="", mirror=True):
+        """
+        Send an edit of <path> to the server, and to the worker and the syntax
+        server unless <mirror> is False: an edit computed against the content
+        of the main server only applies there
+        """
         args = {
             "file": path,
             "line": begin_location.line,
@@ -65,15 +122,20 @@ class ServiceProxy:
             "insertString": insertString
         }
         req_dict = self.create_req_dict("change", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
+        shared_roles = self.__get_shared_roles(path)
+        self.bump_file_version(path)
         self.__comm.postCmd(json_str)
-        if self.__worker_comm.started():
-            self.__worker_comm.postCmd(json_str)
+        if mirror:
+            self.__mirror_to_worker(json_str, path)
+            self.__mirror_to_syntax_server(json_str)
+            # the edit only keeps the content of the mirrors that had the same before
+            self.__note_shared(path, shared_roles)
 
     def completions(self, path, location=Location(1, 1), prefix="", on_completed=None):
         args = {"file": path, "line": location.line, "offset": location.offset, "prefix": prefix}
         req_dict = self.create_req_dict("completions", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         self.__comm.sendCmd(
             json_str,
             lambda response_dict: None if on_completed is None else on_completed(response_dict),
@@ -83,13 +145,14 @@ class ServiceProxy:
     def async_completions(self, path, location=Location(1, 1), prefix="", on_completed=None):
         args = {"file": path, "line": location.line, "offset": location.offset, "prefix": prefix}
         req_dict = self.create_req_dict("completions", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
+        self.cancel_superseded("completions", req_dict["seq"])
         self.__comm.sendCmdAsync(json_str, on_completed, req_dict["seq"])
 
     def signature_help(self, path, location=Location(1, 1), prefix="", on_completed=None):
         args = {"file": path, "line": location.line, "offset": location.offset, "prefix": prefix}
         req_dict = self.create_req_dict("signatureHelp", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         self.__comm.sendCmd(
             json_str,
             lambda response_dict: None if on_completed is None else on_completed(response_dict),
@@ -99,23 +162,38 @@ class ServiceProxy:
     def async_signature_help(self, path, location=Location(1, 1), prefix="", on_completed=None):
         args = {"file": path, "line": location.line, "offset": location.offset, "prefix": prefix}
         req_dict = self.create_req_dict("signatureHelp", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
+        self.cancel_superseded("signatureHelp", req_dict["seq"])
         self.__comm.sendCmdAsync(json_str, on_completed, req_dict["seq"])
 
     def definition(self, path, location=Location(1, 1)):
         args = {"file": path, "line": location.line, "offset": location.offset}
         req_dict = self.create_req_dict("definition", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def definition_async(self, path, location, on_completed):
+        args = {"file": path, "line": location.line, "offset": location.offset}
+        req_dict = self.create_req_dict("definition", args)
+        on_completed = self.__attach_to_in_flight(req_dict, on_completed)
+        if on_completed:
+            self.__send_with_deadline(req_dict, on_completed)
+
     def type_definition(self, path, location=Location(1, 1)):
         args = {"file": path, "line": location.line, "offset": location.offset}
         req_dict = self.create_req_dict("typeDefinition", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def type_definition_async(self, path, location, on_completed):
+        args = {"file": path, "line": location.line, "offset": location.offset}
+        req_dict = self.create_req_dict("typeDefinition", args)
+        on_completed = self.__attach_to_in_flight(req_dict, on_completed)
+        if on_completed:
+            self.__send_with_deadline(req_dict, on_completed)
+
     def format(self, path, begin_location=Location(1, 1), end_location=Location(1, 1)):
         args = {
             "file": path,
@@ -125,21 +203,33 @@ class ServiceProxy:
             "endOffset": end_location.offset
         }
         req_dict = self.create_req_dict("format", args)
-        json_str = json_helpers.encode(req_dict)
-        response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
-        if self.__worker_comm.started():
-            self.__worker_comm.sendCmdSync(json_str, req_dict["seq"])
+        json_str = json_helpers.encode_request(req_dict)
+        response_dict = self.__syntax_or_main_comm().sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def format_async(self, path, begin_location, end_location, on_completed):
+        args = {
+            "file": path,
+            "line": begin_location.line,
+            "offset": begin_location.offset,
+            "endLine": end_location.line,
+            "endOffset": end_location.offset
+        }
+        req_dict = self.create_req_dict("format", args)
+        self.__send_with_deadline(req_dict, on_completed, self.__syntax_or_main_comm())
+
     def format_on_key(self, path, location=Location(1, 1), key=""):
         args = {"file": path, "line": location.line, "offset": location.offset, "key": key}
         req_dict = self.create_req_dict("formatonkey", args)
-        json_str = json_helpers.encode(req_dict)
-        response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
-        if self.__worker_comm.started():
-            self.__worker_comm.sendCmdSync(json_str, req_dict["seq"])
+        json_str = json_helpers.encode_request(req_dict)
+        response_dict = self.__syntax_or_main_comm().sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def format_on_key_async(self, path, location, key, on_completed):
+        args = {"file": path, "line": location.line, "offset": location.offset, "key": key}
+        req_dict = self.create_req_dict("formatonkey", args)
+        self.__send_with_deadline(req_dict, on_completed, self.__syntax_or_main_comm())
+
     def organize_imports(self, path):
         args = {
             "scope": {
@@ -150,83 +240,173 @@ class ServiceProxy:
             },
         }
         req_dict = self.create_req_dict("organizeImports", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
-        if self.__worker_comm.started():
-            self.__worker_comm.sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def organize_imports_async(self, path, on_completed):
+        args = {
+            "scope": {
+                "type": "file",
+                "args": {
+                    "file": path
+                }
+            },
+        }
+        req_dict = self.create_req_dict("organizeImports", args)
+        self.__send_with_deadline(req_dict, on_completed)
+
     def open(self, path):
         args = {"file": path}
         req_dict = self.create_req_dict("open", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
+        self.bump_file_version(path)
         self.__comm.postCmd(json_str)
-        if self.__worker_comm.started():
-            self.__worker_comm.postCmd(json_str)
+        self.__mirror_to_worker(json_str, path)
+        self.__mirror_to_syntax_server(json_str)
 
     def open_on_worker(self, path):
         args = {"file": path}
         req_dict = self.create_req_dict("open", args)
-        json_str = json_helpers.encode(req_dict)
-        if self.__worker_comm.started():
-            self.__worker_comm.postCmd(json_str)
+        json_str = json_helpers.encode_request(req_dict)
+        self.__mirror_to_worker(json_str, path)
+        self.__note_not_shared("worker", path)
+
+    def open_on_syntax_server(self, path):
+        args = {"file": path}
+        req_dict = self.create_req_dict("open", args)
+        json_str = json_helpers.encode_request(req_dict)
+        self.__mirror_to_syntax_server(json_str)
+        self.__note_not_shared("syntax", path)
 
     def close(self, path):
         args = {"file": path}
         req_dict = self.create_req_dict("close", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
+        self.bump_file_version(path)
         self.__comm.postCmd(json_str)
-        if self.__worker_comm.started():
-            self.__worker_comm.postCmd(json_str)
+        self.__mirror_to_worker(json_str, path)
+        self.__mirror_to_syntax_server(json_str)
+        self.__note_not_shared("worker", path)
+        self.__note_not_shared("syntax", path)
 
     def references(self, path, location=Location(1, 1)):
         args = {"file": path, "line": location.line, "offset": location.offset}
         req_dict = self.create_req_dict("references", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def references_async(self, path, location, on_completed):
+        args = {"file": path, "line": location.line, "offset": location.offset}
+        req_dict = self.create_req_dict("references", args)
+        on_completed = self.__attach_to_in_flight(req_dict, on_completed)
+        if on_completed:
+            self.__send_with_deadline(req_dict, on_completed)
+
     def reload(self, path, alternate_path):
         args = {"file": path, "tmpfile": alternate_path}
         req_dict = self.create_req_dict("reload", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
+        self.bump_file_version(path)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
-        if self.__worker_comm.started():
-            self.__worker_comm.sendCmdSync(json_str, req_dict["seq"])
+        # <alternate_path> is reused once this returns
+        self.__mirror_and_wait(json_str, path, req_dict["seq"])
+        self.__note_shared(path)
         return response_dict
 
     def reload_on_worker(self, path, alternate_path):
         args = {"file": path, "tmpfile": alternate_path}
         req_dict = self.create_req_dict("reload", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         if self.__worker_comm.started():
+            self.__note_sent_to_worker(path)
+            self.__note_not_shared("worker", path)
             response_dict = self.__worker_comm.sendCmdSync(json_str, req_dict["seq"])
             return response_dict
 
     def reload_async(self, path, alternate_path, on_completed):
         args = {"file": path, "tmpfile": alternate_path}
         req_dict = self.create_req_dict("reload", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
+        self.bump_file_version(path)
+        mirror_count = len([comm for comm in (self.__worker_comm, self.__syntax_comm) if comm.started()])
+        if mirror_count:
+            # <alternate_path> is reused once <on_completed> is called, so wait
+            # until the worker and the syntax server have read it as well
+            on_completed = ServiceProxy.join_responses(1 + mirror_count, on_completed)
+            self.__mirror_to_worker(json_str, path, on_completed, req_dict["seq"])
+            self.__mirror_to_syntax_server(json_str, on_completed, req_dict["seq"])
         self.__comm.sendCmdAsync(json_str, on_completed, req_dict["seq"])
-        if self.__worker_comm.started():
-            self.__worker_comm.sendCmdAsync(json_str, None, req_dict["seq"])
+        self.__note_shared(path)
 
     def reload_async_on_worker(self, path, alternate_path, on_completed):
         args = {"file": path, "tmpfile": alternate_path}
         req_dict = self.create_req_dict("reload", args)
-        json_str = json_helpers.encode(req_dict)
-        if self.__worker_comm.started():
-            self.__worker_comm.sendCmdAsync(json_str, None, req_dict["seq"])
+        json_str = json_helpers.encode_request(req_dict)
+        self.__mirror_to_worker(json_str, path, on_completed, req_dict["seq"])
+        self.__note_not_shared("worker", path)
+
+    def mirrors_share_content(self, path):
+        """
+        Return whether the running worker and syntax server have the content of
+        <path> the main server has, so that edits computed against the content of
+        the main server apply to them as well
+        """
+        return not (self.__worker_comm.started() or self.__syntax_comm.started()) or \
+            len(self.__get_shared_roles(path)) == len(self.__get_mirror_roles())
+
+    def reload_on_mirrors(self, path, alternate_path):
+        """
+        Reload <path> on the worker and the syntax server, but not on the main
+        server, which must already have the content of <alternate_path>
+        """
+        args = {"file": path, "tmpfile": alternate_path}
+        req_dict = self.create_req_dict("reload", args)
+        json_str = json_helpers.encode_request(req_dict)
+        # <alternate_path> is reused once this returns
+        response_dict = self.__mirror_and_wait(json_str, path, req_dict["seq"])
+        self.__note_shared(path)
+        return response_dict
+
+    def reload_async_on_mirrors(self, path, alternate_path, on_completed):
+        args = {"file": path, "tmpfile": alternate_path}
+        req_dict = self.create_req_dict("reload", args)
+        json_str = json_helpers.encode_request(req_dict)
+        mirror_count = len(self.__get_mirror_roles())
+        # <alternate_path> is reused once <on_completed> is called
+        on_completed = ServiceProxy.join_responses(mirror_count, on_completed)
+        self.__mirror_to_worker(json_str, path, on_completed, req_dict["seq"])
+        self.__mirror_to_syntax_server(json_str, on_completed, req_dict["seq"])
+        self.__note_shared(path)
+
+    def reload_on_syntax_server(self, path, alternate_path):
+        args = {"file": path, "tmpfile": alternate_path}
+        req_dict = self.create_req_dict("reload", args)
+        json_str = json_helpers.encode_request(req_dict)
+        self.__note_not_shared("syntax", path)
+        if self.__syntax_comm.started():
+            return self.__syntax_comm.sendCmdSync(json_str, req_dict["seq"])
+
+    def reload_async_on_syntax_server(self, path, alternate_path, on_completed):
+        args = {"file": path, "tmpfile": alternate_path}
+        req_dict = self.create_req_dict("reload", args)
+        json_str = json_helpers.encode_request(req_dict)
+        self.__mirror_to_syntax_server(json_str, on_completed, req_dict["seq"])
+        self.__note_not_shared("syntax", path)
 
     def rename(self, path, location=Location(1, 1)):
         args = {"file": path, "line": location.line, "offset": location.offset}
         req_dict = self.create_req_dict("rename", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
-        if self.__worker_comm.started():
-            self.__worker_comm.sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def rename_async(self, path, location, on_completed):
+        args = {"file": path, "line": location.line, "offset": location.offset}
+        req_dict = self.create_req_dict("rename", args)
+        self.__send_with_deadline(req_dict, on_completed)
+
     def get_applicable_refactors_async(self, path, start_loc, end_loc, on_completed):
         args = {
             "file": path,
@@ -236,7 +416,7 @@ class ServiceProxy:
             "endOffset": end_loc.offset,
         }
         req_dict = self.create_req_dict("getApplicableRefactors", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         self.__comm.sendCmdAsync(json_str, on_completed, req_dict["seq"])
 
     def get_edits_for_refactor_async(self, path, refactor_name, action_name, start_loc, end_loc, on_completed):
@@ -250,7 +430,7 @@ class ServiceProxy:
             "action": action_name,
         }
         req_dict = self.create_req_dict("getEditsForRefactor", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdAsync(json_str, on_completed, req_dict["seq"])
         #on_completed(response_dict)
         #return response_dict
@@ -259,33 +439,45 @@ class ServiceProxy:
     def request_get_err(self, delay=0, pathList=[]):
         args = {"files": pathList, "delay": delay}
         req_dict = self.create_req_dict("geterr", args)
-        json_str = json_helpers.encode(req_dict)
-        self.__comm.postCmd(json_str)
+        json_str = json_helpers.encode_request(req_dict)
+        self.__comm.postCmd(json_str, req_dict["seq"], ("geterr", tuple(pathList)))
 
     def request_get_err_for_project(self, delay=0, path=""):
         args = {"file": path, "delay": delay}
         req_dict = self.create_req_dict("geterrForProject", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         if self.__worker_comm.started():
             self.__worker_comm.postCmd(json_str)
 
     def type(self, path, location=Location(1, 1)):
         args = {"file": path, "line": location.line, "offset": location.offset}
         req_dict = self.create_req_dict("type", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def type_async(self, path, location, on_completed):
+        args = {"file": path, "line": location.line, "offset": location.offset}
+        req_dict = self.create_req_dict("type", args)
+        on_completed = self.__attach_to_in_flight(req_dict, on_completed)
+        if on_completed:
+            self.__send_with_deadline(req_dict, on_completed)
+
     def quick_info(self, path, location=Location(1, 1), on_completed=None):
         args = {"file": path, "line": location.line, "offset": location.offset}
         req_dict = self.create_req_dict("quickinfo", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         callback = on_completed or (lambda: None)
         if not IS_ST2:
+            callback = self.__attach_to_in_flight(req_dict, callback)
+            if not callback:
+                return
+            self.cancel_superseded("quickinfo", req_dict["seq"])
             self.__comm.sendCmdAsync(
                 json_str,
                 callback,
-                req_dict["seq"]
+                req_dict["seq"],
+                ("quickinfo", path)
             )
         else:
             self.__comm.sendCmd(
@@ -297,9 +489,14 @@ class ServiceProxy:
     def quick_info_full(self, path, location=Location(1, 1), on_completed=None):
         args = {"file": path, "line": location.line, "offset": location.offset}
         req_dict = self.create_req_dict("quickinfo-full", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         callback = on_completed or (lambda: None)
         if not IS_ST2:
+            callback = self.__attach_to_in_flight(req_dict, callback)
+            if not callback:
+                return
+            # the user is hovering and waits for the popup, so unlike the
+            # quickinfo of the idle listener this goes in the interactive lane
             self.__comm.sendCmdAsync(
                 json_str,
                 callback,
@@ -315,27 +512,59 @@ class ServiceProxy:
     def save_to(self, path, alternatePath):
         args = {"file": path, "tmpfile": alternatePath}
         req_dict = self.create_req_dict("saveto", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         self.__comm.postCmd(json_str)
 
     def nav_to(self, search_text, file_name):
         args = {"searchValue": search_text, "file": file_name, "maxResultCount": 20}
         req_dict = self.create_req_dict("navto", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def nav_to_async(self, search_text, file_name, on_completed):
+        args = {"searchValue": search_text, "file": file_name, "maxResultCount": 20}
+        req_dict = self.create_req_dict("navto", args)
+        on_completed = self.__attach_to_in_flight(req_dict, on_completed)
+        if on_completed:
+            self.__send_with_deadline(req_dict, on_completed)
+
     def project_info(self, file_name, need_file_name_list=False):
         args = {"file": file_name, "needFileNameList": need_file_name_list}
         req_dict = self.create_req_dict("projectInfo", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         return self.__comm.sendCmdSync(json_str, req_dict["seq"])
 
+    def project_info_async(self, file_name, on_completed, need_file_name_list=False):
+        args = {"file": file_name, "needFileNameList": need_file_name_list}
+        req_dict = self.create_req_dict("projectInfo", args)
+        on_completed = self.__attach_to_in_flight(req_dict, on_completed)
+        if on_completed:
+            self.__send_with_deadline(req_dict, on_completed)
+
+    def project_info_on_worker(self, file_name, on_completed):
+        args = {"file": file_name, "needFileNameList": False}
+        req_dict = self.create_req_dict("projectInfo", args)
+        json_str = json_helpers.encode_request(req_dict)
+        if self.__worker_comm.started():
+            self.__worker_comm.sendCmdAsync(json_str, on_completed, req_dict["seq"])
+
     def async_document_highlights(self, path, location, on_completed=None):
         args = {"line": location.line, "offset": location.offset, "file": path, "filesToSearch": [path]}
         req_dict = self.create_req_dict("documentHighlights", args)
-        json_str = json_helpers.encode(req_dict)
-        self.__comm.sendCmdAsync(json_str, on_completed, req_dict["seq"])
+        json_str = json_helpers.encode_request(req_dict)
+        callback = self.__attach_to_in_flight(req_dict, on_completed or (lambda response_dict: None))
+        if callback:
+            self.__comm.sendCmdAsync(json_str, callback, req_dict["seq"], ("documentHighlights", path))
+
+    def request(self, command_name, args=None):
+        """
+        Send a request to the main server and return a concurrent.futures.Future
+        resolved with its response, see NodeCommClient.request
+        """
+        req_dict = self.create_req_dict(command_name, args)
+        json_str = json_helpers.encode_request(req_dict)
+        return self.__comm.request(json_str, req_dict["seq"])
 
     def add_event_handler(self, event_name, cb):
         self.__comm.add_event_handler(event_name, cb)
@@ -343,6 +572,185 @@ class ServiceProxy:
     def add_event_handler_for_worker(self, event_name, cb):
         self.__worker_comm.add_event_handler(event_name, cb)
 
+    def cancel_superseded(self, command_name, seq=None):
+        """
+        Cancel the previous <command_name> request if the server is still working on it;
+        <seq> is the request replacing it, if any
+        """
+        previous_seq = self.__latest_seqs.get(command_name)
+        self.__latest_seqs[command_name] = seq
+        if previous_seq is not None and self.__comm.is_pending(previous_seq):
+            self.__comm.cancel(previous_seq)
+
+    def get_file_version(self, path):
+        with self.__in_flight_lock:
+            return self.__file_versions.get(path, 0)
+
+    def bump_file_version(self, path):
+        """Note that the servers get a new content of <path>"""
+        with self.__in_flight_lock:
+            self.__file_versions[path] = self.__file_versions.get(path, 0) + 1
+
+    def __mirror_to_worker(self, json_str, path=None, on_completed=None, seq=None):
+        """
+        Send a command that changes the server state to the worker as well,
+        without waiting for it; the post queue of the worker sends these in
+        order, and away from the requests of the main server. <path> is the
+        file whose content the worker gets with the command, see stale_files_on_worker
+        """
+        if not self.__worker_comm.started():
+            return
+        if path is not None:
+            self.__note_sent_to_worker(path)
+        if on_completed:
+            self.__worker_comm.sendCmdAsync(json_str, on_completed, seq)
+        else:
+            self.__worker_comm.postCmd(json_str)
+
+    def __mirror_to_syntax_server(self, json_str, on_completed=None, seq=None):
+        """Send a command that changes the content or the settings of a file to the syntax server as well"""
+        if not self.__syntax_comm.started():
+            return
+        if on_completed:
+            self.__syntax_comm.sendCmdAsync(json_str, on_completed, seq)
+        else:
+            self.__syntax_comm.postCmd(json_str)
+
+    def __mirror_and_wait(self, json_str, path, seq, timeout=2):
+        """
+        Send a command to the worker and the syntax server, and wait until both
+        have answered, or until <timeout> seconds elapse; for commands that name a
+        file which is reused once they are answered. Returns the first response,
+        or None if neither server is running or answered in time.
+        """
+        mirror_count = len([comm for comm in (self.__worker_comm, self.__syntax_comm) if comm.started()])
+        if not mirror_count:
+            return None
+        responses = []
+        answered = threading.Event()
+
+        def on_completed(response_dict):
+            responses.append(response_dict)
+            answered.set()
+        on_response = ServiceProxy.join_responses(mirror_count, on_completed)
+        self.__mirror_to_worker(json_str, path, on_response, seq)
+        self.__mirror_to_syntax_server(json_str, on_response, seq)
+        answered.wait(timeout)
+        return responses[0] if responses else None
+
+    def __syntax_or_main_comm(self):
+        return self.__syntax_comm if self.__syntax_comm.started() else self.__comm
+
+    def __note_sent_to_worker(self, path):
+        with self.__in_flight_lock:
+            self.__worker_file_versions[path] = self.__file_versions.get(path, 0)
+
+    def forget_worker_files(self):
+        """Note that a newly started worker doesn't have any file yet"""
+        with self.__in_flight_lock:
+            self.__worker_file_versions.clear()
+            self.__shared_versions["worker"].clear()
+
+    def __get_mirror_roles(self):
+        roles = []
+        if self.__worker_comm.started():
+            roles.append("worker")
+        if self.__syntax_comm.started():
+            roles.append("syntax")
+        return roles
+
+    def __get_shared_roles(self, path):
+        """Return the running mirrors that have the content of <path> the main server has"""
+        with self.__in_flight_lock:
+            version = self.__file_versions.get(path, 0)
+            return [role for role in self.__get_mirror_roles() if self.__shared_versions[role].get(path) == version]
+
+    def __note_shared(self, path, roles=None):
+        """Note that the mirrors in <roles>, all running ones by default, got the content of the main server"""
+        with self.__in_flight_lock:
+            version = self.__file_versions.get(path, 0)
+            for role in self.__get_mirror_roles() if roles is None else roles:
+                self.__shared_versions[role][path] = version
+
+    def __note_not_shared(self, role, path):
+        with self.__in_flight_lock:
+            self.__shared_versions[role].pop(path, None)
+
+    def stale_files_on_worker(self, paths):
+        """Return those of <paths> whose latest content the worker hasn't been sent"""
+        with self.__in_flight_lock:
+            return [path for path in paths
+                    if self.__worker_file_versions.get(path) != self.__file_versions.get(path, 0)]
+
+    @staticmethod
+    def join_responses(count, on_completed):
+        """Return a callback that calls <on_completed> with the first of <count> responses once all have arrived"""
+        responses = []
+        lock = threading.Lock()
+
+        def on_response(response_dict):
+            with lock:
+                responses.append(response_dict)
+                done = len(responses) == count
+            if done and on_completed:
+                on_completed(responses[0])
+        return on_response
+
+    def __attach_to_in_flight(self, req_dict, on_completed):
+        """
+        Coalesce identical read-only requests: if a request with the same command
+        and arguments is in flight for the same version of its file, add
+        <on_completed> to the callers of that request and return None, so no
+        duplicate is sent. Otherwise return the callback to send <req_dict> with;
+        it answers <on_completed> and every caller attached in the meantime.
+
+        A request that is refused by the post queue answers every caller with
+        the failed response at once; one that is never answered is only joined
+        until the deadline of its command has passed.
+        """
+        command_name = req_dict["command"]
+        args = req_dict.get("arguments", {})
+        now = time.time()
+        with self.__in_flight_lock:
+            key = (command_name, json.dumps(args, sort_keys=True), self.__file_versions.get(args.get("file"), 0))
+            entry = self.__in_flight_reads.get(key)
+            if entry is not None and now < entry[1]:
+                entry[0].append(on_completed)
+                self.duplicate_requests_avoided += 1
+                return None
+            for stale_key in [k for (k, (_, expiry)) in self.__in_flight_reads.items() if now >= expiry]:
+                del self.__in_flight_reads[stale_key]
+            callbacks = [on_completed]
+            self.__in_flight_reads[key] = (callbacks, now + self.get_deadline(command_name))
+
+        def on_response(response_dict):
+            with self.__in_flight_lock:
+                entry = self.__in_flight_reads.get(key)
+                if entry is not None and entry[0] is callbacks:
+                    del self.__in_flight_reads[key]
+            for callback in callbacks:
+                callback(response_dict)
+        return on_response
+
+    def get_deadline(self, command_name):
+        settings = sublime.load_settings('Preferences.sublime-settings')
+        deadlines = settings.get('tsserver_request_deadlines', {})
+        return deadlines.get(command_name, ServiceProxy.DEFAULT_DEADLINES.get(command_name, 5))
+
+    def __send_with_deadline(self, req_dict, on_completed, comm=None):
+        """
+        Send a request without blocking; <on_completed> is called on the UI thread
+        with the response, or with a timeout response once the command's deadline passes
+        """
+        comm = comm or self.__comm
+        json_str = json_helpers.encode_request(req_dict)
+        if IS_ST2:
+            # Sublime Text 2 can't call the API from other threads
+            comm.sendCmd(json_str, on_completed, req_dict["seq"])
+        else:
+            deadline = self.get_deadline(req_dict["command"])
+            comm.sendCmdWithDeadline(json_str, on_completed, req_dict["seq"], deadline)
+
     def create_req_dict(self, command_name, args=None):
         req_dict = {
             "command": command_name,
@@ -358,19 +766,33 @@ class ServiceProxy:
             "file": path
         }
         req_dict = self.create_req_dict("semanticDiagnosticsSync", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def get_semantic_errors_async(self, path, on_completed):
+        args = {
+            "file": path
+        }
+        req_dict = self.create_req_dict("semanticDiagnosticsSync", args)
+        self.__send_with_deadline(req_dict, on_completed)
+
     def get_syntactic_errors(self, path):
         args = {
             "file": path
         }
         req_dict = self.create_req_dict("syntacticDiagnosticsSync", args)
-        json_str = json_helpers.encode(req_dict)
-        response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
+        json_str = json_helpers.encode_request(req_dict)
+        response_dict = self.__syntax_or_main_comm().sendCmdSync(json_str, req_dict["seq"])
         return response_dict
 
+    def get_syntactic_errors_async(self, path, on_completed):
+        args = {
+            "file": path
+        }
+        req_dict = self.create_req_dict("syntacticDiagnosticsSync", args)
+        self.__send_with_deadline(req_dict, on_completed, self.__syntax_or_main_comm())
+
     def get_code_fixes(self, path, startLine, startOffset, endLine, endOffset, errorCodes):
         args = {
             "file": path,
@@ -381,6 +803,18 @@ class ServiceProxy:
             "errorCodes": errorCodes
         }
         req_dict = self.create_req_dict("getCodeFixes", args)
-        json_str = json_helpers.encode(req_dict)
+        json_str = json_helpers.encode_request(req_dict)
         response_dict = self.__comm.sendCmdSync(json_str, req_dict["seq"])
         return response_dict
+
+    def get_code_fixes_async(self, path, startLine, startOffset, endLine, endOffset, errorCodes, on_completed):
+        args = {
+            "file": path,
+            "startLine": startLine,
+            "startOffset": startOffset,
+            "endLine": endLine,
+            "endOffset": endOffset,
+            "errorCodes": errorCodes
+        }
+        req_dict = self.create_req_dict("getCodeFixes", args)
+        self.__send_with_deadline(req_dict, on_completed)
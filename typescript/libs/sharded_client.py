@@ -0,0 +1,297 @@
+import collections
+import os
+import threading
+import time
+
+from .logger import log
+from . import json_helpers
+from .node_client import CommClient, ServerClient
+
+# commands that configure the server as a whole go to every shard, and are
+# replayed on shards started later; with a file, they only configure that file
+# and go to its shard, with its 'open'
+BROADCAST_COMMANDS = ("configure", "compilerOptionsForInferredProjects")
+CONFIG_FILE_NAMES = ("tsconfig.json", "jsconfig.json")
+
+
+class _Shard(object):
+    def __init__(self, client):
+        self.client = client
+        # config files of the projects routed to this shard
+        self.config_files = set()
+        self.last_used = time.time()
+
+
+class ShardedClient(CommClient):
+    """
+    Runs one tsserver per project, so requests for unrelated projects are
+    served in parallel and each server only holds the programs of its own
+    projects.
+
+    Requests are routed by the config file that owns their file: the nearest
+    tsconfig.json or jsconfig.json above it, found the way tsserver finds it;
+    files without one share a shard for inferred projects. At most
+    'max_servers' shards run at a time. When another project needs one, the
+    least recently used idle shard is stopped; if every shard is busy, the
+    project shares the least recently used one instead.
+
+    Files open on a stopped shard are opened again on the shard that next
+    serves their project, and 'on_files_reopened' is called with their names
+    so that their unsaved content can be sent again.
+    """
+
+    def __init__(self, script_path, max_servers=4, on_files_reopened=None):
+        self.script_path = script_path
+        self.max_servers = max_servers
+        self.on_files_reopened = on_files_reopened
+        self.lock = threading.RLock()
+        self.shards = []
+        self.shard_of_config = {}
+        self.config_of_dir = {}
+        # the 'open' command of every open file, and the file's config file
+        self.open_cmds = {}
+        self.config_of_file = {}
+        # open files whose shard has been stopped
+        self.orphaned_files = set()
+        self.broadcast_cmds = collections.OrderedDict()
+        # broadcast commands for a single file, by (command, file name)
+        self.file_cmds = collections.OrderedDict()
+        self.event_handlers = dict()
+        self.max_queued_requests = None
+        self.evicted_count = 0
+
+    def get_config_file(self, file_name):
+        """Return the config file that owns <file_name>, or None for an inferred project"""
+        directory = os.path.dirname(file_name)
+        searched = []
+        config_file = None
+        while True:
+            if directory in self.config_of_dir:
+                config_file = self.config_of_dir[directory]
+                break
+            searched.append(directory)
+            found = [os.path.join(directory, name) for name in CONFIG_FILE_NAMES
+                     if os.path.isfile(os.path.join(directory, name))]
+            if found:
+                config_file = found[0]
+                break
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                break
+            directory = parent
+        for searched_dir in searched:
+            self.config_of_dir[searched_dir] = config_file
+        return config_file
+
+    def get_shard(self, config_file):
+        shard = self.shard_of_config.get(config_file)
+        if shard is None:
+            if len(self.shards) >= self.max_servers:
+                by_age = sorted(self.shards, key=lambda s: s.last_used)
+                idle = [s for s in by_age if s.client.is_idle()]
+                if idle:
+                    self.evict(idle[0])
+                else:
+                    shard = by_age[0]
+            if shard is None:
+                shard = self.start_shard()
+            self.assign(config_file, shard)
+        shard.last_used = time.time()
+        return shard
+
+    def start_shard(self):
+        client = ServerClient(self.script_path)
+        for event_name, handlers in self.event_handlers.items():
+            for cb in handlers:
+                client.add_event_handler(event_name, cb)
+        if self.max_queued_requests is not None:
+            client.set_max_queued_requests(self.max_queued_requests)
+        for cmd in self.broadcast_cmds.values():
+            client.postCmd(cmd)
+        shard = _Shard(client)
+        client.on_restarted = lambda: self.on_shard_restarted(shard)
+        self.shards.append(shard)
+        log.debug("started tsserver shard {0} of {1}".format(len(self.shards), self.max_servers))
+        return shard
+
+    def assign(self, config_file, shard):
+        shard.config_files.add(config_file)
+        self.shard_of_config[config_file] = shard
+        reopened = [file_name for file_name in self.orphaned_files if self.config_of_file[file_name] == config_file]
+        for file_name in reopened:
+            self.orphaned_files.discard(file_name)
+            self.reopen_file(shard.client, file_name)
+        if reopened and self.on_files_reopened:
+            self.on_files_reopened(reopened)
+        log.debug("project {0} served by shard {1}".format(config_file, self.shards.index(shard) + 1))
+
+    def on_shard_restarted(self, shard):
+        """Bring a shard that crashed and was started again back to the state of the editor"""
+        with self.lock:
+            for cmd in self.broadcast_cmds.values():
+                shard.client.postCmd(cmd)
+            reopened = [file_name for (file_name, config_file) in self.config_of_file.items()
+                        if config_file in shard.config_files]
+            for file_name in reopened:
+                self.reopen_file(shard.client, file_name)
+        if reopened and self.on_files_reopened:
+            self.on_files_reopened(reopened)
+
+    def reopen_file(self, client, file_name):
+        client.postCmd(self.open_cmds[file_name])
+        for (command, cmd_file_name), cmd in self.file_cmds.items():
+            if cmd_file_name == file_name:
+                client.postCmd(cmd)
+
+    def evict(self, shard):
+        log.debug("stopping tsserver shard of {0}".format(", ".join(str(c) for c in shard.config_files)))
+        self.shards.remove(shard)
+        for config_file in shard.config_files:
+            del self.shard_of_config[config_file]
+        self.orphaned_files.update(
+            file_name for (file_name, config_file) in self.config_of_file.items() if config_file in shard.config_files)
+        shard.client.stop()
+        self.evicted_count += 1
+
+    def route(self, cmd):
+        """
+        Return (client, cmd) pairs that serve <cmd>: one for a request about a
+        file, one per shard for configuration commands and for a geterr
+        request on files of several projects
+        """
+        req_dict = json_helpers.decode(cmd)
+        command = req_dict.get("command")
+        args = req_dict.get("arguments") or {}
+        file_name = ShardedClient.get_file(args)
+        if (command in BROADCAST_COMMANDS and not file_name) or command == "exit":
+            if command != "exit":
+                self.broadcast_cmds[command] = cmd
+            return [(shard.client, cmd) for shard in self.shards]
+        if command == "geterr":
+            return self.split_get_err(req_dict, cmd)
+
+        config_file = self.get_config_file(file_name) if file_name else None
+        if command in BROADCAST_COMMANDS:
+            self.file_cmds[(command, file_name)] = cmd
+        elif command == "open":
+            self.open_cmds[file_name] = cmd
+            self.config_of_file[file_name] = config_file
+            self.orphaned_files.discard(file_name)
+        elif command == "close":
+            self.open_cmds.pop(file_name, None)
+            self.config_of_file.pop(file_name, None)
+            for key in [key for key in self.file_cmds if key[1] == file_name]:
+                del self.file_cmds[key]
+            self.orphaned_files.discard(file_name)
+            if config_file not in self.shard_of_config:
+                # its shard has been stopped; there is nothing to close
+                return []
+        return [(self.get_shard(config_file).client, cmd)]
+
+    @staticmethod
+    def get_file(args):
+        if "file" in args:
+            return args["file"]
+        scope_args = args.get("scope", {}).get("args", {})
+        if "file" in scope_args:
+            return scope_args["file"]
+        files = args.get("files")
+        return files[0] if files else None
+
+    def split_get_err(self, req_dict, cmd):
+        files_by_client = collections.OrderedDict()
+        for file_name in req_dict["arguments"]["files"]:
+            client = self.get_shard(self.get_config_file(file_name)).client
+            files_by_client.setdefault(client, []).append(file_name)
+        if len(files_by_client) == 1:
+            return [(client, cmd) for client in files_by_client]
+        requests = []
+        for client, files in files_by_client.items():
+            req_dict["arguments"]["files"] = files
+            requests.append((client, json_helpers.encode(req_dict)))
+        return requests
+
+    def started(self):
+        return True
+
+    def postCmd(self, cmd, seq=None, background_key=None):
+        with self.lock:
+            requests = self.route(cmd)
+        if not requests:
+            # a configuration command before the first shard, which is replayed
+            # on it, or the close of a file whose shard has been stopped
+            return True
+        accepted = False
+        for client, shard_cmd in requests:
+            accepted = client.postCmd(shard_cmd, seq, background_key) or accepted
+        return accepted
+
+    def sendCmd(self, cmd, cb, seq):
+        with self.lock:
+            client = self.route(cmd)[0][0]
+        client.sendCmd(cmd, cb, seq)
+
+    def sendCmdAsync(self, cmd, cb, seq, background_key=None):
+        with self.lock:
+            client = self.route(cmd)[0][0]
+        client.sendCmdAsync(cmd, cb, seq, background_key)
+
+    def sendCmdWithDeadline(self, cmd, cb, seq, deadline):
+        with self.lock:
+            client = self.route(cmd)[0][0]
+        client.sendCmdWithDeadline(cmd, cb, seq, deadline)
+
+    def request(self, cmd, seq):
+        with self.lock:
+            client = self.route(cmd)[0][0]
+        return client.request(cmd, seq)
+
+    def sendCmdSync(self, cmd, seq):
+        with self.lock:
+            client = self.route(cmd)[0][0]
+        return client.sendCmdSync(cmd, seq)
+
+    def add_event_handler(self, event_name, cb):
+        # kept for the shards started later
+        if event_name not in self.event_handlers:
+            self.event_handlers[event_name] = []
+        if cb not in self.event_handlers[event_name]:
+            self.event_handlers[event_name].append(cb)
+        with self.lock:
+            for shard in self.shards:
+                shard.client.add_event_handler(event_name, cb)
+
+    def is_idle(self):
+        return all(shard.client.is_idle() for shard in self.shards)
+
+    def is_pending(self, seq):
+        return any(shard.client.is_pending(seq) for shard in self.shards)
+
+    def cancel(self, seq):
+        # seqs are unique across shards, so only the shard that sent the request knows it
+        for shard in self.shards:
+            if shard.client.is_pending(seq):
+                return shard.client.cancel(seq)
+        return False
+
+    def mark_exiting(self):
+        with self.lock:
+            for shard in self.shards:
+                shard.client.mark_exiting()
+
+    def set_max_queued_requests(self, max_depth):
+        self.max_queued_requests = max_depth
+        for shard in self.shards:
+            shard.client.set_max_queued_requests(max_depth)
+
+    def get_pid(self):
+        return None
+
+    def get_diagnostics(self):
+        lines = ["{0} of at most {1} servers running, {2} stopped to make room".format(
+            len(self.shards), self.max_servers, self.evicted_count)]
+        for shard in self.shards:
+            lines.append("server for {0}, last used {1:.0f}s ago".format(
+                ", ".join(c or "inferred projects" for c in shard.config_files), time.time() - shard.last_used))
+            lines.extend("    " + line for line in shard.client.get_diagnostics())
+        return lines
@@ -0,0 +1,70 @@
+import collections
+import threading
+import time
+import sublime
+
+# the steps of starting the main tsserver, in order, with their description
+STEPS = collections.OrderedDict([
+    ("discovery", "node found"),
+    ("spawn", "tsserver spawned"),
+    ("configure", "first configure written to tsserver"),
+    ("response", "first response (configure) received"),
+])
+
+
+class StartupProfile(object):
+    """
+    Time of each step of starting the main tsserver, measured from the
+    initialization of the plugin. Steps are recorded by whichever thread
+    reaches them; only the first time counts, so a restart after a crash
+    doesn't overwrite the numbers of the startup.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = None
+        self.times = {}
+        self.notes = {}
+
+    def start(self):
+        with self.lock:
+            self.start_time = time.time()
+            self.times.clear()
+            self.notes.clear()
+
+    def mark(self, step, note=None):
+        with self.lock:
+            if self.start_time is None or step in self.times:
+                return
+            self.times[step] = time.time()
+            if note:
+                self.notes[step] = note
+            complete = len(self.times) == len(STEPS)
+        if complete:
+            settings = sublime.load_settings('Preferences.sublime-settings')
+            if settings.get("tsserver_startup_report", False):
+                print("TypeScript startup:\n" + "\n".join(self.get_lines()))
+
+    def get_lines(self):
+        if self.start_time is None:
+            return ["not started"]
+        lines = []
+        previous = self.start_time
+        for step, description in STEPS.items():
+            if step not in self.times:
+                lines.append("{0}: not yet".format(description))
+                continue
+            line = "{0}: {1:.0f}ms after start, {2:.0f}ms for this step".format(
+                description, (self.times[step] - self.start_time) * 1000, (self.times[step] - previous) * 1000)
+            if step in self.notes:
+                line += " ({0})".format(self.notes[step])
+            lines.append(line)
+            previous = self.times[step]
+        return lines
+
+
+_default_profile = StartupProfile()
+
+
+def startup_profile():
+    return _default_profile
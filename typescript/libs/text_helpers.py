@@ -1,3 +1,4 @@
+import difflib
 import sublime
 
 from .global_vars import *
@@ -126,4 +127,126 @@ def build_replace_regions(empty_regions_a, empty_regions_b):
     for i in range(len(empty_regions_a)):
         rr.append(sublime.Region(empty_regions_a[i].begin(), empty_regions_b[i].begin()))
     return rr
-    
\ No newline at end of file
+    
+
+def split_lines(text):
+    """Split text into lines that keep their line break; lines are separated by '\\n' only, as in a view"""
+    parts = text.split("\n")
+    lines = [part + "\n" for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+def get_utf16_length(text):
+    """Return the length of text in UTF-16 code units, which tsserver counts offsets in"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def get_index_of_utf16_offset(line, offset):
+    """
+    Return the index in <line> of the zero-based UTF-16 <offset>, or None if it
+    is past the end of the line; an offset within a surrogate pair counts as
+    the character after it
+    """
+    if get_utf16_length(line) == len(line):
+        return offset if offset <= len(line) else None
+    units = 0
+    for index, char in enumerate(line):
+        if units >= offset:
+            return index
+        units += 2 if ord(char) > 0xFFFF else 1
+    return len(line) if units >= offset else None
+
+
+def apply_changes_to_text(text, changes):
+    """
+    Apply (location, end_location, insert_string) changes, with the one-based
+    locations of the server protocol, to text in order. Offsets are UTF-16 code
+    units, as tsserver applies them. Returns None if a location is outside the text
+    """
+    lines = text.split("\n")
+    for location, end_location, insert_string in changes:
+        first, last = location.line - 1, end_location.line - 1
+        if first < 0 or last < first or last >= len(lines):
+            return None
+        start = get_index_of_utf16_offset(lines[first], location.offset - 1)
+        end = get_index_of_utf16_offset(lines[last], end_location.offset - 1)
+        if start is None or end is None:
+            return None
+        changed = lines[first][:start] + insert_string + lines[last][end:]
+        lines[first:last + 1] = changed.split("\n")
+    return "\n".join(lines)
+
+
+def common_prefix_length(a, b, block_size=4096):
+    length = 0
+    limit = min(len(a), len(b))
+    # compare a block at a time, then the characters of the first block that differs
+    while length < limit and a[length:length + block_size] == b[length:length + block_size]:
+        length += block_size
+    length = min(length, limit)
+    while length < limit and a[length] == b[length]:
+        length += 1
+    return length
+
+
+def common_suffix_length(a, b, limit, block_size=4096):
+    length = 0
+    while length < limit and length + block_size <= min(len(a), len(b)) and \
+            a[len(a) - length - block_size:len(a) - length] == b[len(b) - length - block_size:len(b) - length]:
+        length += block_size
+    length = min(length, limit)
+    while length < limit and a[len(a) - length - 1] == b[len(b) - length - 1]:
+        length += 1
+    return length
+
+
+def get_line_start_location(lines, index, first_line=0):
+    """
+    Return the Location of the start of line <index> of <lines>, which start
+    at line <first_line> of their text, or of the end of the text past the last line
+    """
+    if index < len(lines) or not lines or lines[-1].endswith("\n"):
+        return Location(first_line + index + 1, 1)
+    # the last line has no line break; tsserver counts offsets in UTF-16 code units
+    return Location(first_line + len(lines), get_utf16_length(lines[-1]) + 1)
+
+
+def diff_text_edits(old_text, new_text, max_matched_lines=5000):
+    """
+    Return the edits turning <old_text> into <new_text> as (location,
+    end_location, insert_string) tuples, last edit first, so that each edit
+    leaves the locations of the next ones unchanged. The text common to the
+    start and the end is skipped first, a line at a time; the lines in between
+    are matched unless there are more than <max_matched_lines>, then they are
+    replaced at once
+    """
+    prefix = common_prefix_length(old_text, new_text)
+    start = old_text.rfind("\n", 0, prefix) + 1
+    suffix = common_suffix_length(old_text, new_text, min(len(old_text), len(new_text)) - prefix)
+    old_end = len(old_text) - suffix
+    if old_end > start and old_text[old_end - 1] != "\n":
+        # let the common end start at a line too
+        line_end = old_text.find("\n", old_end)
+        old_end = line_end + 1 if line_end >= 0 else len(old_text)
+    new_end = len(new_text) - (len(old_text) - old_end)
+    old_lines = split_lines(old_text[start:old_end])
+    new_lines = split_lines(new_text[start:new_end])
+    if not old_lines and not new_lines:
+        return []
+    first_line = old_text.count("\n", 0, start)
+    if len(old_lines) > max_matched_lines or len(new_lines) > max_matched_lines:
+        opcodes = [("replace", 0, len(old_lines), 0, len(new_lines))]
+    else:
+        opcodes = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False).get_opcodes()
+    edits = []
+    for tag, i1, i2, j1, j2 in reversed(opcodes):
+        if tag == "equal":
+            continue
+        edits.append((
+            get_line_start_location(old_lines, i1, first_line),
+            get_line_start_location(old_lines, i2, first_line),
+            "".join(new_lines[j1:j2])
+        ))
+    return edits
@@ -0,0 +1,280 @@
+// Runs one tsserver for any number of editor clients connected to a Unix domain socket.
+//
+// usage: node tsserver_broker.js <socket path> <idle seconds> -- <server command...>
+//
+// Clients write requests as JSON lines and read Content-Length framed messages,
+// exactly as they would on the stdio of a tsserver they spawned themselves; the
+// server command can be any process speaking that protocol. The broker keeps
+// running while clients come and go, so a client reconnecting after a plugin
+// reload finds the program of the previous session already built. It exits
+// when its server exits, or when no client has been connected for <idle seconds>.
+"use strict";
+
+var childProcess = require("child_process");
+var fs = require("fs");
+var net = require("net");
+
+// request seqs are multiplexed as seq * MAX_CLIENTS + client slot
+var MAX_CLIENTS = 1024;
+var PEEK_SIZE = 256;
+
+var args = process.argv.slice(2);
+var separator = args.indexOf("--");
+if (args.length < 4 || separator !== 2) {
+    process.stderr.write("usage: tsserver_broker.js <socket path> <idle seconds> -- <server command...>\n");
+    process.exit(2);
+}
+var socketPath = args[0];
+var idleSeconds = Number(args[1]);
+var serverCommand = args.slice(3);
+
+var clients = [];
+var idleTimer = null;
+var nextBrokerSeq = 1;
+var server = null;
+
+function log(message) {
+    process.stderr.write("[tsserver_broker " + new Date().toISOString() + "] " + message + "\n");
+}
+
+function shutdown(code) {
+    try {
+        fs.unlinkSync(socketPath);
+    } catch (e) {
+    }
+    try {
+        fs.unlinkSync(socketPath + ".pid");
+    } catch (e) {
+    }
+    if (server) {
+        server.kill();
+    }
+    process.exit(code);
+}
+
+/** Return a data handler that calls <onMessage> with the body of each complete Content-Length frame */
+function readFrames(onMessage) {
+    // chunks of the incomplete frame are kept apart and joined once it is
+    // complete, so a large response isn't copied again for every chunk
+    var chunks = [];
+    var buffered = 0;
+    var bodyStart = -1;
+    var frameEnd = 0;
+    return function (data) {
+        chunks.push(data);
+        buffered += data.length;
+        while (buffered > 0) {
+            if (bodyStart < 0) {
+                // a header split across chunks is only a few bytes long
+                var head = chunks.length === 1 ? chunks[0] : Buffer.concat(chunks, buffered);
+                chunks = [head];
+                var headerEnd = head.indexOf("\r\n\r\n");
+                if (headerEnd < 0) {
+                    return;
+                }
+                var match = /Content-Length: *(\d+)/i.exec(head.toString("ascii", 0, headerEnd));
+                bodyStart = headerEnd + 4;
+                frameEnd = bodyStart + (match ? Number(match[1]) : 0);
+            }
+            if (buffered < frameEnd) {
+                return;
+            }
+            var buffer = chunks.length === 1 ? chunks[0] : Buffer.concat(chunks, buffered);
+            var body = buffer.toString("utf8", bodyStart, frameEnd);
+            var rest = buffer.slice(frameEnd);
+            chunks = rest.length ? [rest] : [];
+            buffered = rest.length;
+            bodyStart = -1;
+            onMessage(body);
+        }
+    };
+}
+
+function writeFrame(socket, body) {
+    if (socket.destroyed) {
+        return;
+    }
+    socket.write("Content-Length: " + Buffer.byteLength(body, "utf8") + "\r\n\r\n" + body);
+}
+
+function writeToServer(request) {
+    server.stdin.write(JSON.stringify(request) + "\n");
+}
+
+function isOpenElsewhere(client, file) {
+    return clients.some(function (other) {
+        return other && other !== client && other.openFiles.has(file);
+    });
+}
+
+/** Route a message from the server to the client that sent the request, or to everyone */
+function onServerMessage(body) {
+    var head = body.slice(0, PEEK_SIZE);
+    var type = /"type":"(\w+)"/.exec(head);
+    var event = /"event":"(\w+)"/.exec(head);
+    var requestSeq = /"request_seq":(\d+)/.exec(head);
+    var routed = type && requestSeq && (type[1] === "response" || (event && event[1] === "requestCompleted"));
+    if (!routed) {
+        // diagnostics and project events concern every client
+        clients.forEach(function (client) {
+            if (client) {
+                writeFrame(client.socket, body);
+            }
+        });
+        return;
+    }
+    var brokerSeq = Number(requestSeq[1]);
+    var client = clients[brokerSeq % MAX_CLIENTS];
+    if (!client) {
+        // sent by the broker itself, or by a client that is gone
+        return;
+    }
+    var clientSeq = Math.floor(brokerSeq / MAX_CLIENTS);
+    writeFrame(client.socket, body.replace(requestSeq[0], '"request_seq":' + clientSeq));
+}
+
+function startServer() {
+    server = childProcess.spawn(serverCommand[0], serverCommand.slice(1), { stdio: ["pipe", "pipe", "inherit"] });
+    server.on("exit", function (code, signal) {
+        log("server exited with " + (signal || code));
+        shutdown(1);
+    });
+    server.stdout.on("data", readFrames(onServerMessage));
+}
+
+function onClientRequest(client, line) {
+    if (client.socket.destroyed) {
+        // the rest of a chunk that ended with 'exit'
+        return;
+    }
+    var request;
+    try {
+        request = JSON.parse(line);
+    } catch (e) {
+        log("dropping malformed request: " + line.slice(0, 100));
+        return;
+    }
+    var file = request.arguments && request.arguments.file;
+    switch (request.command) {
+        case "exit":
+            // the server outlives its clients and is stopped by the idle
+            // timeout; only the connection of this client ends
+            client.socket.destroy();
+            return;
+        case "open":
+            client.openFiles.add(file);
+            if (isOpenElsewhere(client, file)) {
+                // the server already has the file, maybe with unsaved text of
+                // the client that opened it first; opening it again would
+                // replace that text with the file on disk
+                return;
+            }
+            break;
+        case "close":
+            client.openFiles.delete(file);
+            if (isOpenElsewhere(client, file)) {
+                return;
+            }
+            break;
+    }
+    request.seq = request.seq * MAX_CLIENTS + client.slot;
+    writeToServer(request);
+}
+
+function onClientGone(client) {
+    clients[client.slot] = null;
+    client.openFiles.forEach(function (file) {
+        if (!isOpenElsewhere(client, file)) {
+            writeToServer({ command: "close", seq: nextBrokerSeq++ * MAX_CLIENTS, type: "request", arguments: { file: file } });
+        }
+    });
+    log("client " + client.slot + " disconnected");
+    scheduleIdleExit();
+}
+
+function scheduleIdleExit() {
+    if (clients.some(Boolean) || idleTimer) {
+        return;
+    }
+    idleTimer = setTimeout(function () {
+        log("no client for " + idleSeconds + "s; exiting");
+        shutdown(0);
+    }, idleSeconds * 1000);
+}
+
+function onConnection(socket) {
+    var slot = 1;
+    while (slot < MAX_CLIENTS && clients[slot]) {
+        slot++;
+    }
+    if (slot === MAX_CLIENTS) {
+        log("too many clients");
+        socket.destroy();
+        return;
+    }
+    if (idleTimer) {
+        clearTimeout(idleTimer);
+        idleTimer = null;
+    }
+    var client = { slot: slot, socket: socket, openFiles: new Set() };
+    clients[slot] = client;
+    log("client " + slot + " connected");
+
+    // pieces of the incomplete line, joined once its end arrives
+    var pending = [];
+    socket.setEncoding("utf8");
+    socket.on("data", function (data) {
+        var start = 0;
+        var newline;
+        while ((newline = data.indexOf("\n", start)) >= 0) {
+            pending.push(data.slice(start, newline));
+            var line = pending.join("");
+            pending = [];
+            if (line.trim()) {
+                onClientRequest(client, line);
+            }
+            start = newline + 1;
+        }
+        if (start < data.length) {
+            pending.push(data.slice(start));
+        }
+    });
+    socket.on("error", function (e) {
+        log("client " + slot + ": " + e.message);
+    });
+    socket.on("close", function () {
+        onClientGone(client);
+    });
+}
+
+function listen() {
+    var listener = net.createServer(onConnection);
+    listener.on("error", function (e) {
+        if (e.code !== "EADDRINUSE") {
+            log("can not listen on " + socketPath + ": " + e.message);
+            process.exit(1);
+        }
+        // a live broker owns the socket if it accepts connections; otherwise it is stale
+        var probe = net.connect(socketPath);
+        probe.on("connect", function () {
+            log("another broker is listening on " + socketPath);
+            probe.destroy();
+            process.exit(0);
+        });
+        probe.on("error", function () {
+            fs.unlinkSync(socketPath);
+            listen();
+        });
+    });
+    listener.listen(socketPath, function () {
+        fs.writeFileSync(socketPath + ".pid", String(process.pid));
+        startServer();
+        log("listening on " + socketPath);
+        scheduleIdleExit();
+    });
+}
+
+process.on("SIGTERM", function () {
+    shutdown(0);
+});
+listen();
@@ -31,11 +31,22 @@ class FileInfo:
         self.change_count_when_last_err_req_sent = -1
         self.last_modify_change_count = cc
         self.modify_count = 0
+        # the text the server got with the last reload_buffer, the changes sent
+        # since, and the version of the file on the server that they add up to;
+        # see send_changes_since_sync
+        self.synced_text = None
+        self.synced_version = None
+        self.unsynced_changes = []
 
 
 _file_map = dict()
 _file_map_on_worker = dict()
 
+# changes sent since the last sync above which the synced text is dropped
+MAX_UNSYNCED_CHANGES = 200
+# edits of a diff above which the buffer is sent whole instead
+MAX_DIFF_EDITS = 50
+
 
 def get_info(view, open_if_not_cached=True):
     """Find the file info on the server that matches the given view"""
@@ -70,7 +81,7 @@ def get_info(view, open_if_not_cached=True):
                 # on the worker, which could be caused by starting the worker
                 # for the first time
                 if not IS_ST2:
-                    if get_panel_manager().is_panel_active("errorlist"):
+                    if cli.worker_client.started():
                         info_on_worker = _file_map_on_worker.get(file_name)
                         if not info_on_worker:
                             _file_map_on_worker[file_name] = info
@@ -157,6 +168,85 @@ def open_file(view):
     """Open the file on the server"""
     cli.service.open(view.file_name())
 
+def start_worker():
+    """Start the worker process; views are opened on it as get_info sees them"""
+    _file_map_on_worker.clear()
+    cli.service.forget_worker_files()
+    cli.worker_client.start()
+
+def stop_worker():
+    """Stop the worker process; it is started again with start_worker"""
+    cli.worker_client.stop()
+    _file_map_on_worker.clear()
+
+def sync_worker_files():
+    """
+    Send the worker the buffers whose latest content it hasn't seen, so that
+    requests queued after this never see stale text on the worker
+    """
+    infos = dict((file_name, info) for (file_name, info) in _file_map.items()
+                 if info.is_open and info.view is not None and info.view.buffer_id() != 0)
+    for file_name in cli.service.stale_files_on_worker(list(infos)):
+        view = infos[file_name].view
+        if file_name not in _file_map_on_worker:
+            _file_map_on_worker[file_name] = infos[file_name]
+            open_file_on_worker(view)
+        reload_buffer_on_worker(view)
+
+def reopen_files():
+    """Open every file the server knew about again, with the content of its buffer"""
+    for info in list(_file_map.values()):
+        view = info.view
+        if not info.is_open or view is None or view.buffer_id() == 0:
+            continue
+        open_file(view)
+        # the new server doesn't know the format options of the file either
+        view.settings().erase('typescript_plugin_format_options')
+        reconfig_file(view)
+        reload_buffer(view, info.client_info)
+
+def reopen_files_on_syntax_server():
+    """Open every file the server knows about on the syntax server again, after it was restarted"""
+    host_info = "Sublime Text version " + str(sublime.version())
+    for info in list(_file_map.values()):
+        view = info.view
+        if not info.is_open or view is None or view.buffer_id() == 0:
+            continue
+        cli.service.open_on_syntax_server(view.file_name())
+        format_options = view.settings().get('typescript_plugin_format_options')
+        if format_options:
+            cli.service.configure_on_syntax_server(host_info, view.file_name(), format_options)
+        reload_buffer_on_syntax_server(view)
+
+def close_background_files():
+    """
+    Close the files not shown in any window, so the server can release their
+    projects; they are opened again by get_info once they are activated.
+    Returns the names of the closed files
+    """
+    shown = set()
+    for window in sublime.windows():
+        for group in range(window.num_groups()):
+            view = window.active_view_in_group(group)
+            if view is not None:
+                shown.add(view.id())
+    closed = []
+    for file_name, info in list(_file_map.items()):
+        if info.is_open and info.view is not None and info.view.id() not in shown:
+            cli.service.close(file_name)
+            del _file_map[file_name]
+            _file_map_on_worker.pop(file_name, None)
+            closed.append(file_name)
+    return closed
+
+def restart_worker():
+    """Start the worker again, and open the files the server knows about on it"""
+    cli.worker_client.stop()
+    start_worker()
+    for info in list(_file_map.values()):
+        if info.is_open and info.view is not None and info.view.buffer_id() != 0:
+            get_info(info.view)
+
 def open_file_on_worker(view):
     """Open the file on the worker process"""
     cli.service.open_on_worker(view.file_name())
@@ -231,27 +321,86 @@ def recv_reload_response(reload_resp):
 
 
 def reload_buffer(view, client_info=None):
-    """Write the buffer of view to a temporary file and have the server reload it"""
+    """
+    Bring the server up to date with the buffer of view: send the changes since
+    the text synced last, or write the buffer to a temporary file and have the
+    server reload it
+    """
     if not view.is_loading():
-        tmpfile_name = get_tempfile_name()
-        tmpfile = codecs.open(tmpfile_name, "w", "utf-8")
         text = view.substr(sublime.Region(0, view.size()))
-        tmpfile.write(text)
-        tmpfile.flush()
+        synced = send_changes_since_sync(view, text)
+        # the changes are only sent to the worker and the syntax server while
+        # they have the content of the main server; otherwise they reload it
+        reload_mirrors = synced and not cli.service.mirrors_share_content(view.file_name())
+        if not synced or reload_mirrors:
+            tmpfile_name = get_tempfile_name()
+            tmpfile = codecs.open(tmpfile_name, "w", "utf-8")
+            tmpfile.write(text)
+            tmpfile.flush()
 
         if not client_info:
             client_info = cli.get_or_add_file(view.file_name())
 
         if not IS_ST2:
-            cli.service.reload_async(view.file_name(), tmpfile_name, recv_reload_response)
+            if not synced:
+                cli.service.reload_async(view.file_name(), tmpfile_name, recv_reload_response)
+            elif reload_mirrors:
+                cli.service.reload_async_on_mirrors(view.file_name(), tmpfile_name, recv_reload_response)
             client_info.change_count = view.change_count()
         else:
-            # Sublime 2 doesn't have good support for multi threading
-            reload_response = cli.service.reload(view.file_name(), tmpfile_name)
-            recv_reload_response(reload_response)
+            if not synced:
+                # Sublime 2 doesn't have good support for multi threading
+                reload_response = cli.service.reload(view.file_name(), tmpfile_name)
+                recv_reload_response(reload_response)
+            elif reload_mirrors:
+                reload_response = cli.service.reload_on_mirrors(view.file_name(), tmpfile_name)
+                if reload_response:
+                    recv_reload_response(reload_response)
             info = get_info(view)
             client_info.change_count = info.modify_count
         client_info.pending_changes = False
+        set_synced_text(view.file_name(), text)
+
+def set_synced_text(file_name, text):
+    """Note that the server has <text> as the content of <file_name>"""
+    info = _file_map.get(file_name)
+    if info:
+        info.synced_text = text
+        info.synced_version = cli.service.get_file_version(file_name)
+        info.unsynced_changes = []
+
+def forget_synced_text(file_name):
+    """Note that the content of <file_name> on the server is unknown, e.g. after it was opened again"""
+    info = _file_map.get(file_name)
+    if info:
+        info.synced_text = None
+        info.unsynced_changes = []
+
+def send_changes_since_sync(view, text):
+    """
+    Send the main server the edits from its content of the file to <text>,
+    computed from the text synced last and the changes sent since, and the
+    worker and the syntax server too if they have the same content. Returns
+    False if that content isn't known, or the edits would be about as large as
+    the buffer
+    """
+    file_name = view.file_name()
+    info = _file_map.get(file_name)
+    if not info or info.synced_text is None:
+        return False
+    if cli.service.get_file_version(file_name) != info.synced_version + len(info.unsynced_changes):
+        # the server got the file some other way since, e.g. opened again
+        return False
+    server_text = apply_changes_to_text(info.synced_text, info.unsynced_changes)
+    if server_text is None:
+        return False
+    edits = diff_text_edits(server_text, text)
+    if len(edits) > MAX_DIFF_EDITS or sum(len(insert_string) for (_, _, insert_string) in edits) > len(text) // 2:
+        return False
+    mirror = cli.service.mirrors_share_content(file_name)
+    for location, end_location, insert_string in edits:
+        cli.service.change(file_name, location, end_location, insert_string, mirror=mirror)
+    return True
 
 def reload_buffer_on_worker(view):
     """Reload the buffer content on the worker process
@@ -270,6 +419,20 @@ def reload_buffer_on_worker(view):
             reload_response = cli.service.reload_on_worker(view.file_name(), tmpfile_name)
             recv_reload_response(reload_response)
 
+def reload_buffer_on_syntax_server(view):
+    """Reload the buffer content on the syntax server only"""
+    if not view.is_loading():
+        tmpfile_name = get_tempfile_name()
+        tmpfile = codecs.open(tmpfile_name, "w", "utf-8")
+        text = view.substr(sublime.Region(0, view.size()))
+        tmpfile.write(text)
+        tmpfile.flush()
+        if not IS_ST2:
+            cli.service.reload_async_on_syntax_server(view.file_name(), tmpfile_name, recv_reload_response)
+        else:
+            reload_response = cli.service.reload_on_syntax_server(view.file_name(), tmpfile_name)
+            recv_reload_response(reload_response)
+
 def reload_required(view):
     client_info = cli.get_or_add_file(view.file_name())
     return client_info.pending_changes or client_info.change_count < change_count(view)
@@ -294,10 +457,15 @@ def send_replace_changes_for_regions(view, regions, insert_string):
     """
     if not is_typescript(view):
         return
+    info = _file_map.get(view.file_name())
     for region in regions:
         location = get_location_from_position(view, region.begin())
         end_location = get_location_from_position(view, region.end())
         cli.service.change(view.file_name(), location, end_location, insert_string)
+        if info and info.synced_text is not None:
+            info.unsynced_changes.append((location, end_location, insert_string))
+            if len(info.unsynced_changes) > MAX_UNSYNCED_CHANGES:
+                forget_synced_text(view.file_name())
 
 
 def apply_edit(text, view, start_line, start_offset, end_line, end_offset, new_text=""):
@@ -332,23 +500,48 @@ def insert_text(view, edit, loc, text):
     check_update_view(view)
 
 
-def format_range(text, view, begin, end):
-    """Format a range of locations in the view"""
+def apply_code_edits_if_current(view, code_edits, request_change_count):
+    """
+    Apply edits that tsserver computed for the buffer as it was when
+    <request_change_count> was taken; see TypescriptApplyCodeEdits
+    """
+    view.run_command("typescript_apply_code_edits", {
+        "code_edits": code_edits,
+        "request_change_count": request_change_count
+    })
+
+
+def format_ranges(view, ranges):
+    """
+    Format a list of (begin, end) location ranges in the view. The edits for
+    all ranges are applied together once the last response has arrived.
+    """
     if not is_typescript(view):
         print("To run this command, please first assign a file name to the view")
         return
     check_update_view(view)
-    format_resp = cli.service.format(
-        view.file_name(),
-        get_location_from_position(view, begin),
-        get_location_from_position(view, end)
-    )
-    if format_resp["success"]:
-        code_edits = format_resp["body"]
-        apply_formatting_changes(text, view, code_edits)
-    if not IS_ST2:
-        client_info = cli.get_or_add_file(view.file_name())
-        client_info.change_count = view.change_count()
+    request_change_count = change_count(view)
+    locations = [(get_location_from_position(view, begin), get_location_from_position(view, end)) for (begin, end) in ranges]
+    responses = []
+
+    def on_completed(format_resp):
+        responses.append(format_resp)
+        if len(responses) < len(locations):
+            return
+        code_edits = []
+        for resp in responses:
+            if resp["success"]:
+                code_edits.extend(resp["body"])
+        code_edits.sort(key=lambda code_edit: (code_edit["start"]["line"], code_edit["start"]["offset"]))
+        apply_code_edits_if_current(view, code_edits, request_change_count)
+
+    for (begin_location, end_location) in locations:
+        cli.service.format_async(view.file_name(), begin_location, end_location, on_completed)
+
+
+def format_range(view, begin, end):
+    """Format a range of locations in the view"""
+    format_ranges(view, [(begin, end)])
 
 
 def get_ref_view(create=True):
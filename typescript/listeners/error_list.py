@@ -1,4 +1,6 @@
-﻿from ..libs.view_helpers import *
+﻿import time
+
+from ..libs.view_helpers import *
 from ..libs.text_helpers import *
 from ..libs import get_panel_manager, log
 from .event_hub import EventHub
@@ -6,6 +8,12 @@ from .event_hub import EventHub
 
 class ProjectErrorListener:
 
+    # milliseconds to wait before starting the warm standby worker, and
+    # between checks whether the main server has become idle
+    WARM_WORKER_DELAY = 3000
+    # milliseconds between checks whether the worker has been idle long enough to stop it
+    WORKER_IDLE_CHECK_INTERVAL = 60000
+
     def __init__(self):
         self.just_changed_focus = False
         self.modified = False
@@ -13,6 +21,15 @@ class ProjectErrorListener:
         self.pending_update_error_list_panel = 0
         self.errors = dict()
         self.event_handler_added = False
+        self.warm_worker_scheduled = False
+        # set while the warm standby worker loads the project; a worker started
+        # by the error list command fills the list as soon as it can instead
+        self.warm_worker_loading = False
+        # the worker is stopped once the error list panel has been inactive for
+        # 'tsserver_worker_idle_minutes'; see check_worker_idle
+        self.worker_idle_check_scheduled = False
+        self.worker_idle_since = None
+        self.worker_hibernated = False
 
     def is_error_list_panel_active(self):
         return get_panel_manager().is_panel_active("errorlist")
@@ -22,6 +39,73 @@ class ProjectErrorListener:
         if self.is_error_list_panel_active():
             self.set_request_error_timer(50)
             self.just_changed_focus = True
+        self.schedule_warm_worker()
+        if not self.worker_idle_check_scheduled:
+            self.worker_idle_check_scheduled = True
+            sublime.set_timeout(self.check_worker_idle, ProjectErrorListener.WORKER_IDLE_CHECK_INTERVAL)
+
+    def schedule_warm_worker(self):
+        settings = sublime.load_settings('Preferences.sublime-settings')
+        if IS_ST2 or self.warm_worker_scheduled or self.worker_hibernated or cli.worker_client.started() or not settings.get("tsserver_warm_worker", False):
+            return
+        self.warm_worker_scheduled = True
+        sublime.set_timeout(self.start_warm_worker, ProjectErrorListener.WARM_WORKER_DELAY)
+
+    def start_warm_worker(self):
+        """Start the worker in the background once the main server has nothing to do"""
+        if cli.worker_client.started():
+            self.warm_worker_scheduled = False
+            return
+        if not cli.node_client.is_idle():
+            sublime.set_timeout(self.start_warm_worker, ProjectErrorListener.WARM_WORKER_DELAY)
+            return
+        self.warm_worker_scheduled = False
+        log.debug("starting warm standby worker")
+        self.warm_worker_loading = True
+        start_worker()
+        views = [view for window in sublime.windows() for view in window.views() if view.file_name() is not None]
+        self.open_views_on_worker(views)
+
+    def open_views_on_worker(self, views, first_file=None):
+        """
+        Open <views> on the worker one per UI tick, then load the project of the
+        first TypeScript file so the worker is ready when the error list is opened
+        """
+        if not cli.worker_client.started():
+            return
+        if views:
+            view = views[0]
+            if get_info(view) and first_file is None:
+                first_file = view.file_name()
+            sublime.set_timeout(lambda: self.open_views_on_worker(views[1:], first_file), 0)
+        elif first_file:
+            cli.service.project_info_on_worker(first_file, lambda response: sublime.set_timeout(self.on_worker_ready, 0))
+        else:
+            self.on_worker_ready()
+
+    def on_worker_ready(self):
+        log.debug("warm standby worker is ready")
+        self.warm_worker_loading = False
+        sublime.status_message("TypeScript: project error list is ready")
+
+    def is_warm_worker_loading(self):
+        return self.warm_worker_loading and cli.worker_client.started()
+
+    def check_worker_idle(self):
+        """Stop the worker, and the copy of the program it holds, once the error list has been unused for a while"""
+        sublime.set_timeout(self.check_worker_idle, ProjectErrorListener.WORKER_IDLE_CHECK_INTERVAL)
+        idle_minutes = sublime.load_settings('Preferences.sublime-settings').get("tsserver_worker_idle_minutes", 30)
+        if not idle_minutes or not cli.worker_client.started() or self.is_error_list_panel_active():
+            self.worker_idle_since = None
+        elif self.worker_idle_since is None:
+            self.worker_idle_since = time.time()
+        elif time.time() - self.worker_idle_since >= idle_minutes * 60:
+            log.debug("stopping the worker after {0} idle minutes".format(idle_minutes))
+            self.worker_idle_since = None
+            self.warm_worker_loading = False
+            # the warm standby worker isn't started again until the error list is opened
+            self.worker_hibernated = True
+            stop_worker()
 
     def post_on_modified(self, view):
         if not is_special_view(view) and self.is_error_list_panel_active():
@@ -118,6 +202,7 @@ class ProjectErrorListener:
         ):
             self.just_changed_focus = False
             self.modified = False
+            sync_worker_files()
             cli.service.request_get_err_for_project(error_delay, view.file_name())
 
 listener = ProjectErrorListener()
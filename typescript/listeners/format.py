@@ -7,6 +7,7 @@ class FormatEventListener:
     def on_post_text_command_with_info(self, view, command_name, args, info):
         if command_name in \
             ["typescript_format_on_key",
+             "typescript_apply_code_edits",
              "typescript_format_document",
              "typescript_format_selection",
              "typescript_format_line",
@@ -146,7 +146,9 @@ class TypeScriptEventListener(sublime_plugin.EventListener):
         log.debug("on_window_command")
 
         if command_name == "hide_panel" and cli.worker_client.started():
-            cli.worker_client.stop()
+            # a warm standby worker is kept for the next time the error list is opened
+            if not sublime.load_settings('Preferences.sublime-settings').get("tsserver_warm_worker", False):
+                stop_worker()
 
         elif command_name == "exit":
             cli.service.exit()
@@ -222,6 +224,7 @@ class TypeScriptEventListener(sublime_plugin.EventListener):
             ["commit_completion",
              "insert_best_completion",
              "typescript_format_on_key",
+             "typescript_apply_code_edits",
              "typescript_format_document",
              "typescript_format_selection",
              "typescript_format_line",
@@ -245,6 +248,7 @@ class TypeScriptEventListener(sublime_plugin.EventListener):
         info = get_info(view, open_if_not_cached=False)
         if info:
             info.is_open = False
+            forget_synced_text(file_name)
         if view.is_scratch() and view.name() == "Find References":
             cli.dispose_ref_info()
         else: